@@ -4,7 +4,7 @@ from users.models import Account, CustomUser
 import uuid
 from django.core.exceptions import ValidationError
 from utils.file_handlers import employee_documents_path
-from utils.storage_backends import MediaStorage
+from utils.storage_backends import media_storage
 
 
 class Employee(models.Model):
@@ -26,7 +26,7 @@ class Employee(models.Model):
     # Updated to use S3 storage
     contract_pdf = models.FileField(
         upload_to=employee_documents_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True, 
         blank=True,
         help_text="Employee contract document"
@@ -35,7 +35,7 @@ class Employee(models.Model):
     # Additional file fields that might be useful
     profile_picture = models.ImageField(
         upload_to=employee_documents_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True,
         blank=True,
         help_text="Employee profile picture"
@@ -43,7 +43,7 @@ class Employee(models.Model):
     
     id_copy = models.FileField(
         upload_to=employee_documents_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True,
         blank=True,
         help_text="Copy of employee ID document"
@@ -53,6 +53,7 @@ class Employee(models.Model):
     is_archived = models.BooleanField(default=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='employees', null=True, blank=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
@@ -122,7 +123,7 @@ class EmployeeDocument(models.Model):
     document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPES)
     document = models.FileField(
         upload_to=employee_documents_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True, 
         blank=True
     )
@@ -7,6 +7,7 @@ import logging
 from .models import Employee, EmployeeHistory, EmployeeVirtualTransaction, EmployeeDocument
 from payments.models import Payment
 from payments.serializers import PaymentSerializer, SimplePaymentSerializer
+from utils.images import ThumbnailListSerializer, thumbnail_url
 
 logger = logging.getLogger(__name__)
 
@@ -57,11 +58,14 @@ class EmployeeSerializer(serializers.ModelSerializer):
     # File URL fields
     contract_pdf_url = serializers.SerializerMethodField()
     profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_thumbnail_url = serializers.SerializerMethodField()
     id_copy_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Employee
         exclude = ['account', 'created_by']
+        list_serializer_class = ThumbnailListSerializer
+        thumbnail_fields = ['profile_picture']
 
     def get_contract_pdf_url(self, obj):
         """Generate URL for contract PDF"""
@@ -71,6 +75,10 @@ class EmployeeSerializer(serializers.ModelSerializer):
         """Generate URL for profile picture"""
         return self._get_file_url(obj.profile_picture)
     
+    def get_profile_picture_thumbnail_url(self, obj):
+        """Generate URL for the profile picture thumbnail"""
+        return thumbnail_url(obj.profile_picture, self.context.get('stored_thumbnails'))
+    
     def get_id_copy_url(self, obj):
         """Generate URL for ID copy"""
         return self._get_file_url(obj.id_copy)
@@ -12,8 +12,10 @@ from .serializers import (
     EmployeeVirtualTransactionSerializer,
     EmployeeDocumentSerializer
 )
-from logs.utils import log_activity
-from utils.s3_utils import S3FileManager
+from django.utils import timezone
+
+from logs.utils import log_activity, serializer_changes
+from utils.conditional import ConditionalGetMixin
 from payments.models import Payment
 from payments.serializers import PaymentSerializer
 
@@ -21,7 +23,20 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class EmployeeListCreateView(generics.ListCreateAPIView):
+class EmployeeConditionalMixin(ConditionalGetMixin):
+    """Employee payloads embed payments, history and this month's totals"""
+    etag_scopes = ['employee_records']
+
+    def get_etag_dependencies(self, detail=False):
+        dependencies = super().get_etag_dependencies(detail)
+        payments = Payment.objects.filter(account=self.request.user.account, recipient_employee__isnull=False)
+        return dependencies + [(payments, 'updated_at')]
+
+    def get_etag_extra(self):
+        return [timezone.localdate().strftime('%Y-%m')]
+
+
+class EmployeeListCreateView(EmployeeConditionalMixin, generics.ListCreateAPIView):
     serializer_class = EmployeeSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['employee_type', 'is_archived']
@@ -61,7 +76,7 @@ class EmployeeListCreateView(generics.ListCreateAPIView):
                 if file_obj:
                     try:
                         setattr(instance, field_name, file_obj)
-                        instance.save(update_fields=[field_name])
+                        instance.save(update_fields=[field_name, 'updated_at'])
                     except Exception as file_error:
                         logger.error(f"File upload failed for employee {instance.id}, field {field_name}: {file_error}")
             
@@ -100,7 +115,7 @@ class EmployeePaymentCreateView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class EmployeeRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
+class EmployeeRetrieveUpdateView(EmployeeConditionalMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = EmployeeSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
@@ -116,13 +131,15 @@ class EmployeeRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         return context
 
     def perform_update(self, serializer):
+        changes = serializer_changes(serializer)
         instance = serializer.save(account=self.request.user.account)
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
             note=f"تم تعديل بيانات الموظف {instance.first_name} {instance.last_name}",
             related_model='Employee',
-            related_id=str(instance.id)
+            related_id=str(instance.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -244,11 +261,7 @@ def delete_employee_document(request, document_id):
             employee__account=request.user.account
         )
         
-        # Delete from S3
-        if document.document:
-            s3_manager = S3FileManager()
-            s3_manager.delete_file(document.document.name)
-        
+        # The file is queued for deletion from S3 by the post_delete signal
         employee_name = f"{document.employee.first_name} {document.employee.last_name}"
         doc_type = document.get_document_type_display()
         
@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import StockMovement
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'item', 'movement_type', 'quantity', 'balance_after', 'student', 'account')
+    list_filter = ('movement_type',)
@@ -0,0 +1,20 @@
+import django_filters
+from django.db.models import F
+
+from .models import StoreItem
+
+
+class StoreItemFilter(django_filters.FilterSet):
+    """e.g. ?low_stock=true, ?count__lte=5, ?name=قميص"""
+    name = django_filters.CharFilter(lookup_expr='icontains')
+    count__lte = django_filters.NumberFilter(field_name='count', lookup_expr='lte')
+    count__gte = django_filters.NumberFilter(field_name='count', lookup_expr='gte')
+    low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+
+    class Meta:
+        model = StoreItem
+        fields = ['name']
+
+    def filter_low_stock(self, queryset, name, value):
+        low = queryset.filter(count__lte=F('low_stock_threshold'))
+        return low if value else queryset.exclude(pk__in=low.values('pk'))
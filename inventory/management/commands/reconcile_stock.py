@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import StoreItem
+from inventory.services import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = "Recompute store item counts from the stock movement ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', default=None, help="Only reconcile this account's items")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without changing anything")
+
+    def handle(self, *args, **options):
+        items = StoreItem.objects.all()
+        if options['account']:
+            items = items.filter(account_id=options['account'])
+
+        drifted, seeded = reconcile_stock(items, dry_run=options['dry_run'])
+        for item, total in drifted:
+            self.stdout.write(f"{item.account_id} {item.name}: count {item.count} -> ledger {total}"
+                              if options['dry_run'] else f"{item.account_id} {item.name}: set to {item.count}")
+        verb = "would be" if options['dry_run'] else "were"
+        self.stdout.write(f"{len(drifted)} items {verb} corrected, {len(seeded)} items {verb} given an opening balance")
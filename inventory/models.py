@@ -1,12 +1,64 @@
 # inventory/models.py
 from django.db import models
-from users.models import Account  # if you're using multi-account
+from users.models import Account, CustomUser  # if you're using multi-account
 
 class StoreItem(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
+    # Only changed through inventory.services, which records a StockMovement for every change
     count = models.PositiveIntegerField(default=0)
+    # The item counts as low on stock once count <= low_stock_threshold
+    low_stock_threshold = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'count'], name='storeitem_acct_count'),
+        ]
+
     def __str__(self):
         return self.name
+
+    @property
+    def is_low_stock(self):
+        return self.count <= self.low_stock_threshold
+
+
+class StockMovement(models.Model):
+    """One change to a StoreItem's count. Summing the ledger reproduces the count."""
+    TYPE_IN = 'in'
+    TYPE_OUT = 'out'
+    TYPE_ADJUST = 'adjust'
+    TYPE_CHOICES = (
+        (TYPE_IN, 'In'),
+        (TYPE_OUT, 'Out'),
+        (TYPE_ADJUST, 'Adjust'),
+    )
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='stock_movements')
+    item = models.ForeignKey(StoreItem, on_delete=models.CASCADE, related_name='movements')
+    movement_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    # Positive for in/out; signed for adjustments
+    quantity = models.IntegerField()
+    balance_after = models.PositiveIntegerField()
+    reason = models.CharField(max_length=255, blank=True, default='')
+    student = models.ForeignKey(
+        'students.Student', on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements'
+    )
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['account', 'item', 'created_at'], name='stockmove_acct_item_time'),
+            models.Index(fields=['account', 'movement_type', 'created_at'], name='stockmove_acct_type_time'),
+            models.Index(fields=['account', 'student'], name='stockmove_acct_student'),
+        ]
+
+    @property
+    def delta(self):
+        return -self.quantity if self.movement_type == self.TYPE_OUT else self.quantity
+
+    def __str__(self):
+        return f"{self.item} {self.movement_type} {self.quantity}"
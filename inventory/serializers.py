@@ -1,9 +1,94 @@
 # inventory/serializers.py
 from rest_framework import serializers
-from .models import StoreItem
+from students.models import Student
+from .models import StoreItem, StockMovement
 
 class StoreItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = StoreItem
         fields = '__all__'
         read_only_fields = ['account']
+
+    def update(self, instance, validated_data):
+        # count only changes through inventory.services: saving the value read with
+        # the instance would undo stock movements committed since (StoreItemViewSet
+        # records a client-sent count as a stocktake instead)
+        validated_data.pop('count', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+    student_name = serializers.SerializerMethodField()
+    created_by = serializers.StringRelatedField()
+
+    class Meta:
+        model = StockMovement
+        fields = [
+            'id', 'item', 'item_name', 'movement_type', 'quantity', 'balance_after', 'reason',
+            'student', 'student_name', 'created_by', 'created_at'
+        ]
+        read_only_fields = fields
+
+    def get_student_name(self, obj):
+        if obj.student:
+            return f"{obj.student.first_name} {obj.student.second_name}"
+        return None
+
+
+def _validate_student(serializer, value):
+    request = serializer.context.get('request')
+    if value and request and value.account_id != request.user.account_id:
+        raise serializers.ValidationError("الطالب غير موجود")
+    return value
+
+
+class StockMovementCreateSerializer(serializers.Serializer):
+    """A single in/out/adjust movement for one item; adjustments may be negative"""
+    movement_type = serializers.ChoiceField(choices=StockMovement.TYPE_CHOICES)
+    quantity = serializers.IntegerField()
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    student = serializers.PrimaryKeyRelatedField(queryset=Student.objects.all(), required=False, allow_null=True)
+
+    def validate_student(self, value):
+        return _validate_student(self, value)
+
+    def validate(self, data):
+        if data['movement_type'] == StockMovement.TYPE_ADJUST:
+            if data['quantity'] == 0:
+                raise serializers.ValidationError({'quantity': "الكمية يجب ألا تكون صفراً"})
+        elif data['quantity'] <= 0:
+            raise serializers.ValidationError({'quantity': "الكمية يجب أن تكون أكبر من صفر"})
+        return data
+
+
+class StockIssueLineSerializer(serializers.Serializer):
+    item = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class StockIssueSerializer(serializers.Serializer):
+    """Several items issued together; item ownership is checked with one query"""
+    MAX_LINES = 200
+
+    items = StockIssueLineSerializer(many=True, allow_empty=False, max_length=MAX_LINES)
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    student = serializers.PrimaryKeyRelatedField(queryset=Student.objects.all(), required=False, allow_null=True)
+
+    def validate_student(self, value):
+        return _validate_student(self, value)
+
+    def validate_items(self, lines):
+        account = self.context['request'].user.account
+        item_ids = [line['item'] for line in lines]
+        if len(set(item_ids)) != len(item_ids):
+            raise serializers.ValidationError("لا يمكن تكرار نفس الصنف")
+
+        found = set(StoreItem.objects.filter(account=account, id__in=item_ids).values_list('id', flat=True))
+        errors = [{} if line['item'] in found else {'item': "الصنف غير موجود"} for line in lines]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return lines
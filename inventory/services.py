@@ -0,0 +1,232 @@
+# inventory/services.py
+"""
+Stock changes for StoreItem. Counts are only changed with single UPDATE
+statements (F() increments, or conditional decrements that refuse to go
+below zero), so concurrent issues never lose an update, and every change is
+written to the StockMovement ledger.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DateField, F, IntegerField, Q, Sum, When
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from utils.cache import bump_data_version, get_data_version
+from .models import StoreItem, StockMovement
+
+USAGE_PERIODS = {'week': TruncWeek, 'month': TruncMonth}
+DASHBOARD_WINDOW_DAYS = 30
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+
+
+class InsufficientStock(Exception):
+    def __init__(self, item_id, requested):
+        self.item_id = item_id
+        self.requested = requested
+        super().__init__(f"Not enough stock of item {item_id} for {requested}")
+
+
+def _apply_delta(account, item_id, delta):
+    """Change the item's count by delta in one statement; return the new count"""
+    items = StoreItem.objects.filter(account=account, pk=item_id)
+    if delta < 0:
+        # Conditional update: only succeeds while enough stock is left
+        items = items.filter(count__gte=-delta)
+    if not items.update(count=F('count') + delta):
+        if not StoreItem.objects.filter(account=account, pk=item_id).exists():
+            raise StoreItem.DoesNotExist
+        raise InsufficientStock(item_id, -delta)
+    return StoreItem.objects.values_list('count', flat=True).get(pk=item_id)
+
+
+@transaction.atomic
+def record_movement(account, item_id, movement_type, quantity, user=None, reason='', student=None):
+    """Apply one movement to an item and write it to the ledger"""
+    delta = -quantity if movement_type == StockMovement.TYPE_OUT else quantity
+    balance = _apply_delta(account, item_id, delta)
+    return StockMovement.objects.create(
+        account=account,
+        item_id=item_id,
+        movement_type=movement_type,
+        quantity=quantity,
+        balance_after=balance,
+        reason=reason,
+        student=student,
+        created_by=user,
+    )
+
+
+@transaction.atomic
+def issue_items(account, lines, user=None, reason='', student=None):
+    """
+    Issue several items at once, e.g. a uniform set for a student.
+    lines: [{'item': id, 'quantity': n}, ...]. All or nothing: if one item
+    is short, InsufficientStock is raised and no count changes.
+    """
+    movements = []
+    # A fixed order keeps two concurrent batches from deadlocking on each other's rows
+    for line in sorted(lines, key=lambda line: line['item']):
+        movements.append(record_movement(
+            account, line['item'], StockMovement.TYPE_OUT, line['quantity'],
+            user=user, reason=reason, student=student
+        ))
+    return movements
+
+
+@transaction.atomic
+def set_stock_count(item, new_count, user=None, reason=''):
+    """Stocktake: set the count to what was physically counted, recording the difference as an adjustment"""
+    current = StoreItem.objects.select_for_update().values_list('count', flat=True).get(pk=item.pk)
+    if new_count == current:
+        return None
+    return record_movement(
+        item.account, item.pk, StockMovement.TYPE_ADJUST, new_count - current, user=user, reason=reason
+    )
+
+
+def ledger_counts(items):
+    """{item_id: count according to the ledger} for items that have movements"""
+    signed_quantity = Case(
+        When(movement_type=StockMovement.TYPE_OUT, then=-F('quantity')),
+        default=F('quantity'),
+        output_field=IntegerField(),
+    )
+    rows = (
+        StockMovement.objects.filter(item__in=items)
+        .values('item_id')
+        .annotate(total=Sum(signed_quantity))
+        .order_by()
+    )
+    return {row['item_id']: row['total'] for row in rows}
+
+
+def reconcile_stock(items, user=None, dry_run=False):
+    """
+    Recompute counts of the items queryset from the ledger and fix drifted
+    items with one bulk_update. Items with no movements yet (from before the
+    ledger) get an opening 'in' movement for their current count instead.
+    Returns (drifted [(item, ledger count)], seeded [item]).
+    """
+    with transaction.atomic():
+        # Lock the rows so issues can't run between reading the ledger and writing counts
+        items = list(items.select_for_update().order_by('pk'))
+        totals = ledger_counts(items)
+        drifted, seeded = [], []
+        for item in items:
+            if item.pk not in totals:
+                seeded.append(item)
+            elif totals[item.pk] != item.count:
+                drifted.append((item, totals[item.pk]))
+
+        if dry_run:
+            return drifted, seeded
+
+        for item, total in drifted:
+            item.count = max(total, 0)
+        StoreItem.objects.bulk_update([item for item, _ in drifted], ['count'], batch_size=500)
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                account_id=item.account_id, item=item, movement_type=StockMovement.TYPE_IN,
+                quantity=item.count, balance_after=item.count, reason='رصيد افتتاحي', created_by=user
+            )
+            for item in seeded if item.count
+        ], batch_size=500)
+    # bulk_update/bulk_create send no signals, so bump the cached inventory data by hand
+    for account_id in {item.account_id for item, _ in drifted} | {item.account_id for item in seeded}:
+        bump_data_version(account_id, 'inventory')
+    return drifted, seeded
+
+
+def _period_count(period, start, end):
+    """Number of weeks/months from the one containing start to the one containing end"""
+    if end < start:
+        return 1
+    if period == 'week':
+        return (end - timedelta(days=end.weekday()) - (start - timedelta(days=start.weekday()))).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def usage_report(account, period='month', since=None, until=None, item_id=None):
+    """
+    Units issued per item per week or month, from one grouped query over the
+    'out' movements, with each item's total and average per period.
+    """
+    movements = StockMovement.objects.filter(account=account, movement_type=StockMovement.TYPE_OUT)
+    if since:
+        movements = movements.filter(created_at__date__gte=since)
+    if until:
+        movements = movements.filter(created_at__date__lte=until)
+    if item_id:
+        movements = movements.filter(item_id=item_id)
+
+    rows = (
+        movements.annotate(period=USAGE_PERIODS[period]('created_at', output_field=DateField()))
+        .values('item_id', 'item__name', 'period')
+        .annotate(quantity=Sum('quantity'))
+        .order_by('item__name', 'period')
+    )
+
+    items = {}
+    for row in rows:
+        entry = items.setdefault(row['item_id'], {
+            'item': row['item_id'], 'item_name': row['item__name'], 'total': 0, 'periods': []
+        })
+        entry['periods'].append({'period': row['period'], 'quantity': row['quantity']})
+        entry['total'] += row['quantity']
+
+    first_period = min((entry['periods'][0]['period'] for entry in items.values()), default=None)
+    start = since or first_period
+    periods = _period_count(period, start, until or timezone.localdate()) if start else 0
+    for entry in items.values():
+        entry['average_per_period'] = round(entry['total'] / periods, 2) if periods else 0
+
+    return {'period': period, 'since': since, 'until': until, 'period_count': periods, 'items': list(items.values())}
+
+
+def stock_dashboard(account):
+    """
+    Stock totals, low-stock items with days of cover, and the most issued items
+    of the last DASHBOARD_WINDOW_DAYS days. Cached per account until stock changes.
+    """
+    today = timezone.localdate()
+    cache_key = f'inventory-dashboard:{account.pk}:{today.isoformat()}:{get_data_version(account.pk, "inventory")}'
+    dashboard = cache.get(cache_key)
+    if dashboard is not None:
+        return dashboard
+
+    items = StoreItem.objects.filter(account=account)
+    low_stock = Q(count__lte=F('low_stock_threshold'))
+    totals = items.aggregate(
+        item_count=Count('id'),
+        units_in_stock=Coalesce(Sum('count'), 0),
+        out_of_stock=Count('id', filter=Q(count=0)),
+        low_stock=Count('id', filter=low_stock),
+    )
+
+    window_start = today - timedelta(days=DASHBOARD_WINDOW_DAYS)
+    issued = list(
+        StockMovement.objects.filter(
+            account=account, movement_type=StockMovement.TYPE_OUT, created_at__date__gt=window_start
+        ).values('item_id', 'item__name').annotate(quantity=Sum('quantity')).order_by('-quantity')
+    )
+    issued_by_item = {row['item_id']: row['quantity'] for row in issued}
+
+    low_stock_items = []
+    for item in items.filter(low_stock).order_by('count', 'name').values('id', 'name', 'count', 'low_stock_threshold')[:50]:
+        daily_use = issued_by_item.get(item['id'], 0) / DASHBOARD_WINDOW_DAYS
+        item['days_of_cover'] = round(item['count'] / daily_use, 1) if daily_use else None
+        low_stock_items.append(item)
+
+    dashboard = {
+        **totals,
+        'window_days': DASHBOARD_WINDOW_DAYS,
+        'issued_in_window': sum(issued_by_item.values()),
+        'top_issued': [
+            {'item': row['item_id'], 'item_name': row['item__name'], 'quantity': row['quantity']} for row in issued[:10]
+        ],
+        'low_stock_items': low_stock_items,
+    }
+    cache.set(cache_key, dashboard, DASHBOARD_CACHE_TIMEOUT)
+    return dashboard
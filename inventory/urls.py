@@ -1,10 +1,11 @@
 # store/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import StoreItemViewSet
+from .views import StoreItemViewSet, StockMovementViewSet
 
 router = DefaultRouter()
 router.register(r'store-items', StoreItemViewSet, basename='inventory-item')  # ✅ fix is here
+router.register(r'stock-movements', StockMovementViewSet, basename='stock-movement')
 
 urlpatterns = [
     path('', include(router.urls)),
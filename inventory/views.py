@@ -1,19 +1,54 @@
 # inventory/views.py
-from rest_framework import viewsets
+from datetime import date
+
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
-from .models import StoreItem
-from .serializers import StoreItemSerializer
-from logs.utils import log_activity
+from rest_framework.response import Response
+from .models import StoreItem, StockMovement
+from .serializers import (
+    StoreItemSerializer, StockMovementSerializer, StockMovementCreateSerializer, StockIssueSerializer
+)
+from .filters import StoreItemFilter
+from .services import (
+    InsufficientStock, record_movement, issue_items, set_stock_count, usage_report, stock_dashboard, USAGE_PERIODS
+)
+from logs.utils import log_activity, serializer_changes
+from utils.pagination import OptInPageNumberPagination
+
+
+def _insufficient_stock_response(error):
+    item = StoreItem.objects.filter(pk=error.item_id).first()
+    return Response(
+        {"error": f"الكمية المتوفرة من الصنف {item.name if item else ''} غير كافية ({item.count if item else 0})"},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
 
 class StoreItemViewSet(viewsets.ModelViewSet):
     serializer_class = StoreItemSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = StoreItemFilter
+    ordering_fields = ['name', 'count', 'low_stock_threshold', 'created_at']
+    ordering = ['name']
+    pagination_class = OptInPageNumberPagination
 
     def get_queryset(self):
         return StoreItem.objects.filter(account=self.request.user.account)
 
     def perform_create(self, serializer):
-        instance = serializer.save(account=self.request.user.account)
+        # The initial count goes through the ledger like any other change
+        initial_count = serializer.validated_data.pop('count', 0)
+        instance = serializer.save(account=self.request.user.account, count=0)
+        if initial_count:
+            movement = record_movement(
+                instance.account, instance.pk, StockMovement.TYPE_IN, initial_count,
+                user=self.request.user, reason='رصيد افتتاحي'
+            )
+            instance.count = movement.balance_after
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
@@ -23,13 +58,23 @@ class StoreItemViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
+        changes = serializer_changes(serializer)
+        # A count sent by the client is a stocktake: recorded as an adjustment, not a blind overwrite
+        new_count = serializer.validated_data.pop('count', None)
         instance = serializer.save(account=self.request.user.account)
+        if new_count is not None:
+            movement = set_stock_count(instance, new_count, user=self.request.user, reason='جرد')
+            if movement:
+                instance.count = movement.balance_after
+        else:
+            instance.refresh_from_db(fields=['count'])
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
             note=f"تم تعديل كمية الصنف: {instance.name} إلى {instance.count}",
             related_model='StoreItem',
-            related_id=str(instance.id)
+            related_id=str(instance.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -41,3 +86,101 @@ class StoreItemViewSet(viewsets.ModelViewSet):
             related_id=str(instance.id)
         )
         instance.delete()
+
+    @action(detail=True, methods=['post'], url_path='movements')
+    def add_movement(self, request, pk=None):
+        """
+        Record stock coming in, going out or a correction.
+        Body: {"movement_type": "in|out|adjust", "quantity": 5, "reason": "", "student": <id, optional>}
+        """
+        item = self.get_object()
+        serializer = StockMovementCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            movement = record_movement(
+                request.user.account, item.pk, data['movement_type'], data['quantity'],
+                user=request.user, reason=data['reason'], student=data.get('student')
+            )
+        except InsufficientStock as error:
+            return _insufficient_stock_response(error)
+
+        log_activity(
+            user=request.user,
+            account=request.user.account,
+            note=f"تم تسجيل حركة مخزون للصنف {item.name}: {movement.delta:+d} (الرصيد {movement.balance_after})",
+            related_model='StoreItem',
+            related_id=str(item.id)
+        )
+        return Response(StockMovementSerializer(movement).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='issue')
+    def issue(self, request):
+        """
+        Issue several items in one transaction; nothing is issued if any item is short.
+        Body: {"items": [{"item": <id>, "quantity": 2}, ...], "student": <id, optional>, "reason": ""}
+        """
+        serializer = StockIssueSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            movements = issue_items(
+                request.user.account, data['items'], user=request.user,
+                reason=data['reason'], student=data.get('student')
+            )
+        except InsufficientStock as error:
+            return _insufficient_stock_response(error)
+
+        log_activity(
+            user=request.user,
+            account=request.user.account,
+            note=f"تم صرف {len(movements)} أصناف من المستودع",
+            related_model='Student' if data.get('student') else 'StoreItem',
+            related_id=str(data['student'].id) if data.get('student') else None
+        )
+        return Response(StockMovementSerializer(movements, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='usage')
+    def usage(self, request):
+        """
+        Units issued per item per week or month.
+        ?period=week|month (default month), ?since=YYYY-MM-DD, ?until=YYYY-MM-DD, ?item=<id>
+        """
+        period = request.query_params.get('period', 'month')
+        if period not in USAGE_PERIODS:
+            return Response({"error": "الفترة يجب أن تكون week أو month"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since, until = (
+                date.fromisoformat(value) if value else None
+                for value in (request.query_params.get('since'), request.query_params.get('until'))
+            )
+        except ValueError:
+            return Response({"error": "تاريخ غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+        item_id = request.query_params.get('item')
+        if item_id:
+            try:
+                item_id = int(item_id)
+            except ValueError:
+                return Response({"error": "الصنف غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(usage_report(request.user.account, period, since, until, item_id=item_id or None))
+
+    @action(detail=False, methods=['get'], url_path='dashboard')
+    def dashboard(self, request):
+        """Stock totals, low-stock items and most issued items (cached until stock changes)"""
+        return Response(stock_dashboard(request.user.account))
+
+
+class StockMovementViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = StockMovementSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['item', 'student', 'movement_type']
+    pagination_class = OptInPageNumberPagination
+
+    def get_queryset(self):
+        return StockMovement.objects.filter(
+            account=self.request.user.account
+        ).select_related('item', 'student', 'created_by')
@@ -0,0 +1,21 @@
+import django_filters
+
+from .models import ActivityLog, ArchivedActivityLog
+
+
+class ActivityLogFilter(django_filters.FilterSet):
+    """
+    e.g. ?related_model=Payment&related_id=<id> for one object's history,
+    or ?user=<id>&since=2025-01-01T00:00 for what a user did since then
+    """
+    since = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='lt')
+
+    class Meta:
+        model = ActivityLog
+        fields = ['user', 'action', 'related_model', 'related_id']
+
+
+class ArchivedActivityLogFilter(ActivityLogFilter):
+    class Meta(ActivityLogFilter.Meta):
+        model = ArchivedActivityLog
@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from logs.models import ActivityLog
+from logs.services import archive_activity_logs, retention_cutoff, ARCHIVE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Move activity log entries older than the retention period to the archive (table or gzipped JSONL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Retention in days (default: ACTIVITY_LOG_RETENTION_DAYS)")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between chunks to go easy on the database")
+        parser.add_argument('--jsonl-dir', default=None,
+                            help="Write entries to a gzipped JSONL file in this directory instead of the archive table")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many entries would be moved")
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        if options['dry_run']:
+            count = ActivityLog.objects.filter(timestamp__lt=cutoff).count()
+            self.stdout.write(f"{count} entries older than {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        jsonl_path = None
+        if options['jsonl_dir']:
+            os.makedirs(options['jsonl_dir'], exist_ok=True)
+            jsonl_path = os.path.join(
+                options['jsonl_dir'], f"activity-logs-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz"
+            )
+
+        moved = archive_activity_logs(
+            cutoff, chunk_size=options['chunk_size'], jsonl_path=jsonl_path, pause=options['pause']
+        )
+        destination = jsonl_path or 'the archive table'
+        self.stdout.write(f"Archived {moved} entries older than {cutoff:%Y-%m-%d %H:%M} to {destination}")
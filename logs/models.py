@@ -3,16 +3,85 @@ from django.db import models
 from django.conf import settings
 
 class ActivityLog(models.Model):
+    ACTION_CHOICES = (
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('upload', 'Upload'),
+        ('login', 'Login'),
+        ('other', 'Other'),
+    )
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='activity_logs'
     )
     note = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, default='other')
     related_model = models.CharField(max_length=100, blank=True, null=True)
     related_id = models.CharField(max_length=100, blank=True, null=True)
+    # {field: [old, new]} for updates that recorded what they changed
+    changes = models.JSONField(null=True, blank=True)
 
     account = models.ForeignKey("users.Account", on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-timestamp'], name='activitylog_acct_time'),
+            models.Index(fields=['account', 'related_model', 'related_id'], name='activitylog_acct_object'),
+            models.Index(fields=['account', 'user', '-timestamp'], name='activitylog_acct_user_time'),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.note[:40]} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ArchivedActivityLog(models.Model):
+    """
+    Activity log entries moved out of ActivityLog by the archive_activity_logs
+    command. Same columns, keeping the original id as the primary key.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='archived_activity_logs'
+    )
+    note = models.TextField()
+    timestamp = models.DateTimeField()
+    action = models.CharField(max_length=20, choices=ActivityLog.ACTION_CHOICES, default='other')
+    related_model = models.CharField(max_length=100, blank=True, null=True)
+    related_id = models.CharField(max_length=100, blank=True, null=True)
+    changes = models.JSONField(null=True, blank=True)
+    account = models.ForeignKey("users.Account", on_delete=models.CASCADE, related_name='archived_activity_logs')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-timestamp'], name='archivedlog_acct_time'),
+            models.Index(fields=['account', 'related_model', 'related_id'], name='archivedlog_acct_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.note[:40]} - {self.timestamp.strftime('%Y-%m-%d %H:%M')} (archived)"
+
+
+class ActivityLogDailyRollup(models.Model):
+    """Entries per account, day, user and action; kept after the entries themselves are archived"""
+    account = models.ForeignKey("users.Account", on_delete=models.CASCADE, related_name='activity_rollups')
+    date = models.DateField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='activity_rollups'
+    )
+    action = models.CharField(max_length=20, choices=ActivityLog.ACTION_CHOICES, default='other')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date', 'user', 'action'], name='unique_activity_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'date'], name='activityrollup_acct_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.user} {self.action}: {self.count}"
@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+from utils.pagination import OptInPaginationMixin
+
+
+class ActivityLogCursorPagination(OptInPaginationMixin, CursorPagination):
+    """
+    Keyset pagination over (timestamp, id), so deep pages cost the same as the first.
+    Opt-in: without ?cursor or ?page_size the full list is returned as before.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    opt_in_query_params = ('cursor',)
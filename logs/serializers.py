@@ -1,10 +1,22 @@
 # logs/serializers.py
 from rest_framework import serializers
-from .models import ActivityLog
+from .models import ActivityLog, ArchivedActivityLog
 
 class ActivityLogSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()  # to show username instead of ID
 
     class Meta:
         model = ActivityLog
-        fields = ['id', 'timestamp', 'user', 'note', 'related_model', 'related_id']
+        fields = ['id', 'timestamp', 'user', 'user_id', 'action', 'note', 'related_model', 'related_id', 'changes']
+
+
+class ArchivedActivityLogSerializer(ActivityLogSerializer):
+    class Meta(ActivityLogSerializer.Meta):
+        model = ArchivedActivityLog
+
+
+class ActivityLogSummarySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    user_id = serializers.UUIDField(allow_null=True)
+    action = serializers.CharField()
+    count = serializers.IntegerField()
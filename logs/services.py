@@ -0,0 +1,112 @@
+# logs/services.py
+"""
+Retention for ActivityLog: old entries are moved, a chunk at a time, into
+ArchivedActivityLog (or gzipped JSONL files) and counted into daily rollups.
+"""
+import gzip
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ActivityLog, ArchivedActivityLog, ActivityLogDailyRollup
+
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'note', 'timestamp', 'action', 'related_model', 'related_id', 'changes', 'account_id'
+)
+
+
+def retention_cutoff(days=None):
+    """Entries older than this are due for archiving"""
+    if days is None:
+        days = getattr(settings, 'ACTIVITY_LOG_RETENTION_DAYS', 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_boundary(account):
+    """Newest archived timestamp of the account; anything older lives only in the archive"""
+    return ArchivedActivityLog.objects.filter(account=account).aggregate(last=Max('timestamp'))['last']
+
+
+def _add_to_rollups(rows):
+    counts = Counter(
+        (row['account_id'], timezone.localdate(row['timestamp']), row['user_id'], row['action']) for row in rows
+    )
+    for (account_id, day, user_id, action), count in counts.items():
+        rollup = ActivityLogDailyRollup.objects.filter(account_id=account_id, date=day, action=action)
+        rollup = rollup.filter(user_id=user_id) if user_id else rollup.filter(user__isnull=True)
+        # The unique constraint doesn't cover user=NULL, so update-then-create rather than upsert
+        if not rollup.update(count=F('count') + count):
+            ActivityLogDailyRollup.objects.create(
+                account_id=account_id, date=day, user_id=user_id, action=action, count=count
+            )
+
+
+def archive_activity_logs(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE, jsonl_path=None, pause=0):
+    """
+    Move entries older than cutoff out of ActivityLog and return how many were moved.
+
+    Each chunk is copied, rolled up and deleted in its own short transaction, so
+    the hot table is never locked for long; pause (seconds) spaces the chunks out.
+    With jsonl_path the chunks are appended to a gzipped JSONL file instead of
+    ArchivedActivityLog.
+    """
+    queryset = ActivityLog.objects.filter(timestamp__lt=cutoff).order_by('pk').values(*ARCHIVE_FIELDS)
+    archive_file = gzip.open(jsonl_path, 'at', encoding='utf-8') if jsonl_path else None
+    moved = 0
+    try:
+        while True:
+            # Archived rows are deleted, so the first chunk is always the next one
+            rows = list(queryset[:chunk_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                if archive_file:
+                    archive_file.writelines(json.dumps(row, default=str, ensure_ascii=False) + '\n' for row in rows)
+                    archive_file.flush()
+                else:
+                    ArchivedActivityLog.objects.bulk_create(
+                        [ArchivedActivityLog(**row) for row in rows], ignore_conflicts=True
+                    )
+                _add_to_rollups(rows)
+                ActivityLog.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+            if pause:
+                time.sleep(pause)
+    finally:
+        if archive_file:
+            archive_file.close()
+    return moved
+
+
+def activity_summary(account, since=None, until=None):
+    """
+    Entries per day, user and action between two dates (inclusive), combining
+    the rollups of archived entries with live counts from ActivityLog.
+    """
+    rollups = ActivityLogDailyRollup.objects.filter(account=account)
+    live = ActivityLog.objects.filter(account=account).annotate(date=TruncDate('timestamp'))
+    if since:
+        rollups = rollups.filter(date__gte=since)
+        live = live.filter(date__gte=since)
+    if until:
+        rollups = rollups.filter(date__lte=until)
+        live = live.filter(date__lte=until)
+
+    totals = Counter()
+    for row in rollups.values('date', 'user_id', 'action', 'count'):
+        totals[(row['date'], row['user_id'], row['action'])] += row['count']
+    for row in live.order_by().values('date', 'user_id', 'action').annotate(count=Count('id')):
+        totals[(row['date'], row['user_id'], row['action'])] += row['count']
+
+    return [
+        {'date': day, 'user_id': user_id, 'action': action, 'count': count}
+        for (day, user_id, action), count in sorted(totals.items(), key=lambda item: (item[0][0], str(item[0][1]), item[0][2]))
+    ]
@@ -1,7 +1,8 @@
 # logs/urls.py
 from django.urls import path
-from .views import ActivityLogListView
+from .views import ActivityLogListView, ActivityLogSummaryView
 
 urlpatterns = [
     path('', ActivityLogListView.as_view(), name='logs-list'),
+    path('summary/', ActivityLogSummaryView.as_view(), name='logs-summary'),
 ]
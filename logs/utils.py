@@ -1,11 +1,196 @@
 # logs/utils.py
+"""
+Buffered activity logging.
+
+log_activity() no longer INSERTs inline. Entries are collected per request and
+written with one bulk_create when the request finishes (ActivityLogMiddleware);
+entries logged inside a transaction only join the buffer once it commits, so
+rolled back work leaves no log behind. Outside a request (commands, background
+tasks) entries are written straight away.
+
+With ACTIVITY_LOG_WRITER_THREAD enabled the batches are handed to a single
+writer thread instead, through a bounded queue; when the queue is full the
+batch is written synchronously.
+"""
+import atexit
+import contextvars
+import datetime
+import decimal
+import logging
+import queue
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, connections, models, transaction
+
 from .models import ActivityLog
 
-def log_activity(user, account, note, related_model=None, related_id=None):
-    ActivityLog.objects.create(
+logger = logging.getLogger(__name__)
+
+WRITER_BATCH_SIZE = 500
+
+# Leading words of the Arabic notes -> ActivityLog.action, for callers that don't pass one
+ACTION_PREFIXES = (
+    ('تم إنشاء', 'create'),
+    ('تم إضافة', 'create'),
+    ('تم حذف', 'delete'),
+    ('تم إزالة', 'delete'),
+    ('تم تعديل', 'update'),
+    ('تم تحديث', 'update'),
+    ('تم تغيير', 'update'),
+    ('تم تعيين', 'update'),
+    ('تم رفع', 'upload'),
+    ('تسجيل دخول', 'login'),
+)
+
+_request_buffer = contextvars.ContextVar('activity_log_buffer', default=None)
+
+_writer_queue = None
+_writer_lock = threading.Lock()
+
+
+def infer_action(note):
+    for prefix, action in ACTION_PREFIXES:
+        if note.startswith(prefix):
+            return action
+    return 'other'
+
+
+def _json_value(value):
+    if isinstance(value, models.Model):
+        return str(value.pk)
+    # FieldFile on the instance, UploadedFile in validated_data: log the name only
+    if isinstance(value, File):
+        return value.name or None
+    if isinstance(value, (decimal.Decimal, uuid.UUID, datetime.date, datetime.time)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def serializer_changes(serializer):
+    """{field: [old, new]} for what an update serializer is about to change; call before save()"""
+    instance = serializer.instance
+    if instance is None:
+        return None
+    changes = {}
+    for field, new in serializer.validated_data.items():
+        if not hasattr(instance, field):
+            continue
+        old = getattr(instance, field)
+        if isinstance(old, models.Manager):
+            continue
+        old_value, new_value = _json_value(old), _json_value(new)
+        if old_value != new_value:
+            changes[field] = [old_value, new_value]
+    return changes
+
+
+def log_activity(user, account, note, related_model=None, related_id=None, action=None, changes=None):
+    entry = ActivityLog(
         user=user,
         account=account,
         note=note,
+        action=action or infer_action(note),
         related_model=related_model,
         related_id=related_id,
+        changes=changes or None,
     )
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _buffer_entry(entry))
+    else:
+        _buffer_entry(entry)
+
+
+def _buffer_entry(entry):
+    buffer = _request_buffer.get()
+    if buffer is None:
+        write_entries([entry])
+    else:
+        buffer.append(entry)
+
+
+def _save_entries(entries):
+    """bulk_create the entries; on failure save them one by one so one bad row doesn't drop the batch"""
+    try:
+        ActivityLog.objects.bulk_create(entries, batch_size=WRITER_BATCH_SIZE)
+    except Exception:
+        logger.exception("Activity log batch insert failed, retrying entries one by one")
+        for entry in entries:
+            try:
+                entry.save()
+            except Exception:
+                logger.exception(f"Dropping activity log entry: {entry.note[:80]}")
+
+
+def _writer_loop(entries_queue):
+    while True:
+        entries = entries_queue.get()
+        # Drain whatever else is waiting so concurrent requests share one INSERT
+        while len(entries) < WRITER_BATCH_SIZE:
+            try:
+                entries.extend(entries_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _save_entries(entries)
+        finally:
+            connections.close_all()
+
+
+def _get_writer_queue():
+    """Return the writer thread's queue, starting the thread on first use"""
+    global _writer_queue
+    if _writer_queue is None:
+        with _writer_lock:
+            if _writer_queue is None:
+                entries_queue = queue.Queue(maxsize=getattr(settings, 'ACTIVITY_LOG_QUEUE_SIZE', 1000))
+                threading.Thread(
+                    target=_writer_loop, args=(entries_queue,), name='activity-log-writer', daemon=True
+                ).start()
+                atexit.register(_drain_writer_queue, entries_queue)
+                _writer_queue = entries_queue
+    return _writer_queue
+
+
+def _drain_writer_queue(entries_queue):
+    entries = []
+    while True:
+        try:
+            entries.extend(entries_queue.get_nowait())
+        except queue.Empty:
+            break
+    if entries:
+        _save_entries(entries)
+
+
+def write_entries(entries):
+    """Persist a batch, through the writer thread when enabled, else inline"""
+    if not entries:
+        return
+    if getattr(settings, 'ACTIVITY_LOG_WRITER_THREAD', False):
+        try:
+            _get_writer_queue().put_nowait(list(entries))
+            return
+        except queue.Full:
+            logger.warning("Activity log queue is full, writing synchronously")
+    _save_entries(entries)
+
+
+class ActivityLogMiddleware:
+    """Collects the request's activity log entries and writes them in one batch at the end"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        buffer = []
+        token = _request_buffer.set(buffer)
+        try:
+            return self.get_response(request)
+        finally:
+            _request_buffer.reset(token)
+            write_entries(buffer)
@@ -1,13 +1,101 @@
 # logs/views.py
+from datetime import timedelta
+
 from rest_framework import generics, permissions
-from .models import ActivityLog
-from .serializers import ActivityLogSerializer
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import ActivityLog, ArchivedActivityLog
+from .serializers import ActivityLogSerializer, ArchivedActivityLogSerializer, ActivityLogSummarySerializer
 from .permissions import IsManagerUser
+from .filters import ActivityLogFilter, ArchivedActivityLogFilter
+from .pagination import ActivityLogCursorPagination
+from .services import archive_boundary, activity_summary
+
+
+def _query_datetime(value):
+    parsed = parse_datetime(value or '')
+    if parsed and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 
 class ActivityLogListView(generics.ListAPIView):
-    serializer_class = ActivityLogSerializer
+    """
+    Recent entries come from ActivityLog. When ?since reaches back past what has
+    been archived, the archive is read too: only the archive if ?until is also
+    in the archived range, otherwise live entries first and then archived ones.
+    """
     permission_classes = [IsManagerUser]
+    filter_backends = [DjangoFilterBackend]
+    pagination_class = ActivityLogCursorPagination
+
+    def get_source(self):
+        """'live', 'archive' or 'both'"""
+        if not hasattr(self, '_source'):
+            self._source, self._archived_until = 'live', None
+            since = _query_datetime(self.request.query_params.get('since'))
+            boundary = archive_boundary(self.request.user.account) if since else None
+            if boundary:
+                # Everything before archived_until is in the archive, everything after in ActivityLog
+                self._archived_until = boundary + timedelta(microseconds=1)
+                until = _query_datetime(self.request.query_params.get('until'))
+                if until and until <= self._archived_until:
+                    self._source = 'archive'
+                elif since < self._archived_until:
+                    self._source = 'both'
+        return self._source
+
+    @property
+    def filterset_class(self):
+        return ArchivedActivityLogFilter if self.get_source() == 'archive' else ActivityLogFilter
+
+    def get_serializer_class(self):
+        return ArchivedActivityLogSerializer if self.get_source() == 'archive' else ActivityLogSerializer
 
     def get_queryset(self):
-        return ActivityLog.objects.filter(account=self.request.user.account).order_by('-timestamp')
+        model = ArchivedActivityLog if self.get_source() == 'archive' else ActivityLog
+        return (
+            model.objects.filter(account=self.request.user.account)
+            .select_related('user')
+            .order_by('-timestamp', '-id')
+        )
+
+    def list(self, request, *args, **kwargs):
+        if self.get_source() != 'both':
+            return super().list(request, *args, **kwargs)
+
+        live = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(live)
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            if response.data['next'] is None:
+                # Live entries are exhausted; continue with the archived range
+                url = remove_query_param(request.build_absolute_uri(), self.paginator.cursor_query_param)
+                response.data['next'] = replace_query_param(url, 'until', self._archived_until.isoformat())
+            return response
+
+        archived = ArchivedActivityLogFilter(
+            request.query_params,
+            queryset=ArchivedActivityLog.objects.filter(account=request.user.account)
+            .select_related('user').order_by('-timestamp', '-id'),
+            request=request,
+        ).qs
+        return Response(
+            self.get_serializer(live, many=True).data
+            + ArchivedActivityLogSerializer(archived, many=True, context=self.get_serializer_context()).data
+        )
+
+
+class ActivityLogSummaryView(generics.GenericAPIView):
+    """Daily entry counts per user and action, archived days included (?since=YYYY-MM-DD&until=YYYY-MM-DD)"""
+    permission_classes = [IsManagerUser]
+    serializer_class = ActivityLogSummarySerializer
 
+    def get(self, request):
+        since = parse_date(request.query_params.get('since') or '')
+        until = parse_date(request.query_params.get('until') or '')
+        rows = activity_summary(request.user.account, since, until)
+        return Response(self.get_serializer(rows, many=True).data)
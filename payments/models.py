@@ -8,7 +8,7 @@ from utils.services import get_next_number
 from django.db import IntegrityError, transaction
 from users.models import Account, CustomUser
 from utils.file_handlers import payment_documents_path, payment_cheque_path
-from utils.storage_backends import MediaStorage
+from utils.storage_backends import media_storage
 
 
 def get_current_time():
@@ -60,7 +60,7 @@ class ChequeDetail(models.Model):
     # ✅ Updated to use payment_cheque_path which handles ChequeDetail instances properly
     cheque_image = models.ImageField(
         upload_to=payment_cheque_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True, 
         blank=True,
         help_text="Cheque image or scan"
@@ -92,7 +92,7 @@ class PaymentDocument(models.Model):
     document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPES)
     document = models.FileField(
         upload_to=payment_documents_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True, 
         blank=True
     )
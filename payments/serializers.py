@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.utils import timezone
 import logging
 from .models import PaymentType, BankTransferDetail, ChequeDetail, Payment, Recipient, PaymentDocument
+from utils.images import thumbnail_url
 
 logger = logging.getLogger(__name__)
 
@@ -46,12 +47,16 @@ class BankTransferDetailSerializer(serializers.ModelSerializer):
 
 class ChequeDetailSerializer(serializers.ModelSerializer):
     cheque_image_url = serializers.SerializerMethodField()
+    cheque_image_thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = ChequeDetail
         fields = ['id', 'bank_number', 'branch_number', 'account_number', 
                  'cheque_number', 'cheque_date', 'cheque_image', 'cheque_image_url', 
-                 'description']
+                 'cheque_image_thumbnail_url', 'description']
+
+    def get_cheque_image_thumbnail_url(self, obj):
+        return thumbnail_url(obj.cheque_image)
     
     def get_cheque_image_url(self, obj):
         """Generate URL for cheque image with error handling"""
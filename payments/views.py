@@ -5,7 +5,6 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
-from settings_data.models import SchoolYear
 from .models import PaymentType, BankTransferDetail, ChequeDetail, Payment, Recipient, PaymentDocument
 from .serializers import (
     PaymentTypeSerializer,
@@ -16,14 +15,18 @@ from .serializers import (
     PaymentDocumentSerializer
 )
 from logs.utils import log_activity
-from utils.s3_utils import S3FileManager
+from utils.s3_outbox import queue_file_deletion
+from utils.account_context import ReferenceListMixin, get_active_school_year
+from utils.conditional import ConditionalGetMixin
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class PaymentTypeViewSet(viewsets.ModelViewSet):
+class PaymentTypeViewSet(ReferenceListMixin, viewsets.ModelViewSet):
     serializer_class = PaymentTypeSerializer
+    # Small per-account table, served from the account context cache
+    reference_set = 'payment_types'
 
     def get_queryset(self):
         return PaymentType.objects.filter(
@@ -107,7 +110,7 @@ def payments_with_cheques(request):
         # Apply additional filters if provided
         school_year_param = request.query_params.get('school_year')
         if school_year_param == 'current':
-            active_year = SchoolYear.objects.filter(account=account, is_active=True).first()
+            active_year = get_active_school_year(account)
             if active_year:
                 payments_queryset = payments_queryset.filter(school_year=active_year)
         elif school_year_param:
@@ -188,8 +191,9 @@ def payments_with_cheques(request):
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
+    etag_scopes = ['payment_records']
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
 
     def get_queryset(self):
@@ -206,7 +210,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
         school_year_param = self.request.query_params.get('school_year')
         if school_year_param == 'current':
-            active_year = SchoolYear.objects.filter(account=account, is_active=True).first()
+            active_year = get_active_school_year(account)
             if active_year:
                 queryset = queryset.filter(school_year=active_year)
         return queryset
@@ -221,14 +225,17 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """
         Override retrieve to ensure proper cheque data is included
         """
-        instance = self.get_object()
-        # Ensure the cheque is properly loaded
-        if instance.cheque:
-            # Force load the cheque to ensure it's in memory
-            _ = instance.cheque.id
-        
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        def build():
+            instance = self.get_object()
+            # Ensure the cheque is properly loaded
+            if instance.cheque:
+                # Force load the cheque to ensure it's in memory
+                _ = instance.cheque.id
+
+            serializer = self.get_serializer(instance)
+            return Response(serializer.data)
+
+        return self.conditional_response(request, build, detail=True)
 
     def handle_cheque_data(self, request):
         """Handle cheque data from multipart form data with improved file handling"""
@@ -270,6 +277,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
         # Only create cheque if at least one field has data
         if any(value for value in cheque_data.values() if value):
             cheque = ChequeDetail.objects.create(**cheque_data)
+            # Not attached to a payment yet; tells the file metadata which account it belongs to
+            cheque.file_account_id = request.user.account_id
             
             # Handle image upload with multiple possible field names
             image_file = (
@@ -325,10 +334,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         # Apply the same filters as the main queryset
         school_year_param = request.query_params.get('school_year')
         if school_year_param == 'current':
-            active_year = SchoolYear.objects.filter(
-                account=request.user.account, 
-                is_active=True
-            ).first()
+            active_year = get_active_school_year(request.user.account)
             if active_year:
                 queryset = queryset.filter(school_year=active_year)
         elif school_year_param:
@@ -406,8 +412,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
         
         return Response(response_data)
 
-class RecipientViewSet(viewsets.ModelViewSet):
+class RecipientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = RecipientSerializer
+    etag_scopes = ['payment_records']
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['student', 'school_fee', 'payment_type']
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
@@ -428,7 +435,7 @@ class RecipientViewSet(viewsets.ModelViewSet):
 
         school_year_param = self.request.query_params.get('school_year')
         if school_year_param == 'current':
-            active_year = SchoolYear.objects.filter(account=account, is_active=True).first()
+            active_year = get_active_school_year(account)
             if active_year:
                 queryset = queryset.filter(school_year=active_year)
 
@@ -444,29 +451,32 @@ class RecipientViewSet(viewsets.ModelViewSet):
         """
         Override retrieve to ensure all related data is properly loaded
         """
-        instance = self.get_object()
-        
-        # Force reload the instance with proper relations
-        instance = Recipient.objects.select_related(
-            'cheque',
-            'student',
-            'school_fee',
-            'student__school_class',
-            'created_by',
-            'school_year'
-        ).prefetch_related('documents').get(pk=instance.pk)
-        
-        # Debug logging
-        logger.info(f"🔍 Retrieved recipient {instance.id}")
-        logger.info(f"🔍 Payment type: {instance.payment_type}")
-        logger.info(f"🔍 Created by: {instance.created_by}")
-        logger.info(f"🔍 School year: {instance.school_year}")
-        logger.info(f"🔍 Cheque object: {instance.cheque}")
-        if instance.cheque:
-            logger.info(f"🔍 Cheque details: {instance.cheque.__dict__}")
-        
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        def build():
+            instance = self.get_object()
+
+            # Force reload the instance with proper relations
+            instance = Recipient.objects.select_related(
+                'cheque',
+                'student',
+                'school_fee',
+                'student__school_class',
+                'created_by',
+                'school_year'
+            ).prefetch_related('documents').get(pk=instance.pk)
+
+            # Debug logging
+            logger.info(f"🔍 Retrieved recipient {instance.id}")
+            logger.info(f"🔍 Payment type: {instance.payment_type}")
+            logger.info(f"🔍 Created by: {instance.created_by}")
+            logger.info(f"🔍 School year: {instance.school_year}")
+            logger.info(f"🔍 Cheque object: {instance.cheque}")
+            if instance.cheque:
+                logger.info(f"🔍 Cheque details: {instance.cheque.__dict__}")
+
+            serializer = self.get_serializer(instance)
+            return Response(serializer.data)
+
+        return self.conditional_response(request, build, detail=True)
 
     def handle_cheque_data(self, request):
         """Handle cheque data from multipart form data - Enhanced version"""
@@ -508,6 +518,8 @@ class RecipientViewSet(viewsets.ModelViewSet):
         # Only create cheque if at least one field has data
         if any(value for value in cheque_data.values() if value):
             cheque = ChequeDetail.objects.create(**cheque_data)
+            # Not attached to a payment yet; tells the file metadata which account it belongs to
+            cheque.file_account_id = request.user.account_id
             
             # Handle image upload with multiple possible field names
             image_file = (
@@ -706,11 +718,7 @@ def delete_payment_document(request, document_id):
                 'error': 'غير مصرح بالوصول'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Delete from S3
-        if document.document:
-            s3_manager = S3FileManager()
-            s3_manager.delete_file(document.document.name)
-        
+        # The file is queued for deletion from S3 by the post_delete signal
         doc_type = document.get_document_type_display()
         target_name = ""
         if document.payment:
@@ -761,8 +769,7 @@ def delete_cheque_image(request, cheque_id):
         
         # Delete from S3
         if cheque.cheque_image:
-            s3_manager = S3FileManager()
-            s3_manager.delete_file(cheque.cheque_image.name)
+            queue_file_deletion(cheque.cheque_image)
             
             # Clear the field
             cheque.cheque_image = None
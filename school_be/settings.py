@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -83,7 +86,7 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -136,6 +139,32 @@ AWS_S3_USE_SSL = True
 AWS_S3_ADDRESSING_STYLE = 'virtual'
 AWS_S3_SIGNATURE_VERSION = 's3v4'
 
+# Shared S3 client (utils.s3_client): connection pool size, timeouts (seconds) and retries
+AWS_S3_MAX_POOL_CONNECTIONS = 20
+AWS_S3_CONNECT_TIMEOUT = 5
+AWS_S3_READ_TIMEOUT = 30
+AWS_S3_MAX_ATTEMPTS = 5
+# A directory here replaces S3 with a local filesystem stand-in (tests / offline development)
+S3_LOCAL_ROOT = config('S3_LOCAL_ROOT', default='')
+# Storage behind the FileFields (utils.storage_backends.media_storage)
+MEDIA_STORAGE = (
+    'utils.storage_backends.LocalMediaStorage' if S3_LOCAL_ROOT else 'utils.storage_backends.MediaStorage'
+)
+# Drain the S3 deletion outbox in the background right after a delete commits;
+# `manage.py drain_s3_deletions` picks up retries and anything missed
+S3_DELETION_DRAIN_ON_COMMIT = True
+# Direct-to-S3 uploads (api/uploads/): policy lifetime in seconds and size limits in bytes
+UPLOAD_URL_EXPIRY = 600
+UPLOAD_MAX_DOCUMENT_SIZE = 10 * 1024 * 1024
+UPLOAD_MAX_IMAGE_SIZE = 5 * 1024 * 1024
+# Uploaded cheque scans, logos and pictures (utils.images): re-encoded to IMAGE_FORMAT
+# (WEBP or JPEG) within IMAGE_MAX_DIMENSION pixels, plus a thumbnail in thumbs/
+IMAGE_PROCESSING = True
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 80
+IMAGE_MAX_DIMENSION = 1600
+IMAGE_THUMBNAIL_SIZE = 320
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -143,6 +172,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'utils.account_context.AccountContextMiddleware',
+    'logs.utils.ActivityLogMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -194,6 +225,35 @@ if USE_SQLITE:
         }
     }
 
+# Cache: data versions, cached responses and the account context must be seen
+# by every worker, so the default is a file based cache shared by the processes
+# of one host. Set CACHE_BACKEND / CACHE_LOCATION to Redis or Memcached when
+# running on more than one host. Per-process memory is only allowed with a
+# single worker (WEB_CONCURRENCY, as read by gunicorn).
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache')
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if CACHE_BACKEND.endswith('LocMemCache') and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND LocMemCache is per process; use a shared cache with WEB_CONCURRENCY > 1"
+    )
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'school-be-cache')),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    }
+}
+
+# Activity log entries are batched per request; the writer thread moves the
+# INSERT off the request path entirely
+ACTIVITY_LOG_WRITER_THREAD = config('ACTIVITY_LOG_WRITER_THREAD', default=False, cast=bool)
+ACTIVITY_LOG_QUEUE_SIZE = 1000
+# Entries older than this are moved out by `manage.py archive_activity_logs`
+ACTIVITY_LOG_RETENTION_DAYS = config('ACTIVITY_LOG_RETENTION_DAYS', default=180, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
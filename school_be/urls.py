@@ -27,6 +27,7 @@ urlpatterns = [
     path('api/users/', include('users.urls')),
     path('api/logs/', include('logs.urls')),
     path('api/inventory/', include('inventory.urls')),
+    path('api/uploads/', include('utils.urls')),
 
 ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
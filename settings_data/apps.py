@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SettingsDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'settings_data'
+
+    def ready(self):
+        import settings_data.signals  # noqa: F401
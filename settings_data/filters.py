@@ -0,0 +1,24 @@
+import django_filters
+
+from .models import SchoolFee
+
+
+class SchoolFeeFilter(django_filters.FilterSet):
+    """
+    Filters for SchoolFee, including the database-generated totals,
+    e.g. ?school_year=<id>&total_fees_after_discount__gt=1000
+    """
+    # Generated columns aren't auto-mapped by django-filter, so they are declared explicitly
+    total_fees_after_discount = django_filters.NumberFilter()
+    total_fees_after_discount__gt = django_filters.NumberFilter(field_name='total_fees_after_discount', lookup_expr='gt')
+    total_fees_after_discount__gte = django_filters.NumberFilter(field_name='total_fees_after_discount', lookup_expr='gte')
+    total_fees_after_discount__lt = django_filters.NumberFilter(field_name='total_fees_after_discount', lookup_expr='lt')
+    total_fees_after_discount__lte = django_filters.NumberFilter(field_name='total_fees_after_discount', lookup_expr='lte')
+    total_fees_before_discount__gte = django_filters.NumberFilter(field_name='total_fees_before_discount', lookup_expr='gte')
+    total_fees_before_discount__lte = django_filters.NumberFilter(field_name='total_fees_before_discount', lookup_expr='lte')
+    discount_amount_calculated__gt = django_filters.NumberFilter(field_name='discount_amount_calculated', lookup_expr='gt')
+    has_student = django_filters.BooleanFilter(field_name='student', lookup_expr='isnull', exclude=True)
+
+    class Meta:
+        model = SchoolFee
+        fields = ['school_year', 'school_class', 'student']
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from settings_data.models import SchoolFee
+from settings_data.services import mark_overridden_fees
+
+
+class Command(BaseCommand):
+    help = ("Flag student fees that differ from their class / default fee as overridden. "
+            "Run once before propagating fee changes on data written before is_overridden existed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', default=None, help="Only check this account's fees")
+        parser.add_argument('--dry-run', action='store_true', help="Report how many fees would be flagged")
+
+    def handle(self, *args, **options):
+        fees = SchoolFee.objects.all()
+        if options['account']:
+            fees = fees.filter(account_id=options['account'])
+
+        marked = mark_overridden_fees(fees, dry_run=options['dry_run'])
+        verb = "would be" if options['dry_run'] else "were"
+        self.stdout.write(f"{marked} student fees {verb} marked as overridden")
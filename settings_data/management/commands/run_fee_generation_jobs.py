@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from settings_data.models import FeeGenerationJob
+from settings_data.services import run_fee_generation_job
+
+
+class Command(BaseCommand):
+    help = "Run pending or failed fee generation jobs (e.g. after a restart interrupted them)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--include-running', action='store_true',
+                            help="Also reset and re-run jobs stuck in 'running'")
+
+    def handle(self, *args, **options):
+        if options['include_running']:
+            FeeGenerationJob.objects.filter(
+                status=FeeGenerationJob.STATUS_RUNNING
+            ).update(status=FeeGenerationJob.STATUS_PENDING)
+
+        job_ids = FeeGenerationJob.objects.filter(
+            status__in=[FeeGenerationJob.STATUS_PENDING, FeeGenerationJob.STATUS_FAILED]
+        ).order_by('created_at').values_list('id', flat=True)
+
+        for job_id in list(job_ids):
+            job = run_fee_generation_job(job_id)
+            if job:
+                self.stdout.write(
+                    f"{job.school_year}: {job.status} - {job.created_fees} fees for {job.processed_students} students"
+                )
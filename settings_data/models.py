@@ -1,6 +1,7 @@
 from django.db import models
 import uuid
-from django.db.models import Q
+from django.db.models import Q, F, Value, ExpressionWrapper
+from django.db.models.functions import Coalesce, Greatest
 from users.models import Account, CustomUser  # ✅ assuming you have these models
 
 class EmployeeType(models.Model):
@@ -35,11 +36,76 @@ class SchoolYear(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
+    # When fees without an installment schedule are due; used by the ageing report
+    fee_due_date = models.DateField(null=True, blank=True)
 
     def __str__(self):
         return self.label
 
 
+class FeeGenerationJob(models.Model):
+    """
+    Tracks the background job that creates per-student SchoolFee rows
+    for a newly created SchoolYear
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='fee_generation_jobs')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='fee_generation_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    total_students = models.PositiveIntegerField(default=0)
+    processed_students = models.PositiveIntegerField(default=0)
+    created_fees = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def progress(self):
+        """Percentage of students processed (0-100)"""
+        if self.status == self.STATUS_COMPLETED:
+            return 100
+        if not self.total_students:
+            return 0
+        return min(int(self.processed_students * 100 / self.total_students), 100)
+
+    def __str__(self):
+        return f"Fee generation for {self.school_year} ({self.status})"
+
+
+def _fee_amount(field):
+    return Coalesce(F(field), Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+# Database-side versions of the SchoolFee total methods, used by the generated columns below
+FEE_TOTAL_BEFORE_DISCOUNT = ExpressionWrapper(
+    _fee_amount('school_fee') + _fee_amount('books_fee') + _fee_amount('trans_fee') + _fee_amount('clothes_fee'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2)
+)
+FEE_DISCOUNT = ExpressionWrapper(
+    FEE_TOTAL_BEFORE_DISCOUNT * _fee_amount('discount_percentage') / Value(100) + _fee_amount('discount_amount'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2)
+)
+FEE_TOTAL_AFTER_DISCOUNT = Greatest(
+    FEE_TOTAL_BEFORE_DISCOUNT - FEE_DISCOUNT, Value(0),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2)
+)
+
+
 class SchoolFee(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     school_class = models.ForeignKey('students.SchoolClass', on_delete=models.SET_NULL, null=True, blank=True)
@@ -70,6 +136,10 @@ class SchoolFee(models.Model):
 
     clothes_fee_paid = models.BooleanField(default=False, null=True, blank=True)
 
+    # True once a student's fee amounts were edited by hand; propagation from the
+    # class / default fee skips overridden rows
+    is_overridden = models.BooleanField(default=False)
+
     school_year = models.ForeignKey(
         'settings_data.SchoolYear',
         on_delete=models.SET_NULL,
@@ -83,6 +153,24 @@ class SchoolFee(models.Model):
 
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='school_fees', null=True, blank=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Computed and stored by the database so totals can be filtered, sorted and summed in SQL
+    total_fees_before_discount = models.GeneratedField(
+        expression=FEE_TOTAL_BEFORE_DISCOUNT,
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
+    discount_amount_calculated = models.GeneratedField(
+        expression=FEE_DISCOUNT,
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
+    total_fees_after_discount = models.GeneratedField(
+        expression=FEE_TOTAL_AFTER_DISCOUNT,
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
 
     def get_total_fees_before_discount(self):
         """Calculate total fees before applying discount"""
@@ -132,4 +220,114 @@ class SchoolFee(models.Model):
                 condition=Q(school_class__isnull=True, student__isnull=True)  # Only one default per account
             )
         ]
-        
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['account', 'school_year', 'student'], name='schoolfee_acct_year_student'),
+            models.Index(fields=['account', 'school_year', 'total_fees_after_discount'], name='schoolfee_acct_year_total'),
+        ]
+
+
+class OpeningBalance(models.Model):
+    """
+    Unpaid balance carried from a closing school year into the next one
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='opening_balances')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='opening_balances')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='opening_balances')
+    source_year = models.ForeignKey(
+        SchoolYear,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='carried_balances'
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        return f"Opening balance {self.amount} for {self.student} ({self.school_year})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'school_year'],
+                name='unique_opening_balance_per_student_year'
+            )
+        ]
+
+
+class SchoolFeeTotals(models.Model):
+    """
+    Cached fee totals per (account, school year) for the fees summary card.
+    Rows are deleted whenever an input changes and recomputed on next read.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='school_fee_totals')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='fee_totals')
+
+    total_before_discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_after_discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    student_count = models.PositiveIntegerField(default=0)
+
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fee totals for {self.school_year} ({self.total_after_discount})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'school_year'],
+                name='unique_fee_totals_per_account_year'
+            )
+        ]
+
+
+
+class FeeInstallment(models.Model):
+    """
+    One scheduled payment of a student's SchoolFee.
+    paid_amount / status are maintained by the allocator from the student's Recipients.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PARTIAL = 'partial'
+    STATUS_PAID = 'paid'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PARTIAL, 'Partially paid'),
+        (STATUS_PAID, 'Paid'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='fee_installments')
+    school_fee = models.ForeignKey(SchoolFee, on_delete=models.CASCADE, related_name='installments')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='fee_installments')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='fee_installments')
+
+    number = models.PositiveSmallIntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def remaining_amount(self):
+        return max(self.amount - self.paid_amount, 0)
+
+    def __str__(self):
+        return f"Installment {self.number} of {self.school_fee} due {self.due_date}"
+
+    class Meta:
+        ordering = ['due_date', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['school_fee', 'number'], name='unique_installment_number_per_fee')
+        ]
+        indexes = [
+            models.Index(fields=['account', 'due_date', 'status'], name='installment_acct_due_status'),
+            models.Index(fields=['student', 'school_year', 'due_date'], name='installment_student_year_due'),
+        ]
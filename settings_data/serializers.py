@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import EmployeeType, AuthorizedPayer, SchoolFee, SchoolYear
+from students.models import Student, SchoolClass
+from utils.account_context import get_active_school_year
+from .models import EmployeeType, AuthorizedPayer, SchoolFee, SchoolYear, FeeGenerationJob, FeeInstallment
 
 class EmployeeTypeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,14 +14,26 @@ class AuthorizedPayerSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class SchoolFeeSerializer(serializers.ModelSerializer):
-    total_fees_before_discount = serializers.ReadOnlyField(source='get_total_fees_before_discount')
-    discount_amount_calculated = serializers.ReadOnlyField(source='get_discount_amount_calculated')
-    total_fees_after_discount = serializers.ReadOnlyField(source='get_total_fees_after_discount')
-    
+    # total_fees_before_discount, discount_amount_calculated and total_fees_after_discount
+    # are database-generated columns and come through as read-only model fields
+
+    GENERATED_FIELDS = ['total_fees_before_discount', 'discount_amount_calculated', 'total_fees_after_discount']
+
     class Meta:
         model = SchoolFee
         exclude = ['account', 'created_by']
 
+    def create(self, validated_data):
+        instance = super().create(validated_data)
+        # Generated totals are computed by the database on write
+        instance.refresh_from_db(fields=self.GENERATED_FIELDS)
+        return instance
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        instance.refresh_from_db(fields=self.GENERATED_FIELDS)
+        return instance
+
     def to_representation(self, instance):
         """Ensure all fields are properly represented"""
         data = super().to_representation(instance)
@@ -58,4 +72,155 @@ class SchoolFeeSerializer(serializers.ModelSerializer):
 class SchoolYearSerializer(serializers.ModelSerializer):
     class Meta:
         model = SchoolYear
-        fields = ['id', 'label', 'is_active', 'start_date', 'end_date']
\ No newline at end of file
+        fields = ['id', 'label', 'is_active', 'start_date', 'end_date', 'fee_due_date']
+
+class FeeGenerationJobSerializer(serializers.ModelSerializer):
+    progress = serializers.ReadOnlyField()
+
+    class Meta:
+        model = FeeGenerationJob
+        fields = [
+            'id', 'school_year', 'status', 'progress', 'total_students',
+            'processed_students', 'created_fees', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+
+
+class YearRolloverSerializer(serializers.Serializer):
+    source_year = serializers.PrimaryKeyRelatedField(queryset=SchoolYear.objects.all())
+    uplift_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, required=False, default=0)
+    rounding = serializers.ChoiceField(choices=['none', 'unit', 'ten', 'hundred'], required=False, default='none')
+    class_mapping = serializers.DictField(child=serializers.UUIDField(), required=False, default=dict)
+    copy_fees = serializers.BooleanField(required=False, default=True)
+    carry_balances = serializers.BooleanField(required=False, default=True)
+    dry_run = serializers.BooleanField(required=False, default=True)
+
+    def validate_source_year(self, value):
+        request = self.context.get('request')
+        if request and value.account_id != request.user.account_id:
+            raise serializers.ValidationError("السنة الدراسية غير موجودة")
+        return value
+
+    def validate_uplift_percentage(self, value):
+        if value < -100 or value > 100:
+            raise serializers.ValidationError("نسبة الزيادة يجب أن تكون بين -100 و 100")
+        return value
+
+
+class SchoolFeeGridRowSerializer(serializers.Serializer):
+    """One (student, school_year) row of the fee grid; omitted fee fields are left unchanged"""
+    student = serializers.UUIDField()
+    school_year = serializers.UUIDField()
+    school_fee = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    books_fee = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    trans_fee = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    clothes_fee = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    discount_percentage = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False
+    )
+    discount_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    clothes_fee_paid = serializers.BooleanField(required=False)
+
+
+class SchoolFeeGridSerializer(serializers.Serializer):
+    """
+    Validates a whole fee grid in memory.
+    Student and school year ownership is checked with one query each, not per row.
+    """
+    MAX_ROWS = 2000
+
+    rows = SchoolFeeGridRowSerializer(many=True, allow_empty=False, max_length=MAX_ROWS)
+
+    def validate_rows(self, rows):
+        account = self.context['request'].user.account
+
+        keys = [(row['student'], row['school_year']) for row in rows]
+        if len(set(keys)) != len(keys):
+            raise serializers.ValidationError("لا يمكن تكرار نفس الطالب لنفس السنة الدراسية")
+
+        student_ids = {row['student'] for row in rows}
+        year_ids = {row['school_year'] for row in rows}
+        found_students = set(
+            Student.objects.filter(account=account, id__in=student_ids).values_list('id', flat=True)
+        )
+        found_years = set(
+            SchoolYear.objects.filter(account=account, id__in=year_ids).values_list('id', flat=True)
+        )
+
+        errors = []
+        for row in rows:
+            row_errors = {}
+            if row['student'] not in found_students:
+                row_errors['student'] = "الطالب غير موجود"
+            if row['school_year'] not in found_years:
+                row_errors['school_year'] = "السنة الدراسية غير موجودة"
+            errors.append(row_errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return rows
+
+
+class DiscountPolicySerializer(serializers.Serializer):
+    """A discount and the rules selecting which students it applies to"""
+    school_year = serializers.PrimaryKeyRelatedField(queryset=SchoolYear.objects.all(), required=False)
+    discount_percentage = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False, default=0
+    )
+    discount_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, default=0)
+    school_class_ids = serializers.ListField(child=serializers.UUIDField(), required=False, default=list)
+    min_paid = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0, required=False, allow_null=True)
+    min_siblings = serializers.IntegerField(min_value=2, required=False, allow_null=True)
+
+    def validate_school_year(self, value):
+        request = self.context.get('request')
+        if request and value.account_id != request.user.account_id:
+            raise serializers.ValidationError("السنة الدراسية غير موجودة")
+        return value
+
+    def validate(self, data):
+        if not data.get('school_year'):
+            account = self.context['request'].user.account
+            data['school_year'] = get_active_school_year(account)
+            if data['school_year'] is None:
+                raise serializers.ValidationError({'school_year': "لا يوجد سنة دراسية مفعلة حالياً"})
+        return data
+
+    def get_policy(self):
+        """Validated data without the school year, in the shape the discount services expect"""
+        policy = dict(self.validated_data)
+        policy.pop('school_year')
+        policy['school_class_ids'] = sorted(str(class_id) for class_id in policy['school_class_ids'])
+        return policy
+
+
+class FeeInstallmentSerializer(serializers.ModelSerializer):
+    remaining_amount = serializers.ReadOnlyField()
+    student_name = serializers.CharField(source='student.__str__', read_only=True)
+
+    class Meta:
+        model = FeeInstallment
+        fields = [
+            'id', 'school_fee', 'student', 'student_name', 'school_year', 'number',
+            'due_date', 'amount', 'paid_amount', 'remaining_amount', 'status'
+        ]
+        read_only_fields = fields
+
+
+class InstallmentPlanSerializer(serializers.Serializer):
+    """Schedule request: either `installments` monthly dates from start_date, or explicit due_dates"""
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all(), required=False, allow_null=True)
+    installments = serializers.IntegerField(min_value=1, max_value=24, required=False, default=10)
+    start_date = serializers.DateField(required=False, allow_null=True)
+    due_dates = serializers.ListField(child=serializers.DateField(), required=False, max_length=24)
+    replace = serializers.BooleanField(required=False, default=False)
+
+    def validate_school_class(self, value):
+        request = self.context.get('request')
+        if value and request and value.account_id != request.user.account_id:
+            raise serializers.ValidationError("الصف غير موجود")
+        return value
+
+    def validate_due_dates(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("لا يمكن تكرار تاريخ الاستحقاق")
+        return value
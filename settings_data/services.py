@@ -0,0 +1,1184 @@
+# settings_data/services.py
+import calendar
+import hashlib
+import json
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, UUIDField, Value, When,
+    Window
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from students.models import Student, SchoolClass, StudentPaymentHistory
+from utils.background import run_in_background
+from utils.cache import bump_data_version, get_data_version
+from .models import FeeGenerationJob, FeeInstallment, SchoolFee, SchoolYear, OpeningBalance, SchoolFeeTotals
+
+logger = logging.getLogger(__name__)
+
+FEE_GENERATION_CHUNK_SIZE = 500
+
+ROLLOVER_CHUNK_SIZE = 500
+
+INSTALLMENT_CHUNK_SIZE = 500
+
+DEFAULT_INSTALLMENT_COUNT = 10
+
+# Fee amounts that are uplifted on rollover (discounts are copied as-is)
+FEE_AMOUNT_FIELDS = ['school_fee', 'books_fee', 'trans_fee', 'clothes_fee']
+
+ROUNDING_STEPS = {
+    'none': Decimal('0.01'),
+    'unit': Decimal('1'),
+    'ten': Decimal('10'),
+    'hundred': Decimal('100'),
+}
+
+# Ageing buckets as (key, min days overdue, max days overdue); None means open-ended
+AGEING_BUCKETS = [
+    ('current', None, 0),
+    ('days_1_30', 1, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_over_90', 91, None),
+]
+
+AGEING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# How long a discount simulation result stays cached (fee edits invalidate it earlier)
+DISCOUNT_SIMULATION_TIMEOUT = 60 * 10
+
+# Fields copied from a template fee (class-level or account default) to a student fee
+FEE_TEMPLATE_FIELDS = [
+    'school_fee', 'books_fee', 'trans_fee', 'clothes_fee',
+    'clothes_fee_paid', 'discount_percentage', 'discount_amount',
+]
+
+
+def get_template_fees(account, school_year):
+    """
+    Return (default_fee, {class_id: class_fee}) for the account.
+    Class fees tied to the given year win over class fees without a year.
+    """
+    default_fee = SchoolFee.objects.filter(
+        account=account,
+        school_class__isnull=True,
+        student__isnull=True
+    ).first()
+
+    class_fees = {}
+    class_fee_qs = SchoolFee.objects.filter(
+        account=account,
+        school_class__isnull=False,
+        student__isnull=True
+    ).filter(
+        Q(school_year=school_year) | Q(school_year__isnull=True)
+    )
+    for fee in class_fee_qs:
+        current = class_fees.get(fee.school_class_id)
+        if current is None or (current.school_year_id is None and fee.school_year_id):
+            class_fees[fee.school_class_id] = fee
+
+    return default_fee, class_fees
+
+
+def template_values(template):
+    """Field values a student fee inherits from a template fee"""
+    values = {field: getattr(template, field) or 0 for field in FEE_TEMPLATE_FIELDS}
+    values['clothes_fee_paid'] = template.clothes_fee_paid or False
+    return values
+
+
+def students_missing_fee(account, school_year):
+    """Non-archived students of the account without a SchoolFee for the year"""
+    existing_fee = SchoolFee.objects.filter(student=OuterRef('pk'), school_year=school_year)
+    return Student.objects.filter(
+        account=account,
+        is_archived=False
+    ).filter(~Exists(existing_fee))
+
+
+def queue_fee_generation(school_year, user=None):
+    """Create a FeeGenerationJob for the year and run it after commit"""
+    job = FeeGenerationJob.objects.create(
+        account=school_year.account,
+        school_year=school_year,
+        created_by=user
+    )
+    run_in_background(run_fee_generation_job, job.id)
+    return job
+
+
+def run_fee_generation_job(job_id, chunk_size=FEE_GENERATION_CHUNK_SIZE):
+    """
+    Generate per-student fees for the job's school year in chunks.
+
+    Precedence is student -> class -> default: students that already have a
+    fee for the year are skipped, the rest copy their class fee when one
+    exists and the account default otherwise. Safe to run more than once.
+    """
+    # Claim the job so two workers never process it at the same time
+    claimed = FeeGenerationJob.objects.filter(
+        pk=job_id,
+        status__in=[FeeGenerationJob.STATUS_PENDING, FeeGenerationJob.STATUS_FAILED]
+    ).update(status=FeeGenerationJob.STATUS_RUNNING, started_at=timezone.now(), error=None)
+    if not claimed:
+        return None
+
+    job = FeeGenerationJob.objects.select_related('account', 'school_year', 'created_by').get(pk=job_id)
+
+    try:
+        account = job.account
+        school_year = job.school_year
+        default_fee, class_fees = get_template_fees(account, school_year)
+
+        pending = students_missing_fee(account, school_year)
+        FeeGenerationJob.objects.filter(pk=job.pk).update(
+            total_students=pending.count(),
+            processed_students=0,
+            created_fees=0
+        )
+
+        # Keyset pagination keeps every chunk a cheap indexed range scan
+        last_pk = None
+        while True:
+            rows = pending.order_by('pk')
+            if last_pk is not None:
+                rows = rows.filter(pk__gt=last_pk)
+            chunk = list(rows.values_list('id', 'school_class_id')[:chunk_size])
+            if not chunk:
+                break
+            _create_fee_chunk(job, chunk, default_fee, class_fees)
+            last_pk = chunk[-1][0]
+
+        FeeGenerationJob.objects.filter(pk=job.pk).update(
+            status=FeeGenerationJob.STATUS_COMPLETED,
+            finished_at=timezone.now()
+        )
+        # bulk_create skips signals
+        invalidate_fee_totals(account.pk, school_year.pk)
+    except Exception as e:
+        logger.exception(f"Fee generation job {job.pk} failed")
+        FeeGenerationJob.objects.filter(pk=job.pk).update(
+            status=FeeGenerationJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now()
+        )
+
+    job.refresh_from_db()
+    return job
+
+
+def _create_fee_chunk(job, chunk, default_fee, class_fees):
+    student_ids = [student_id for student_id, _ in chunk]
+
+    with transaction.atomic():
+        # Re-check inside the transaction in case fees were added meanwhile
+        already_has_fee = set(
+            SchoolFee.objects.filter(
+                student_id__in=student_ids,
+                school_year=job.school_year
+            ).values_list('student_id', flat=True)
+        )
+
+        fees_to_create = []
+        for student_id, class_id in chunk:
+            if student_id in already_has_fee:
+                continue
+            template = class_fees.get(class_id) or default_fee
+            if template is None:
+                continue
+            fees_to_create.append(SchoolFee(
+                student_id=student_id,
+                school_year=job.school_year,
+                account=job.account,
+                created_by=job.created_by,
+                **template_values(template)
+            ))
+
+        SchoolFee.objects.bulk_create(fees_to_create, batch_size=len(chunk))
+        FeeGenerationJob.objects.filter(pk=job.pk).update(
+            processed_students=F('processed_students') + len(chunk),
+            created_fees=F('created_fees') + len(fees_to_create)
+        )
+
+
+def bulk_upsert_student_fees(account, rows, user):
+    """
+    Create or update per-student fees from validated grid rows in one transaction.
+    Existing fees are locked and fetched in one query, then written with
+    bulk_create / bulk_update. Returns (created_ids, updated_ids).
+    """
+    editable = FEE_AMOUNT_FIELDS + ['discount_percentage', 'discount_amount', 'clothes_fee_paid']
+    student_ids = {row['student'] for row in rows}
+    year_ids = {row['school_year'] for row in rows}
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {}
+        for fee in SchoolFee.objects.select_for_update().filter(
+            account=account,
+            student_id__in=student_ids,
+            school_year_id__in=year_ids
+        ).order_by('created_at'):
+            # Keep the oldest row if duplicates exist, like update_by_student's .first()
+            existing.setdefault((fee.student_id, fee.school_year_id), fee)
+
+        to_create, to_update = [], []
+        update_fields = set()
+        for row in rows:
+            values = {field: row[field] for field in editable if field in row}
+            if any(field in row for field in FEE_AMOUNT_FIELDS):
+                values['is_overridden'] = True
+            fee = existing.get((row['student'], row['school_year']))
+            if fee:
+                for field, value in values.items():
+                    setattr(fee, field, value)
+                fee.updated_at = now
+                update_fields.update(values)
+                to_update.append(fee)
+            else:
+                to_create.append(SchoolFee(
+                    account=account,
+                    student_id=row['student'],
+                    school_year_id=row['school_year'],
+                    created_by=user,
+                    **values
+                ))
+
+        SchoolFee.objects.bulk_create(to_create)
+        if to_update and update_fields:
+            SchoolFee.objects.bulk_update(to_update, sorted(update_fields | {'updated_at'}))
+            resplit_installments([fee.pk for fee in to_update])
+
+    for school_year_id in year_ids:
+        invalidate_fee_totals(account.id, school_year_id)
+
+    return [fee.id for fee in to_create], [fee.id for fee in to_update]
+
+
+def compute_fee_totals(account, school_year):
+    """
+    Aggregate fees of the account's non-archived students for the year.
+    Scoped with an Exists subquery so it uses the (account, school_year, student) index.
+    """
+    active_student = Student.objects.filter(
+        pk=OuterRef('student_id'),
+        account=account,
+        is_archived=False
+    )
+    totals = SchoolFee.objects.filter(
+        account=account,
+        school_year=school_year
+    ).filter(
+        Exists(active_student)
+    ).aggregate(
+        total_before_discount=Sum('total_fees_before_discount'),
+        total_discount=Sum('discount_amount_calculated'),
+        total_after_discount=Sum('total_fees_after_discount'),
+        student_count=Count('student', distinct=True)
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def get_fee_totals(account, school_year):
+    """Return the cached SchoolFeeTotals row, computing it on a miss"""
+    totals = SchoolFeeTotals.objects.filter(account=account, school_year=school_year).first()
+    if totals is None:
+        totals, _ = SchoolFeeTotals.objects.update_or_create(
+            account=account,
+            school_year=school_year,
+            defaults=compute_fee_totals(account, school_year)
+        )
+    return totals
+
+
+def invalidate_fee_totals(account_id, school_year_id=None):
+    """
+    Drop cached totals for the account (optionally a single year).
+    Runs after commit so a concurrent read can't re-cache pre-commit data.
+    """
+    if not account_id:
+        return
+
+    def _invalidate():
+        totals = SchoolFeeTotals.objects.filter(account_id=account_id)
+        if school_year_id:
+            totals = totals.filter(school_year_id=school_year_id)
+        totals.delete()
+        bump_fee_version(account_id)
+
+    transaction.on_commit(_invalidate)
+
+
+def bump_fee_version(account_id):
+    """Change the account's fee version so cached fee computations are ignored"""
+    bump_data_version(account_id, 'fees')
+
+
+def get_fee_version(account_id):
+    return get_data_version(account_id, 'fees')
+
+
+def discount_policy_fees(account, school_year, policy):
+    """
+    Per-student fees of non-archived students that a discount policy applies to.
+
+    policy keys (all optional except the discount itself):
+      school_class_ids - only students in these classes
+      min_paid         - only students who already paid at least this much in the year
+      min_siblings     - only students with at least this many students (themselves included)
+                         sharing their parent_phone
+    """
+    from payments.models import Recipient
+
+    decimal_field = DecimalField(max_digits=12, decimal_places=2)
+    fees = SchoolFee.objects.filter(
+        account=account,
+        school_year=school_year,
+        student__isnull=False,
+        student__is_archived=False
+    )
+
+    if policy.get('school_class_ids'):
+        fees = fees.filter(student__school_class_id__in=policy['school_class_ids'])
+
+    if policy.get('min_paid'):
+        paid = Recipient.objects.filter(
+            student=OuterRef('student'),
+            school_year=school_year
+        ).values('student').annotate(total=Sum('amount')).values('total')
+        fees = fees.annotate(
+            paid_total=Coalesce(Subquery(paid, output_field=decimal_field), Value(0), output_field=decimal_field)
+        ).filter(paid_total__gte=policy['min_paid'])
+
+    if policy.get('min_siblings'):
+        siblings = Student.objects.filter(
+            account=account,
+            is_archived=False,
+            parent_phone=OuterRef('student__parent_phone')
+        ).values('parent_phone').annotate(total=Count('id')).values('total')
+        fees = fees.exclude(
+            Q(student__parent_phone__isnull=True) | Q(student__parent_phone='')
+        ).annotate(
+            sibling_count=Subquery(siblings)
+        ).filter(sibling_count__gte=policy['min_siblings'])
+
+    return fees
+
+
+def _discounted_total_expression(policy):
+    """SQL for what total_fees_after_discount would become under the policy"""
+    decimal_field = DecimalField(max_digits=12, decimal_places=2)
+    percentage = Value(Decimal(policy.get('discount_percentage') or 0), output_field=decimal_field)
+    amount = Value(Decimal(policy.get('discount_amount') or 0), output_field=decimal_field)
+    return Greatest(
+        F('total_fees_before_discount')
+        - F('total_fees_before_discount') * percentage / Value(100, output_field=decimal_field)
+        - amount,
+        Value(0, output_field=decimal_field),
+        output_field=decimal_field
+    )
+
+
+def _policy_cache_key(account_id, school_year_id, policy):
+    payload = json.dumps(
+        {'school_year': str(school_year_id), **policy},
+        sort_keys=True,
+        default=str
+    )
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    return f'discount-sim:{account_id}:{get_fee_version(account_id)}:{digest}', digest
+
+
+def simulate_discount(account, school_year, policy):
+    """
+    Before/after totals and per-class impact of a discount policy, in one grouped query.
+    Results are cached per policy hash until the account's fees change.
+    """
+    cache_key, digest = _policy_cache_key(account.id, school_year.id, policy)
+    result = cache.get(cache_key)
+    if result is not None:
+        return result
+
+    rows = discount_policy_fees(account, school_year, policy).values(
+        'student__school_class_id', 'student__school_class__name'
+    ).annotate(
+        student_count=Count('student', distinct=True),
+        total_before=Sum('total_fees_after_discount'),
+        total_after=Sum(_discounted_total_expression(policy)),
+    ).order_by('student__school_class__name')
+
+    classes = []
+    for row in rows:
+        total_before = row['total_before'] or Decimal('0')
+        total_after = row['total_after'] or Decimal('0')
+        classes.append({
+            'school_class': row['student__school_class_id'],
+            'school_class_name': row['student__school_class__name'],
+            'student_count': row['student_count'],
+            'total_before': total_before,
+            'total_after': total_after,
+            'difference': total_after - total_before,
+        })
+
+    total_before = sum((row['total_before'] for row in classes), Decimal('0'))
+    total_after = sum((row['total_after'] for row in classes), Decimal('0'))
+    result = {
+        'simulation_id': digest,
+        'school_year': school_year.id,
+        'student_count': sum(row['student_count'] for row in classes),
+        'total_before': total_before,
+        'total_after': total_after,
+        'difference': total_after - total_before,
+        'classes': classes,
+    }
+    cache.set(cache_key, result, DISCOUNT_SIMULATION_TIMEOUT)
+    return result
+
+
+def apply_discount_policy(account, school_year, policy):
+    """Apply a discount policy with a single UPDATE; returns the number of fees changed"""
+    fees = discount_policy_fees(account, school_year, policy)
+    with transaction.atomic():
+        updated_count = fees.update(
+            discount_percentage=policy.get('discount_percentage') or 0,
+            discount_amount=policy.get('discount_amount') or 0,
+            updated_at=timezone.now()
+        )
+        resplit_installments(fees.values('pk'))
+        invalidate_fee_totals(account.id, school_year.id)
+    return updated_count
+
+
+def refresh_fee_totals(account, school_year):
+    """Recompute the cached SchoolFeeTotals row now, inside the caller's transaction"""
+    SchoolFeeTotals.objects.update_or_create(
+        account=account,
+        school_year=school_year,
+        defaults=compute_fee_totals(account, school_year)
+    )
+    bump_fee_version(account.pk)
+
+
+def inherited_student_fees(template, school_year):
+    """
+    Non-overridden student fees of school_year that inherit from template,
+    a class fee or the account default, using get_template_fees precedence.
+    """
+    account = template.account
+    fees = SchoolFee.objects.filter(
+        account=account,
+        school_year=school_year,
+        student__isnull=False,
+        student__is_archived=False,
+        is_overridden=False
+    )
+
+    default_fee, class_fees = get_template_fees(account, school_year)
+    if template.school_class_id:
+        if class_fees.get(template.school_class_id) != template:
+            # A year-specific fee for the class takes precedence over this one
+            return fees.none()
+        return fees.filter(student__school_class_id=template.school_class_id)
+
+    if default_fee != template:
+        return fees.none()
+    return fees.exclude(student__school_class_id__in=list(class_fees))
+
+
+def propagate_template_fee(template, school_year, dry_run=False):
+    """
+    Copy a class / default fee's amounts to every inheriting student fee
+    with one UPDATE and refresh the year's totals in the same transaction.
+    Returns the number of student fees changed (or that would change).
+    """
+    # Only rows that actually differ count as changed
+    fees = inherited_student_fees(template, school_year).filter(_differs_from(template))
+
+    if dry_run:
+        return fees.count()
+
+    with transaction.atomic():
+        # After the UPDATE the rows no longer differ, so remember which ones change
+        fee_ids = list(fees.select_for_update(of=('self',)).values_list('pk', flat=True))
+        updated_count = SchoolFee.objects.filter(pk__in=fee_ids).update(
+            updated_at=timezone.now(),
+            **{field: getattr(template, field) or 0 for field in FEE_AMOUNT_FIELDS}
+        )
+        if updated_count:
+            resplit_installments(fee_ids)
+            refresh_fee_totals(template.account, school_year)
+    return updated_count
+
+
+def _differs_from(template):
+    """Q matching fees whose amounts differ from the template's"""
+    differs = Q()
+    for field in FEE_AMOUNT_FIELDS:
+        value = getattr(template, field) or 0
+        differs |= ~Q(**{field: value}) | Q(**{f'{field}__isnull': True})
+    return differs
+
+
+def mark_overridden_fees(fees=None, dry_run=False):
+    """
+    Flag student fees whose amounts differ from the class / default fee they
+    inherit as is_overridden, so propagation leaves hand-edited fees alone.
+    Meant for fees written before is_overridden existed; run it once before
+    propagating. Returns the number of fees flagged (or that would be).
+    """
+    if fees is None:
+        fees = SchoolFee.objects.all()
+    pairs = fees.filter(
+        student__isnull=False, school_year__isnull=False, is_overridden=False
+    ).values_list('account_id', 'school_year_id').distinct()
+
+    marked = 0
+    for account_id, school_year_id in pairs:
+        school_year = SchoolYear.objects.get(pk=school_year_id)
+        default_fee, class_fees = get_template_fees(account_id, school_year)
+        templates = [default_fee] if default_fee else []
+        templates += class_fees.values()
+        for template in templates:
+            differing = inherited_student_fees(template, school_year).filter(
+                _differs_from(template), pk__in=fees.values('pk')
+            )
+            if dry_run:
+                marked += differing.count()
+                continue
+            updated = differing.update(is_overridden=True, updated_at=timezone.now())
+            if updated:
+                bump_fee_version(account_id)
+            marked += updated
+    return marked
+
+
+def apply_uplift(amount, percentage, rounding='none'):
+    """Increase amount by percentage and round to the given step"""
+    amount = Decimal(amount or 0)
+    if percentage:
+        amount = amount * (1 + Decimal(percentage) / 100)
+    step = ROUNDING_STEPS[rounding]
+    return ((amount / step).quantize(Decimal('1'), rounding=ROUND_HALF_UP) * step).quantize(Decimal('0.01'))
+
+
+def _uplifted_values(fee_values, uplift_percentage, rounding):
+    values = {
+        field: apply_uplift(fee_values[field], uplift_percentage, rounding)
+        for field in FEE_AMOUNT_FIELDS
+    }
+    values['discount_percentage'] = fee_values['discount_percentage'] or 0
+    values['discount_amount'] = fee_values['discount_amount'] or 0
+    values['clothes_fee_paid'] = False
+    values['is_overridden'] = fee_values['is_overridden']
+    return values
+
+
+def _chunks(queryset, chunk_size):
+    """Yield lists of values() rows from queryset using keyset pagination on pk"""
+    last_pk = None
+    while True:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]['id']
+
+
+def closing_balances(account, source_year):
+    """
+    Students of the account with an unpaid balance in source_year.
+    balance = fee after discount + opening balance - paid
+    """
+    from payments.models import Recipient
+
+    decimal_field = DecimalField(max_digits=12, decimal_places=2)
+    paid = Recipient.objects.filter(
+        student=OuterRef('student'),
+        school_year=source_year
+    ).values('student').annotate(total=Sum('amount')).values('total')
+    opening = OpeningBalance.objects.filter(
+        student=OuterRef('student'),
+        school_year=source_year
+    ).values('amount')[:1]
+    closed = StudentPaymentHistory.objects.filter(
+        student=OuterRef('student'),
+        year=source_year.label
+    )
+
+    return SchoolFee.objects.filter(
+        account=account,
+        school_year=source_year,
+        student__isnull=False,
+        student__is_archived=False
+    ).filter(
+        ~Exists(closed)
+    ).annotate(
+        balance=ExpressionWrapper(
+            F('total_fees_after_discount')
+            + Coalesce(Subquery(opening, output_field=decimal_field), Value(0), output_field=decimal_field)
+            - Coalesce(Subquery(paid, output_field=decimal_field), Value(0), output_field=decimal_field),
+            output_field=decimal_field
+        )
+    ).filter(balance__gt=0)
+
+
+def with_opening_balance(students, school_year):
+    """
+    Annotate a Student queryset with opening_balance_amount, the balance each
+    student carried into school_year (None when nothing was carried), so
+    serializers don't look it up per student.
+    """
+    if school_year is None:
+        return students
+    opening = OpeningBalance.objects.filter(student=OuterRef('pk'), school_year=school_year).values('amount')[:1]
+    return students.annotate(opening_balance_amount=Subquery(opening))
+
+
+def students_owing(account, school_year, min_balance=0):
+    """
+    Non-archived students of the account whose balance for school_year is above min_balance.
+    The applicable fee falls back student -> class -> default, like get_payment_summary.
+    Annotates fee_total, paid_total and balance; everything is resolved in one query.
+    """
+    from payments.models import Recipient
+
+    decimal_field = DecimalField(max_digits=12, decimal_places=2)
+    year_fees = SchoolFee.objects.filter(account=account, school_year=school_year)
+    student_fee = year_fees.filter(student=OuterRef('pk')).values('total_fees_after_discount')[:1]
+    class_fee = year_fees.filter(
+        student__isnull=True, school_class=OuterRef('school_class')
+    ).values('total_fees_after_discount')[:1]
+    default_fee = year_fees.filter(
+        student__isnull=True, school_class__isnull=True
+    ).values('total_fees_after_discount')[:1]
+    paid = Recipient.objects.filter(
+        student=OuterRef('pk'),
+        school_year=school_year
+    ).values('student').annotate(total=Sum('amount')).values('total')
+    opening = OpeningBalance.objects.filter(
+        student=OuterRef('pk'),
+        school_year=school_year
+    ).values('amount')[:1]
+    closed = StudentPaymentHistory.objects.filter(
+        student=OuterRef('pk'),
+        year=school_year.label
+    )
+
+    return Student.objects.filter(
+        account=account,
+        is_archived=False
+    ).filter(
+        ~Exists(closed)
+    ).annotate(
+        fee_total=Coalesce(
+            Subquery(student_fee, output_field=decimal_field),
+            Subquery(class_fee, output_field=decimal_field),
+            Subquery(default_fee, output_field=decimal_field),
+            Value(0),
+            output_field=decimal_field
+        ),
+        paid_total=Coalesce(Subquery(paid, output_field=decimal_field), Value(0), output_field=decimal_field),
+    ).annotate(
+        balance=ExpressionWrapper(
+            F('fee_total')
+            + Coalesce(Subquery(opening, output_field=decimal_field), Value(0), output_field=decimal_field)
+            - F('paid_total'),
+            output_field=decimal_field
+        )
+    ).filter(balance__gt=min_balance)
+
+
+def rollover_school_year(source_year, target_year, uplift_percentage=0, rounding='none',
+                         class_mapping=None, copy_fees=True, carry_balances=True,
+                         dry_run=False, user=None, chunk_size=ROLLOVER_CHUNK_SIZE):
+    """
+    Roll an account over from source_year into target_year.
+
+    - copies class-level and per-student fees with an optional uplift and rounding
+    - carries unpaid balances into target_year as OpeningBalance rows
+    - optionally promotes students using class_mapping {old_class_id: new_class_id}
+
+    Returns a report of what was (or, with dry_run, would be) changed.
+    """
+    account = target_year.account
+    class_mapping = {str(k): str(v) for k, v in (class_mapping or {}).items()}
+    fee_fields = ['id', 'school_class_id', 'student_id', 'is_overridden'] + FEE_AMOUNT_FIELDS + [
+        'discount_percentage', 'discount_amount'
+    ]
+
+    class_fees = SchoolFee.objects.filter(
+        account=account, school_year=source_year, student__isnull=True, school_class__isnull=False
+    ).values(*fee_fields)
+    student_fees = SchoolFee.objects.filter(
+        account=account, school_year=source_year, student__isnull=False, student__is_archived=False
+    ).values(*fee_fields)
+    balances = closing_balances(account, source_year)
+    promotions = Student.objects.filter(
+        account=account, is_archived=False, school_class_id__in=list(class_mapping)
+    )
+
+    # Totals are computed in the database before anything is written
+    source_totals = SchoolFee.objects.filter(
+        account=account, school_year=source_year, student__isnull=False, student__is_archived=False
+    ).aggregate(**{field: Sum(field) for field in FEE_AMOUNT_FIELDS})
+    report = {
+        'dry_run': dry_run,
+        'class_fees': class_fees.count() if copy_fees else 0,
+        'student_fees': student_fees.count() if copy_fees else 0,
+        'source_fee_totals': {field: source_totals[field] or 0 for field in FEE_AMOUNT_FIELDS},
+        # Uplift applied to the totals; per-row rounding can shift this slightly
+        'target_fee_totals': {
+            field: apply_uplift(source_totals[field], uplift_percentage, rounding)
+            for field in FEE_AMOUNT_FIELDS
+        },
+        'balances_carried': 0,
+        'balances_total': 0,
+        'students_promoted': promotions.count() if class_mapping else 0,
+    }
+    if carry_balances:
+        balance_totals = balances.aggregate(total=Sum('balance'))
+        report['balances_carried'] = balances.count()
+        report['balances_total'] = balance_totals['total'] or 0
+
+    if dry_run:
+        return report
+
+    if copy_fees:
+        for rows in _chunks(class_fees, chunk_size):
+            _copy_fee_chunk(rows, 'school_class_id', target_year, uplift_percentage, rounding, user)
+        for rows in _chunks(student_fees, chunk_size):
+            _copy_fee_chunk(rows, 'student_id', target_year, uplift_percentage, rounding, user)
+
+        invalidate_fee_totals(account.pk, target_year.pk)
+
+    if carry_balances:
+        for rows in _chunks(balances.values('id', 'student_id', 'balance'), chunk_size):
+            _carry_balance_chunk(rows, source_year, target_year, user)
+        # Opening balances are bulk written without signals; they feed balance
+        # reports and the opening_balance of student payloads
+        bump_fee_version(account.pk)
+        bump_data_version(account.pk, 'student_records')
+
+    if class_mapping:
+        valid_classes = set(
+            str(class_id) for class_id in SchoolClass.objects.filter(
+                account=account, id__in=list(class_mapping.values())
+            ).values_list('id', flat=True)
+        )
+        whens = [
+            When(school_class_id=old_id, then=Value(uuid.UUID(new_id)))
+            for old_id, new_id in class_mapping.items()
+            if new_id in valid_classes
+        ]
+        # One UPDATE with CASE so chained mappings (A->B, B->C) don't cascade
+        if whens:
+            with transaction.atomic():
+                report['students_promoted'] = promotions.update(
+                    school_class_id=Case(*whens, default=F('school_class_id'), output_field=UUIDField()),
+                    updated_at=timezone.now()
+                )
+                # update() skips signals; class lists show student counts
+                bump_data_version(account.pk, 'classes')
+
+    return report
+
+
+def _copy_fee_chunk(rows, key_field, target_year, uplift_percentage, rounding, user):
+    keys = [row[key_field] for row in rows]
+    lookup = {f'{key_field}__in': keys, 'school_year': target_year}
+    if key_field == 'school_class_id':
+        lookup['student__isnull'] = True
+
+    with transaction.atomic():
+        existing = {
+            getattr(fee, key_field): fee
+            for fee in SchoolFee.objects.select_for_update().filter(account=target_year.account, **lookup)
+        }
+        to_create, to_update = [], []
+        seen = set()
+        for row in rows:
+            if row[key_field] in seen:
+                continue
+            seen.add(row[key_field])
+            values = _uplifted_values(row, uplift_percentage, rounding)
+            fee = existing.get(row[key_field])
+            if fee:
+                for field, value in values.items():
+                    setattr(fee, field, value)
+                fee.updated_at = timezone.now()
+                to_update.append(fee)
+            else:
+                to_create.append(SchoolFee(
+                    account=target_year.account,
+                    school_year=target_year,
+                    school_class_id=row['school_class_id'] if key_field == 'school_class_id' else None,
+                    student_id=row['student_id'],
+                    created_by=user,
+                    **values
+                ))
+        SchoolFee.objects.bulk_create(to_create)
+        SchoolFee.objects.bulk_update(
+            to_update,
+            FEE_AMOUNT_FIELDS + ['discount_percentage', 'discount_amount', 'clothes_fee_paid', 'is_overridden', 'updated_at']
+        )
+        resplit_installments([fee.pk for fee in to_update])
+
+
+def _carry_balance_chunk(rows, source_year, target_year, user):
+    with transaction.atomic():
+        existing = {
+            balance.student_id: balance
+            for balance in OpeningBalance.objects.select_for_update().filter(
+                school_year=target_year,
+                student_id__in=[row['student_id'] for row in rows]
+            )
+        }
+        to_create, to_update = [], []
+        for row in rows:
+            amount = Decimal(row['balance']).quantize(Decimal('0.01'))
+            balance = existing.get(row['student_id'])
+            if balance:
+                balance.amount = amount
+                balance.source_year = source_year
+                to_update.append(balance)
+            else:
+                to_create.append(OpeningBalance(
+                    account=target_year.account,
+                    student_id=row['student_id'],
+                    school_year=target_year,
+                    source_year=source_year,
+                    amount=amount,
+                    created_by=user
+                ))
+        OpeningBalance.objects.bulk_create(to_create)
+        OpeningBalance.objects.bulk_update(to_update, ['amount', 'source_year'])
+
+
+def add_months(start, months):
+    """start shifted by whole months, clamped to the end of shorter months"""
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def installment_due_dates(school_year, count=DEFAULT_INSTALLMENT_COUNT, start_date=None, due_dates=None):
+    """Custom due dates when given, otherwise count monthly dates from start_date / the year start"""
+    if due_dates:
+        return sorted(due_dates)
+    start = start_date or school_year.start_date or timezone.localdate()
+    return [add_months(start, i) for i in range(count)]
+
+
+def split_amount(total, count):
+    """Equal installments rounded to 0.01; the last one absorbs the rounding difference"""
+    total = Decimal(total or 0)
+    part = (total / count).quantize(Decimal('0.01'))
+    return [part] * (count - 1) + [total - part * (count - 1)]
+
+
+def generate_installments(account, school_year, school_class=None, count=DEFAULT_INSTALLMENT_COUNT,
+                          start_date=None, due_dates=None, replace=False,
+                          chunk_size=INSTALLMENT_CHUNK_SIZE):
+    """
+    Create installment schedules for every student fee of the year (optionally one class).
+    Fees that already have a schedule are skipped unless replace is set.
+    Works in keyset-paginated chunks with one bulk insert each, then allocates
+    existing payments. Returns the number of fees scheduled.
+    """
+    dates = installment_due_dates(school_year, count, start_date, due_dates)
+    fees = SchoolFee.objects.filter(
+        account=account,
+        school_year=school_year,
+        student__isnull=False,
+        student__is_archived=False
+    )
+    if school_class is not None:
+        fees = fees.filter(student__school_class=school_class)
+
+    if not replace:
+        fees = fees.filter(~Exists(FeeInstallment.objects.filter(school_fee=OuterRef('pk'))))
+
+    scheduled = 0
+    student_ids = []
+    # A replaced schedule must never be left half deleted / half written
+    with transaction.atomic():
+        if replace:
+            FeeInstallment.objects.filter(school_fee__in=fees).delete()
+
+        for rows in _chunks(fees.values('id', 'student_id', 'total_fees_after_discount'), chunk_size):
+            installments = []
+            for row in rows:
+                for number, (due_date, amount) in enumerate(
+                    zip(dates, split_amount(row['total_fees_after_discount'], len(dates))), start=1
+                ):
+                    installments.append(FeeInstallment(
+                        account=account,
+                        school_fee_id=row['id'],
+                        student_id=row['student_id'],
+                        school_year=school_year,
+                        number=number,
+                        due_date=due_date,
+                        amount=amount
+                    ))
+            FeeInstallment.objects.bulk_create(installments)
+            scheduled += len(rows)
+            student_ids.extend(row['student_id'] for row in rows)
+
+        if student_ids:
+            allocate_payments(account, school_year, student_ids)
+        transaction.on_commit(lambda: bump_fee_version(account.pk))
+    return scheduled
+
+
+def resplit_installments(fees):
+    """
+    Bring the schedules of fees back in line with their current total_fees_after_discount.
+    Paid installments keep their amount; what is left of the total is split again over
+    the unpaid ones (a fully paid schedule gets any increase on its last installment).
+    Call it in the transaction that changed the fees. Returns the number of installments changed.
+    """
+    installments = FeeInstallment.objects.filter(school_fee__in=fees).annotate(
+        fee_total=F('school_fee__total_fees_after_discount')
+    ).only('id', 'account_id', 'school_fee_id', 'student_id', 'school_year_id', 'amount', 'status').order_by(
+        'school_fee_id', 'due_date', 'number'
+    )
+
+    schedules = {}
+    for installment in installments:
+        schedules.setdefault(installment.school_fee_id, []).append(installment)
+
+    now = timezone.now()
+    changed = []
+    affected = {}
+    for schedule in schedules.values():
+        paid = [i for i in schedule if i.status == FeeInstallment.STATUS_PAID]
+        unpaid = [i for i in schedule if i.status != FeeInstallment.STATUS_PAID]
+        remaining = Decimal(schedule[0].fee_total or 0) - sum((i.amount for i in paid), Decimal('0'))
+        if unpaid:
+            amounts = split_amount(max(remaining, Decimal('0')), len(unpaid))
+        else:
+            unpaid, amounts = [schedule[-1]], [schedule[-1].amount + max(remaining, Decimal('0'))]
+        for installment, amount in zip(unpaid, amounts):
+            if installment.amount != amount:
+                installment.amount = amount
+                installment.updated_at = now
+                changed.append(installment)
+                affected.setdefault((installment.account_id, installment.school_year_id), set()).add(
+                    installment.student_id
+                )
+
+    FeeInstallment.objects.bulk_update(changed, ['amount', 'updated_at'], batch_size=INSTALLMENT_CHUNK_SIZE)
+
+    # New amounts move where each payment lands
+    for (account_id, school_year_id), student_ids in affected.items():
+        allocate_payments(account_id, school_year_id, list(student_ids))
+        transaction.on_commit(lambda account_id=account_id: bump_fee_version(account_id))
+    return len(changed)
+
+
+def allocate_payments(account, school_year, student_ids=None):
+    """
+    Spread each student's payments for the year over their installments in due-date order.
+    The running total per schedule is computed with a window function, so this is one
+    read and one bulk update regardless of the number of students.
+    Returns the number of installments whose paid amount changed.
+    """
+    from payments.models import Recipient
+
+    decimal_field = DecimalField(max_digits=12, decimal_places=2)
+    paid = Recipient.objects.filter(
+        student=OuterRef('student'),
+        school_year=school_year
+    ).values('student').annotate(total=Sum('amount')).values('total')
+
+    installments = FeeInstallment.objects.filter(account=account, school_year=school_year)
+    if student_ids is not None:
+        installments = installments.filter(student_id__in=student_ids)
+    installments = installments.annotate(
+        paid_total=Coalesce(Subquery(paid, output_field=decimal_field), Value(0), output_field=decimal_field),
+        due_through=Window(
+            Sum('amount'),
+            partition_by=[F('school_fee_id')],
+            order_by=[F('due_date').asc(), F('number').asc()]
+        )
+    ).only('id', 'amount', 'paid_amount', 'status')
+
+    changed = []
+    for installment in installments:
+        # Whatever was paid beyond the earlier installments goes to this one
+        covered = installment.paid_total - (installment.due_through - installment.amount)
+        paid_amount = min(max(covered, Decimal('0')), installment.amount)
+        if paid_amount >= installment.amount:
+            new_status = FeeInstallment.STATUS_PAID
+        elif paid_amount > 0:
+            new_status = FeeInstallment.STATUS_PARTIAL
+        else:
+            new_status = FeeInstallment.STATUS_PENDING
+        if paid_amount != installment.paid_amount or new_status != installment.status:
+            installment.paid_amount = paid_amount
+            installment.status = new_status
+            installment.updated_at = timezone.now()
+            changed.append(installment)
+
+    FeeInstallment.objects.bulk_update(
+        changed, ['paid_amount', 'status', 'updated_at'], batch_size=INSTALLMENT_CHUNK_SIZE
+    )
+    return len(changed)
+
+
+def overdue_installments(account, as_of=None):
+    """Unpaid installments due before as_of (default today); served by the (account, due_date, status) index"""
+    return FeeInstallment.objects.filter(
+        account=account,
+        due_date__lt=as_of or timezone.localdate(),
+        status__in=[FeeInstallment.STATUS_PENDING, FeeInstallment.STATUS_PARTIAL]
+    )
+
+
+def _ageing_bucket(days_overdue):
+    for key, low, high in AGEING_BUCKETS:
+        if (low is None or days_overdue >= low) and (high is None or days_overdue <= high):
+            return key
+
+
+def _due_date_buckets(field, as_of):
+    """Q filters per ageing bucket for a due date field"""
+    filters = {}
+    for key, low, high in AGEING_BUCKETS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(**{f'{field}__lte': as_of - timedelta(days=low)})
+        if high is not None:
+            condition &= Q(**{f'{field}__gte': as_of - timedelta(days=high)})
+        filters[key] = condition
+    return filters
+
+
+def receivables_ageing(account, school_year, as_of=None):
+    """
+    Outstanding balances per class bucketed by days overdue, plus account totals.
+
+    Scheduled fees are aged per installment due date with conditional aggregation
+    in one grouped query. Fees without a schedule are aged as a whole from
+    school_year.fee_due_date (or the year start) in a second grouped query.
+    Installments only cover the year's fee, so a scheduled student's opening
+    balance is aged from the year start in a third; payments go to the
+    installments first, as allocate_payments does, and the rest to it.
+    Cached per account, year and day until fees, balances or payments change.
+    """
+    from payments.models import Recipient
+
+    as_of = as_of or timezone.localdate()
+    cache_key = f'ageing:{account.pk}:{school_year.pk}:{as_of.isoformat()}:{get_fee_version(account.pk)}'
+    report = cache.get(cache_key)
+    if report is not None:
+        return report
+
+    decimal_field = DecimalField(max_digits=14, decimal_places=2)
+    zero = Value(0, output_field=decimal_field)
+    outstanding = ExpressionWrapper(F('amount') - F('paid_amount'), output_field=decimal_field)
+    bucket_filters = _due_date_buckets('due_date', as_of)
+
+    classes = {}
+
+    def class_row(class_id, class_name):
+        key = str(class_id) if class_id else None
+        if key not in classes:
+            classes[key] = {
+                'school_class': class_id,
+                'school_class_name': class_name,
+                **{bucket: Decimal('0') for bucket, _, _ in AGEING_BUCKETS},
+                'total': Decimal('0'),
+            }
+        return classes[key]
+
+    scheduled = FeeInstallment.objects.filter(
+        account=account,
+        school_year=school_year,
+        student__is_archived=False,
+        status__in=[FeeInstallment.STATUS_PENDING, FeeInstallment.STATUS_PARTIAL]
+    ).values(
+        'student__school_class_id', 'student__school_class__name'
+    ).annotate(**{
+        bucket: Coalesce(Sum(outstanding, filter=condition), zero)
+        for bucket, condition in bucket_filters.items()
+    }).order_by()
+    for row in scheduled:
+        target = class_row(row['student__school_class_id'], row['student__school_class__name'])
+        for bucket, _, _ in AGEING_BUCKETS:
+            target[bucket] += row[bucket]
+
+    due_date = school_year.fee_due_date or school_year.start_date
+    unscheduled_bucket = _ageing_bucket((as_of - due_date).days) if due_date else 'current'
+    unscheduled = students_owing(account, school_year).filter(
+        ~Exists(FeeInstallment.objects.filter(student=OuterRef('pk'), school_year=school_year))
+    ).values(
+        'school_class_id', 'school_class__name'
+    ).annotate(outstanding=Sum('balance')).order_by()
+    for row in unscheduled:
+        target = class_row(row['school_class_id'], row['school_class__name'])
+        target[unscheduled_bucket] += row['outstanding'] or 0
+
+    year_installments = FeeInstallment.objects.filter(student=OuterRef('pk'), school_year=school_year)
+    scheduled_total = year_installments.values('student').annotate(total=Sum('amount')).values('total')
+    paid = Recipient.objects.filter(
+        student=OuterRef('pk'),
+        school_year=school_year
+    ).values('student').annotate(total=Sum('amount')).values('total')
+    opening = OpeningBalance.objects.filter(student=OuterRef('pk'), school_year=school_year).values('amount')[:1]
+    opening_bucket = (
+        _ageing_bucket((as_of - school_year.start_date).days) if school_year.start_date else unscheduled_bucket
+    )
+    scheduled_opening = Student.objects.filter(
+        Exists(year_installments),
+        account=account,
+        is_archived=False
+    ).annotate(
+        opening_amount=Coalesce(Subquery(opening, output_field=decimal_field), zero),
+        overpaid=Greatest(
+            Coalesce(Subquery(paid, output_field=decimal_field), zero)
+            - Coalesce(Subquery(scheduled_total, output_field=decimal_field), zero),
+            zero
+        ),
+    ).filter(
+        opening_amount__gt=F('overpaid')
+    ).values(
+        'school_class_id', 'school_class__name'
+    ).annotate(
+        outstanding=Sum(ExpressionWrapper(F('opening_amount') - F('overpaid'), output_field=decimal_field))
+    ).order_by()
+    for row in scheduled_opening:
+        target = class_row(row['school_class_id'], row['school_class__name'])
+        target[opening_bucket] += row['outstanding'] or 0
+
+    rows = sorted(classes.values(), key=lambda row: row['school_class_name'] or '')
+    totals = {bucket: Decimal('0') for bucket, _, _ in AGEING_BUCKETS}
+    for row in rows:
+        row['total'] = sum(row[bucket] for bucket, _, _ in AGEING_BUCKETS)
+        for bucket in totals:
+            totals[bucket] += row[bucket]
+    totals['total'] = sum(totals.values())
+
+    report = {
+        'school_year': school_year.pk,
+        'as_of': as_of,
+        'buckets': [bucket for bucket, _, _ in AGEING_BUCKETS],
+        'classes': rows,
+        'totals': totals,
+    }
+    cache.set(cache_key, report, AGEING_CACHE_TIMEOUT)
+    return report
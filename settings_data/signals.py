@@ -0,0 +1,116 @@
+# settings_data/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from payments.models import PaymentType, Recipient
+from students.models import Student
+from utils.account_context import invalidate_account_context
+from .models import AuthorizedPayer, EmployeeType, OpeningBalance, SchoolFee, SchoolYear
+from .services import (
+    FEE_AMOUNT_FIELDS, allocate_payments, bump_fee_version, invalidate_fee_totals, resplit_installments
+)
+
+
+@receiver([post_save, post_delete], sender=SchoolFee)
+def school_fee_changed(sender, instance, **kwargs):
+    # Only per-student fees feed the totals
+    if instance.student_id:
+        invalidate_fee_totals(instance.account_id, instance.school_year_id)
+
+
+@receiver(post_save, sender=SchoolFee)
+def school_fee_total_changed(sender, instance, created, update_fields=None, **kwargs):
+    # A new fee has no schedule yet; saves that leave the amounts alone keep theirs
+    if created or not instance.student_id:
+        return
+    if update_fields is not None and not set(update_fields) & set(FEE_AMOUNT_FIELDS + ['discount_percentage', 'discount_amount']):
+        return
+    resplit_installments([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=OpeningBalance)
+def opening_balance_changed(sender, instance, **kwargs):
+    # Carried balances feed balance reports such as receivables ageing
+    account_id = instance.account_id
+    transaction.on_commit(lambda: bump_fee_version(account_id))
+
+
+@receiver(post_init, sender=Student)
+def remember_archive_state(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred field doesn't trigger a query
+    instance._loaded_is_archived = instance.__dict__.get('is_archived')
+
+
+@receiver(post_save, sender=Student)
+def student_archive_changed(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'is_archived' not in update_fields:
+        return
+    if not created and instance.is_archived != instance._loaded_is_archived:
+        invalidate_fee_totals(instance.account_id)
+    instance._loaded_is_archived = instance.is_archived
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    invalidate_fee_totals(instance.account_id)
+
+
+@receiver([post_save, post_delete], sender=SchoolYear)
+def school_year_changed(sender, instance, **kwargs):
+    invalidate_fee_totals(instance.account_id)
+    invalidate_account_context(instance.account_id, 'active_year')
+
+
+@receiver([post_save, post_delete], sender=EmployeeType)
+def employee_type_changed(sender, instance, **kwargs):
+    invalidate_account_context(instance.account_id, 'employee_types')
+
+
+@receiver([post_save, post_delete], sender=AuthorizedPayer)
+def authorized_payer_changed(sender, instance, **kwargs):
+    invalidate_account_context(instance.account_id, 'authorized_payers')
+
+
+@receiver([post_save, post_delete], sender=PaymentType)
+def payment_type_changed(sender, instance, **kwargs):
+    invalidate_account_context(instance.account_id, 'payment_types')
+
+
+def _reallocate_installments(recipient):
+    # Payments feed balances, so cached balance reports must be recomputed
+    account_id = recipient.account_id
+    if account_id:
+        transaction.on_commit(lambda: bump_fee_version(account_id))
+    if not recipient.school_year_id:
+        return
+    account_id, school_year_id, student_id = recipient.account_id, recipient.school_year_id, recipient.student_id
+
+    def _allocate():
+        school_year = SchoolYear.objects.filter(pk=school_year_id).first()
+        if school_year:
+            allocate_payments(account_id, school_year, [student_id])
+
+    transaction.on_commit(_allocate)
+
+
+@receiver(pre_save, sender=Recipient)
+def remember_recipient_target(sender, instance, **kwargs):
+    # A receipt moved to another student / year must release the old installments too
+    if instance.pk:
+        instance._previous_target = Recipient.objects.filter(pk=instance.pk).values(
+            'account_id', 'school_year_id', 'student_id'
+        ).first()
+
+
+@receiver(post_save, sender=Recipient)
+def recipient_saved(sender, instance, **kwargs):
+    _reallocate_installments(instance)
+    previous = getattr(instance, '_previous_target', None)
+    if previous and (previous['student_id'], previous['school_year_id']) != (instance.student_id, instance.school_year_id):
+        _reallocate_installments(Recipient(**previous))
+
+
+@receiver(post_delete, sender=Recipient)
+def recipient_deleted(sender, instance, **kwargs):
+    _reallocate_installments(instance)
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EmployeeTypeViewSet, AuthorizedPayerViewSet, SchoolFeeViewSet, SchoolYearViewSet
+from .views import EmployeeTypeViewSet, AuthorizedPayerViewSet, SchoolFeeViewSet, SchoolYearViewSet, FeeInstallmentViewSet
 
 router = DefaultRouter()
 router.register('employee-types', EmployeeTypeViewSet)
 router.register('authorized-payers', AuthorizedPayerViewSet)
 router.register('school-fees', SchoolFeeViewSet)
 router.register('school-years', SchoolYearViewSet)
+router.register('installments', FeeInstallmentViewSet)
 
 urlpatterns = router.urls
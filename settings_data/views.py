@@ -1,19 +1,39 @@
+import csv
+from datetime import date
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-
-from students.models import Student
-from .models import EmployeeType, AuthorizedPayer, SchoolFee, SchoolYear
-from .serializers import EmployeeTypeSerializer, AuthorizedPayerSerializer, SchoolFeeSerializer, SchoolYearSerializer
-from logs.utils import log_activity
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
+
+from .models import EmployeeType, AuthorizedPayer, SchoolFee, SchoolYear, FeeInstallment
+from .serializers import (
+    EmployeeTypeSerializer, AuthorizedPayerSerializer, SchoolFeeSerializer, SchoolYearSerializer,
+    FeeGenerationJobSerializer, YearRolloverSerializer, SchoolFeeGridSerializer,
+    DiscountPolicySerializer, FeeInstallmentSerializer, InstallmentPlanSerializer
+)
+from .filters import SchoolFeeFilter
+from .services import (
+    queue_fee_generation, rollover_school_year, get_fee_totals, invalidate_fee_totals, bulk_upsert_student_fees,
+    simulate_discount, apply_discount_policy, propagate_template_fee, FEE_AMOUNT_FIELDS,
+    generate_installments, overdue_installments, receivables_ageing, resplit_installments, AGEING_BUCKETS
+)
+from logs.utils import log_activity, serializer_changes
+from utils.account_context import ReferenceListMixin, get_active_school_year, invalidate_account_context
+from utils.cache import CachedListMixin, bump_data_version
+from utils.conditional import ConditionalGetMixin
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Case, When, Value
-from django.db.models.functions import Greatest
 
 
-class EmployeeTypeViewSet(viewsets.ModelViewSet):
+class EmployeeTypeViewSet(ReferenceListMixin, viewsets.ModelViewSet):
     queryset = EmployeeType.objects.all()
     serializer_class = EmployeeTypeSerializer
+    # Small per-account table, served from the account context cache
+    reference_set = 'employee_types'
 
     def get_queryset(self):
         return EmployeeType.objects.filter(account=self.request.user.account)
@@ -39,9 +59,11 @@ class EmployeeTypeViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class AuthorizedPayerViewSet(viewsets.ModelViewSet):
+class AuthorizedPayerViewSet(ReferenceListMixin, viewsets.ModelViewSet):
     queryset = AuthorizedPayer.objects.all()
     serializer_class = AuthorizedPayerSerializer
+    # Small per-account table, served from the account context cache
+    reference_set = 'authorized_payers'
 
     def get_queryset(self):
         return AuthorizedPayer.objects.filter(account=self.request.user.account)
@@ -66,65 +88,144 @@ class AuthorizedPayerViewSet(viewsets.ModelViewSet):
         )
         instance.delete()
 
-class SchoolYearViewSet(viewsets.ModelViewSet):
+class SchoolYearViewSet(ConditionalGetMixin, CachedListMixin, viewsets.ModelViewSet):
     serializer_class = SchoolYearSerializer
     permission_classes = [IsAuthenticated]
     queryset = SchoolYear.objects.all()
+    cache_scopes = ['school_years']
+    etag_updated_field = None
     
     def get_queryset(self):
         return SchoolYear.objects.filter(account=self.request.user.account)
 
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        # Fees are generated in the background; hand back the job so the UI can poll it
+        response.data['fee_generation_job'] = FeeGenerationJobSerializer(self._fee_generation_job).data
+        return response
+
     def perform_create(self, serializer):
-        # 1. Create the new school year
         school_year = serializer.save(account=self.request.user.account, created_by=self.request.user)
+        self._fee_generation_job = queue_fee_generation(school_year, user=self.request.user)
+
+    @action(detail=True, methods=['get', 'post'], url_path='fee-generation')
+    def fee_generation(self, request, pk=None):
+        """GET: progress of the latest fee generation job. POST: queue a new run"""
+        school_year = self.get_object()
+
+        if request.method == 'POST':
+            job = queue_fee_generation(school_year, user=request.user)
+            return Response(FeeGenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        job = school_year.fee_generation_jobs.order_by('-created_at').first()
+        if not job:
+            return Response({"detail": "لا توجد عملية توليد رسوم لهذه السنة"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(FeeGenerationJobSerializer(job).data)
+
+    @action(detail=True, methods=['post'], url_path='rollover')
+    def rollover(self, request, pk=None):
+        """
+        Roll fees, unpaid balances and (optionally) class placements from a
+        closing year into this year. Defaults to a dry run that only reports totals.
+        """
+        target_year = self.get_object()
+        serializer = YearRolloverSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        if options['source_year'].pk == target_year.pk:
+            return Response(
+                {"error": "لا يمكن ترحيل السنة إلى نفسها"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # 2. Get the default school fee
-        default_fee = SchoolFee.objects.filter(
-            account=self.request.user.account,
-            school_class__isnull=True,
-            student__isnull=True
-        ).first()
-
-        if not default_fee:
-            return  # No default to apply
-
-        # 3. Get all non-archived students
-        students = Student.objects.filter(account=self.request.user.account, is_archived=False)
-
-        # 4. Bulk create school fee records for those students
-        fees_to_create = []
-        for student in students:
-            fees_to_create.append(SchoolFee(
-                student=student,
-                school_year=school_year,
-                school_fee=default_fee.school_fee or 0,
-                books_fee=default_fee.books_fee or 0,
-                trans_fee=default_fee.trans_fee or 0,
-                clothes_fee=default_fee.clothes_fee or 0,
-                clothes_fee_paid=default_fee.clothes_fee_paid or False,
-                discount_percentage=default_fee.discount_percentage or 0,
-                discount_amount=default_fee.discount_amount or 0,
-                account=self.request.user.account,
-                created_by=self.request.user
-            ))
-
-        SchoolFee.objects.bulk_create(fees_to_create)
+        report = rollover_school_year(
+            source_year=options['source_year'],
+            target_year=target_year,
+            uplift_percentage=options['uplift_percentage'],
+            rounding=options['rounding'],
+            class_mapping=options['class_mapping'],
+            copy_fees=options['copy_fees'],
+            carry_balances=options['carry_balances'],
+            dry_run=options['dry_run'],
+            user=request.user
+        )
+
+        if not options['dry_run']:
+            log_activity(
+                user=request.user,
+                account=request.user.account,
+                note=f"تم ترحيل السنة الدراسية {options['source_year'].label} إلى {target_year.label}",
+                related_model='SchoolYear',
+                related_id=str(target_year.id)
+            )
+
+        return Response(report)
+
+    @action(detail=True, methods=['post'], url_path='installments')
+    def installments(self, request, pk=None):
+        """
+        Create installment schedules for the year's student fees (optionally one class).
+        Body: {"school_class", "installments": 10, "start_date"} or {"due_dates": [...]}, plus "replace"
+        """
+        school_year = self.get_object()
+        serializer = InstallmentPlanSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        scheduled = generate_installments(
+            request.user.account,
+            school_year,
+            school_class=data.get('school_class'),
+            count=data['installments'],
+            start_date=data.get('start_date'),
+            due_dates=data.get('due_dates'),
+            replace=data['replace']
+        )
+
+        log_activity(
+            user=request.user,
+            account=request.user.account,
+            note=f"تم إنشاء جدول دفعات لـ {scheduled} طالب للسنة {school_year.label}",
+            related_model='SchoolYear',
+            related_id=str(school_year.id)
+        )
+        return Response({"scheduled_fees": scheduled}, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['patch'], url_path='deactivate')
     def deactivate_all(self, request):
         SchoolYear.objects.filter(account=request.user.account, is_active=True).update(is_active=False)
+        invalidate_fee_totals(request.user.account_id)
+        # update() skips signals
+        invalidate_account_context(request.user.account_id, 'active_year')
+        bump_data_version(request.user.account_id, 'school_years')
         return Response({"detail": "Deactivated previous active years"})
 
 
-class SchoolFeeViewSet(viewsets.ModelViewSet):
+class SchoolFeeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = SchoolFee.objects.all()
     serializer_class = SchoolFeeSerializer
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = SchoolFeeFilter
+    ordering_fields = ['total_fees_before_discount', 'discount_amount_calculated', 'total_fees_after_discount', 'created_at']
+    # Fee rows show student and class names
+    etag_scopes = ['classes']
 
     def get_queryset(self):
         return SchoolFee.objects.filter(account=self.request.user.account)
 
+    def _override_kwargs(self, serializer):
+        """Mark a student's fee as overridden when its amounts are edited by hand"""
+        data = serializer.validated_data
+        student = data.get('student', getattr(serializer.instance, 'student', None))
+        if student and 'is_overridden' not in data and any(field in data for field in FEE_AMOUNT_FIELDS):
+            return {'is_overridden': True}
+        return {}
+
     def perform_create(self, serializer):
-        instance = serializer.save(account=self.request.user.account, created_by=self.request.user)
+        instance = serializer.save(
+            account=self.request.user.account, created_by=self.request.user, **self._override_kwargs(serializer)
+        )
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
@@ -134,13 +235,17 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
         )
 
     def perform_update(self, serializer):
-        instance = serializer.save(account=self.request.user.account)
+        changes = serializer_changes(serializer)
+        # The fee and its re-split installment schedule are written together
+        with transaction.atomic():
+            instance = serializer.save(account=self.request.user.account, **self._override_kwargs(serializer))
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
             note="تم تعديل رسوم مدرسية",
             related_model='SchoolFee',
-            related_id=str(instance.id)
+            related_id=str(instance.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -209,10 +314,12 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             print(f"✅ Data is valid, saving...")
             
-            school_fee = serializer.save(
-                account=request.user.account, 
-                created_by=request.user
-            )
+            with transaction.atomic():
+                school_fee = serializer.save(
+                    account=request.user.account, 
+                    created_by=request.user,
+                    **self._override_kwargs(serializer)
+                )
             
             print(f"💾 Saved fee: ID={school_fee.id}, discount_percentage={school_fee.discount_percentage}, discount_amount={school_fee.discount_amount}")
             
@@ -232,6 +339,75 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
             print(f"❌ Validation errors: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update_fees(self, request):
+        """
+        Create or update fees for many students in one request.
+        Body: {"rows": [{"student", "school_year", "school_fee", ..., "discount_amount"}, ...]}
+        """
+        serializer = SchoolFeeGridSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        created_ids, updated_ids = bulk_upsert_student_fees(
+            request.user.account, serializer.validated_data['rows'], request.user
+        )
+
+        log_activity(
+            user=request.user,
+            account=request.user.account,
+            note=f"تم تعديل رسوم {len(updated_ids)} طالب وإنشاء رسوم {len(created_ids)} طالب",
+            related_model='SchoolFee',
+            related_id=None
+        )
+
+        # Re-read in one query so the generated totals are populated on every backend
+        fees = SchoolFee.objects.filter(id__in=created_ids + updated_ids)
+        return Response({
+            "created_count": len(created_ids),
+            "updated_count": len(updated_ids),
+            "fees": self.get_serializer(fees, many=True).data
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='propagate')
+    def propagate(self, request, pk=None):
+        """
+        Push a class or default fee's amounts to every student fee inheriting it.
+        Body: {"school_year": <id, defaults to the fee's year or the active year>, "dry_run": false}
+        """
+        template = self.get_object()
+        if template.student_id:
+            return Response(
+                {"error": "يمكن نشر رسوم الصف أو الرسوم الافتراضية فقط"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        school_year_id = request.data.get('school_year') or template.school_year_id
+        if school_year_id:
+            school_year = SchoolYear.objects.filter(account=request.user.account, id=school_year_id).first()
+        else:
+            school_year = get_active_school_year(request.user.account)
+        if not school_year:
+            return Response({"detail": "لا يوجد سنة دراسية مفعلة حالياً"}, status=status.HTTP_404_NOT_FOUND)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('true', '1')
+        updated_count = propagate_template_fee(template, school_year, dry_run=dry_run)
+
+        if not dry_run:
+            target = f"الصف {template.school_class}" if template.school_class_id else "الرسوم الافتراضية"
+            log_activity(
+                user=request.user,
+                account=request.user.account,
+                note=f"تم نشر {target} على رسوم {updated_count} طالب",
+                related_model='SchoolFee',
+                related_id=str(template.id)
+            )
+
+        return Response({
+            "dry_run": dry_run,
+            "school_year": school_year.id,
+            "updated_count": updated_count
+        })
+
     @action(detail=False, methods=['patch'], url_path='toggle-clothes-payment')
     def toggle_clothes_payment(self, request):
         """Toggle clothes fee payment status for a specific student"""
@@ -253,7 +429,7 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
             )
             
             school_fee.clothes_fee_paid = clothes_fee_paid
-            school_fee.save(update_fields=['clothes_fee_paid'])
+            school_fee.save(update_fields=['clothes_fee_paid', 'updated_at'])
             
             log_activity(
                 user=request.user,
@@ -276,67 +452,58 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
     def current_year_total(self, request):
         account = request.user.account
 
-        active_year = SchoolYear.objects.filter(account=account, is_active=True).first()
+        active_year = get_active_school_year(account)
         if not active_year:
             return Response({"detail": "لا يوجد سنة دراسية مفعلة حالياً"}, status=404)
 
-        # Get non-archived student IDs
-        student_ids = Student.objects.filter(is_archived=False).values_list('id', flat=True)
-
-        # Calculate total fees before discount
-        total_fees_before_discount = ExpressionWrapper(
-            F('school_fee') + F('books_fee') + F('trans_fee') + F('clothes_fee'),
-            output_field=DecimalField()
-        )
-
-        # Calculate percentage discount
-        percentage_discount = ExpressionWrapper(
-            (F('school_fee') + F('books_fee') + F('trans_fee') + F('clothes_fee')) * 
-            F('discount_percentage') / 100,
-            output_field=DecimalField()
-        )
-
-        # Calculate total discount (percentage + fixed amount)
-        total_discount = ExpressionWrapper(
-            percentage_discount + F('discount_amount'),
-            output_field=DecimalField()
-        )
-
-        # Calculate final total after discount (cannot be negative)
-        # Use Greatest to ensure the result is never negative
-        total_after_discount = ExpressionWrapper(
-            Greatest(
-                (F('school_fee') + F('books_fee') + F('trans_fee') + F('clothes_fee')) - 
-                (((F('school_fee') + F('books_fee') + F('trans_fee') + F('clothes_fee')) * F('discount_percentage') / 100) + F('discount_amount')),
-                Value(0)
-            ),
-            output_field=DecimalField()
-        )
-
-        # Get aggregated totals
-        aggregated_data = (
-            SchoolFee.objects
-            .filter(account=account, school_year=active_year, student__in=student_ids)
-            .annotate(
-                total_before_discount=total_fees_before_discount,
-                total_discount_amount=total_discount,
-                total_after_discount=total_after_discount
-            )
-            .aggregate(
-                total_before_discount_sum=Sum('total_before_discount'),
-                total_discount_sum=Sum('total_discount_amount'),
-                total_after_discount_sum=Sum('total_after_discount')
-            )
-        )
+        totals = get_fee_totals(account, active_year)
 
         return Response({
-            "total_school_fees_before_discount": aggregated_data['total_before_discount_sum'] or 0,
-            "total_discount_amount": aggregated_data['total_discount_sum'] or 0,
-            "total_school_fees_after_discount": aggregated_data['total_after_discount_sum'] or 0,
+            "total_school_fees_before_discount": totals.total_before_discount,
+            "total_discount_amount": totals.total_discount,
+            "total_school_fees_after_discount": totals.total_after_discount,
             # Keep backward compatibility
-            "total_school_fees": aggregated_data['total_after_discount_sum'] or 0
+            "total_school_fees": totals.total_after_discount
         })
 
+    @action(detail=False, methods=['get'], url_path='ageing')
+    def ageing(self, request):
+        """
+        Outstanding balances per class by days overdue.
+        ?school_year=<id> (defaults to the active year), ?as_of=YYYY-MM-DD, ?export=csv
+        """
+        account = request.user.account
+        school_year_id = request.query_params.get('school_year')
+        if school_year_id:
+            school_year = SchoolYear.objects.filter(account=account, id=school_year_id).first()
+        else:
+            school_year = get_active_school_year(account)
+        if not school_year:
+            return Response({"detail": "لا يوجد سنة دراسية مفعلة حالياً"}, status=404)
+
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = date.fromisoformat(as_of)
+            except ValueError:
+                return Response({"error": "تاريخ غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = receivables_ageing(account, school_year, as_of)
+
+        if request.query_params.get('export') == 'csv':
+            buckets = [bucket for bucket, _, _ in AGEING_BUCKETS]
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="ageing-{report["as_of"]}.csv"'
+            response.write('\ufeff')  # BOM so Excel opens Arabic class names correctly
+            writer = csv.writer(response)
+            writer.writerow(['school_class'] + buckets + ['total'])
+            for row in report['classes']:
+                writer.writerow([row['school_class_name'] or 'بدون صف'] + [row[b] for b in buckets] + [row['total']])
+            writer.writerow(['المجموع'] + [report['totals'][b] for b in buckets] + [report['totals']['total']])
+            return response
+
+        return Response(report)
+
     @action(detail=False, methods=['get', 'put'], url_path='default')
     def default_fee(self, request):
         if request.method == 'GET':
@@ -387,6 +554,11 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
                     related_model='SchoolFee',
                     related_id=str(updated.id)
                 )
+                if str(request.data.get('propagate', '')).lower() in ('true', '1'):
+                    active_year = get_active_school_year(request.user.account)
+                    data = dict(serializer.data)
+                    data['propagated_count'] = propagate_template_fee(updated, active_year) if active_year else 0
+                    return Response(data)
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -417,14 +589,19 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        updated_count = SchoolFee.objects.filter(
+        fees = SchoolFee.objects.filter(
             account=request.user.account,
             student_id__in=student_ids,
             school_year_id=school_year_id
-        ).update(
-            discount_percentage=discount_percentage,
-            discount_amount=discount_amount
         )
+        with transaction.atomic():
+            updated_count = fees.update(
+                discount_percentage=discount_percentage,
+                discount_amount=discount_amount,
+                updated_at=timezone.now()
+            )
+            resplit_installments(fees.values('pk'))
+        invalidate_fee_totals(request.user.account_id, school_year_id)
         
         log_activity(
             user=request.user,
@@ -438,3 +615,61 @@ class SchoolFeeViewSet(viewsets.ModelViewSet):
             "message": f"Discount applied to {updated_count} students",
             "updated_count": updated_count
         })
+
+    @action(detail=False, methods=['post'], url_path='simulate-discount')
+    def preview_discount(self, request):
+        """Preview the revenue impact of a discount policy without changing anything"""
+        serializer = DiscountPolicySerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        result = simulate_discount(
+            request.user.account, serializer.validated_data['school_year'], serializer.get_policy()
+        )
+        return Response(result)
+
+    @action(detail=False, methods=['post'], url_path='apply-discount-policy')
+    def commit_discount_policy(self, request):
+        """Apply the same policy accepted by simulate-discount in one bulk update"""
+        serializer = DiscountPolicySerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        policy = serializer.get_policy()
+
+        updated_count = apply_discount_policy(
+            request.user.account, serializer.validated_data['school_year'], policy
+        )
+
+        log_activity(
+            user=request.user,
+            account=request.user.account,
+            note=f"تم تطبيق خصم {policy['discount_percentage']}% + {policy['discount_amount']} على {updated_count} طالب",
+            related_model='SchoolFee',
+            related_id=None
+        )
+
+        return Response({
+            "message": f"Discount applied to {updated_count} students",
+            "updated_count": updated_count
+        })
+
+
+class FeeInstallmentViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = FeeInstallmentSerializer
+    queryset = FeeInstallment.objects.all()
+    filterset_fields = ['student', 'school_year', 'school_fee', 'status']
+
+    def get_queryset(self):
+        return FeeInstallment.objects.filter(account=self.request.user.account).select_related('student')
+
+    @action(detail=False, methods=['get'], url_path='overdue')
+    def overdue(self, request):
+        """Unpaid installments past their due date (?as_of=YYYY-MM-DD, defaults to today)"""
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = date.fromisoformat(as_of)
+            except ValueError:
+                return Response({"error": "تاريخ غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+
+        installments = overdue_installments(request.user.account, as_of).select_related('student')
+        installments = self.filter_queryset(installments)
+        return Response(self.get_serializer(installments, many=True).data)
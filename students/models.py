@@ -2,7 +2,7 @@ from django.db import models
 import uuid
 from users.models import Account, CustomUser
 from utils.file_handlers import student_documents_path
-from utils.storage_backends import MediaStorage
+from utils.storage_backends import media_storage
 
 
 
@@ -73,13 +73,14 @@ class Student(models.Model):
     # File upload field for documents/images
     attachment = models.FileField(
         upload_to=student_documents_path,
-        storage=MediaStorage(),  # ✅ This is the key change
+        storage=media_storage,  # ✅ This is the key change
         null=True,
         blank=True,
         help_text="Student profile document (ID, photo, etc.)"
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey('users.CustomUser', on_delete=models.SET_NULL, null=True, blank=True)
 
     def __str__(self):
@@ -100,7 +101,12 @@ class StudentDocument(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     student = models.ForeignKey('Student', on_delete=models.CASCADE, related_name='documents')
     document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPES)
-    document = models.FileField(upload_to='student_documents/', null=True, blank=True)
+    document = models.FileField(
+        upload_to=student_documents_path,
+        storage=media_storage,
+        null=True,
+        blank=True
+    )
     description = models.CharField(max_length=255, null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
@@ -7,7 +7,10 @@ from .models import Student, SchoolClass, StudentHistory, Bus, StudentDocument
 from rest_framework import generics
 from payments.models import Recipient
 from settings_data.serializers import SchoolFeeSerializer
-from settings_data.models import SchoolYear, SchoolFee
+from settings_data.models import SchoolFee, OpeningBalance
+from settings_data.services import with_opening_balance
+from utils.account_context import get_active_school_year
+from utils.images import ThumbnailListSerializer, thumbnail_url
 from django.db import models
 from rest_framework.permissions import IsAuthenticated
 
@@ -47,11 +50,14 @@ class StudentSerializer(serializers.ModelSerializer):
     payment_summary = serializers.SerializerMethodField()
     documents = StudentDocumentSerializer(many=True, read_only=True)
     attachment_url = serializers.SerializerMethodField()
+    attachment_thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Student
         exclude = ['account']
         read_only_fields = ['id']
+        list_serializer_class = ThumbnailListSerializer
+        thumbnail_fields = ['attachment']
 
     def validate_student_id(self, value):
         if not value:
@@ -80,10 +86,7 @@ class StudentSerializer(serializers.ModelSerializer):
             student = self.instance
             
             # Get the active school year
-            active_year = SchoolYear.objects.filter(
-                account=student.account, 
-                is_active=True
-            ).first()
+            active_year = get_active_school_year(student.account_id)
             
             if active_year:
                 # Calculate total paid for current year
@@ -114,10 +117,7 @@ class StudentSerializer(serializers.ModelSerializer):
 
                 # Calculate total required fee
                 if school_fee:
-                    if fee:
-                        total_fee = fee.get_total_fees_after_discount()  # Uses discount-aware calculation
-                    else:
-                        total_fee = 0
+                    total_fee = school_fee.total_fees_after_discount  # Discount-aware, computed by the database
                     
                     # Check if there are outstanding payments
                     outstanding_amount = total_fee - total_paid
@@ -182,6 +182,10 @@ class StudentSerializer(serializers.ModelSerializer):
                 logger.error(f"Manual URL generation failed for student {obj.id}: {manual_error}")
                 return None
 
+    def get_attachment_thumbnail_url(self, obj):
+        """Thumbnail of an image attachment (None for PDFs and other files)"""
+        return thumbnail_url(obj.attachment, self.context.get('stored_thumbnails'))
+
 
     def get_school_fees_by_year(self, student):
         fees = SchoolFee.objects.filter(student=student)
@@ -197,7 +201,7 @@ class StudentSerializer(serializers.ModelSerializer):
         ]
     
     def get_payment_summary(self, student):
-        active_year = SchoolYear.objects.filter(account=student.account, is_active=True).first()
+        active_year = get_active_school_year(student.account_id)
         if not active_year:
             return {'total_paid': 0, 'total_fee': 0, 'total_discount': 0, 'final_fee': 0}
 
@@ -221,21 +225,31 @@ class StudentSerializer(serializers.ModelSerializer):
             ).first()
 
         if school_fee:
-            # USE THE NEW DISCOUNT-AWARE METHODS
-            total_fee_before_discount = school_fee.get_total_fees_before_discount()
-            total_discount = school_fee.get_discount_amount_calculated()
-            final_fee = school_fee.get_total_fees_after_discount()
+            # Discount-aware totals computed by the database
+            total_fee_before_discount = school_fee.total_fees_before_discount
+            total_discount = school_fee.discount_amount_calculated
+            final_fee = school_fee.total_fees_after_discount
         else:
             total_fee_before_discount = 0
             total_discount = 0
             final_fee = 0
 
+        # Unpaid balance carried over from the previous year (year rollover);
+        # views annotate it with settings_data.services.with_opening_balance
+        if hasattr(student, 'opening_balance_amount'):
+            opening_balance = student.opening_balance_amount or 0
+        else:
+            opening_balance = OpeningBalance.objects.filter(
+                student=student, school_year=active_year
+            ).values_list('amount', flat=True).first() or 0
+
         return {
             'total_paid': total_paid,
             'total_fee_before_discount': total_fee_before_discount,  # NEW
             'total_discount': total_discount,                        # NEW
             'final_fee': final_fee,                                  # NEW
-            'remaining_amount': max(final_fee - total_paid, 0),      # UPDATED
+            'opening_balance': opening_balance,
+            'remaining_amount': max(final_fee + opening_balance - total_paid, 0),  # UPDATED
             # Keep backward compatibility
             'total_fee': final_fee  # This maintains existing frontend compatibility
         }
@@ -451,7 +465,9 @@ class SchoolClassDetailSerializer(serializers.ModelSerializer):
         """
         Return only non-archived students
         """
-        active_students = obj.students.filter(is_archived=False)
+        active_students = with_opening_balance(
+            obj.students.filter(is_archived=False), get_active_school_year(obj.account_id)
+        )
         return StudentSerializer(active_students, many=True).data
 
     def get_teacher(self, obj):
@@ -15,13 +15,17 @@ from .serializers import (
     StudentHistorySerializer, BusSerializer, BusCreateSerializer,
     SchoolClassCreateUpdateSerializer  # Import the new serializer
 )
-from logs.utils import log_activity
+from logs.utils import log_activity, serializer_changes
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from payments.models import Recipient
 from settings_data.models import SchoolFee, SchoolYear
+from settings_data.services import students_owing, with_opening_balance
+from utils.account_context import get_active_school_year
+from utils.cache import CachedListMixin
+from utils.conditional import ConditionalGetMixin
 from django.db.models import Sum
 
 from decimal import Decimal
@@ -32,7 +36,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class BusListCreateView(generics.ListCreateAPIView):
+class BusListCreateView(ConditionalGetMixin, CachedListMixin, generics.ListCreateAPIView):
+    cache_scopes = ['buses']
+    etag_updated_field = None
+
     def get_queryset(self):
         return Bus.objects.filter(account=self.request.user.account)
 
@@ -74,13 +81,15 @@ class BusRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         return context
 
     def perform_update(self, serializer):
+        changes = serializer_changes(serializer)
         bus = serializer.save()
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
             note=f"تم تعديل بيانات الباص {bus.bus_number}",
             related_model='Bus',
-            related_id=str(bus.id)
+            related_id=str(bus.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -121,13 +130,15 @@ class BusRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         return BusSerializer
 
     def perform_update(self, serializer):
+        changes = serializer_changes(serializer)
         bus = serializer.save(account=self.request.user.account)
         log_activity(
             user=self.request.user,
             account=self.request.user.account,
             note=f"تم تعديل بيانات الباص {bus.bus_number}",
             related_model='Bus',
-            related_id=str(bus.id)
+            related_id=str(bus.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -156,7 +167,20 @@ class BusRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
-class StudentListCreateView(generics.ListCreateAPIView):
+class StudentConditionalMixin(ConditionalGetMixin):
+    """Student payloads embed payments and fees, so those feed the ETag too"""
+    etag_scopes = ['student_records']
+
+    def get_etag_dependencies(self, detail=False):
+        dependencies = super().get_etag_dependencies(detail)
+        account = self.request.user.account
+        return dependencies + [
+            (Recipient.objects.filter(student__account=account), 'updated_at'),
+            (SchoolFee.objects.filter(account=account), 'updated_at'),
+        ]
+
+
+class StudentListCreateView(StudentConditionalMixin, generics.ListCreateAPIView):
     serializer_class = StudentSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['is_archived', 'account']
@@ -166,7 +190,8 @@ class StudentListCreateView(generics.ListCreateAPIView):
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
 
     def get_queryset(self):
-        return Student.objects.filter(account=self.request.user.account)
+        account = self.request.user.account
+        return with_opening_balance(Student.objects.filter(account=account), get_active_school_year(account))
 
     def perform_create(self, serializer):
         try:
@@ -183,7 +208,7 @@ class StudentListCreateView(generics.ListCreateAPIView):
             if attachment:
                 try:
                     student.attachment = attachment
-                    student.save(update_fields=['attachment'])
+                    student.save(update_fields=['attachment', 'updated_at'])
                 except Exception as file_error:
                     # Log the file error but don't fail the student creation
                     logger.error(f"File upload failed for student {student.id}: {file_error}")
@@ -229,7 +254,7 @@ class StudentListCreateView(generics.ListCreateAPIView):
             raise Exception("File upload failed. Please check your file and try again.")
 
 
-class StudentRetrieveUpdateView(generics.RetrieveUpdateAPIView):
+class StudentRetrieveUpdateView(StudentConditionalMixin, generics.RetrieveUpdateAPIView):
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'
@@ -237,7 +262,8 @@ class StudentRetrieveUpdateView(generics.RetrieveUpdateAPIView):
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
 
     def get_queryset(self):
-        return Student.objects.filter(account=self.request.user.account)
+        account = self.request.user.account
+        return with_opening_balance(Student.objects.filter(account=account), get_active_school_year(account))
 
     def get_serializer_context(self):
         """Add request context to serializer for file URL generation"""
@@ -250,6 +276,7 @@ class StudentRetrieveUpdateView(generics.RetrieveUpdateAPIView):
         old_class = student.school_class
         old_bus = student.bus
         old_bus_join = student.is_bus_joined
+        field_changes = serializer_changes(serializer)
 
         updated_student = serializer.save(account=self.request.user.account)
 
@@ -288,7 +315,8 @@ class StudentRetrieveUpdateView(generics.RetrieveUpdateAPIView):
                 account=self.request.user.account,
                 note=f"تم تعديل بيانات الطالب {updated_student.first_name} {updated_student.second_name} ({'، '.join(changes)})",
                 related_model='Student',
-                related_id=str(updated_student.id)
+                related_id=str(updated_student.id),
+                changes=field_changes
             )
 
 
@@ -303,7 +331,7 @@ def students_with_open_accounts(request):
     
     try:
         # Try to get the active school year
-        active_year = SchoolYear.objects.filter(account=account, is_active=True).first()
+        active_year = get_active_school_year(account)
         
         if not active_year:
             # If no active year exists, return empty result instead of error
@@ -314,64 +342,18 @@ def students_with_open_accounts(request):
                 "has_active_year": False
             }, status=status.HTTP_200_OK)
 
-        students = Student.objects.filter(account=account, is_archived=False)
-        open_students = []
-
-        for student in students:
-            try:
-                # Check if student closed account for current year
-                is_closed = StudentPaymentHistory.objects.filter(
-                    student=student, 
-                    year=active_year.label
-                ).exists()
-                
-                if is_closed:
-                    continue  # skip closed accounts
-
-                # Calculate total paid
-                total_paid = Recipient.objects.filter(
-                    student=student, 
-                    school_year=active_year
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-                # Find the applicable fee with fallback logic
-                fee = SchoolFee.objects.filter(
-                    student=student, 
-                    school_year=active_year
-                ).first()
-                
-                if not fee and student.school_class:
-                    fee = SchoolFee.objects.filter(
-                        school_class=student.school_class, 
-                        student__isnull=True, 
-                        school_year=active_year
-                    ).first()
-                
-                if not fee:
-                    fee = SchoolFee.objects.filter(
-                        school_class__isnull=True, 
-                        student__isnull=True, 
-                        school_year=active_year
-                    ).first()
-
-                # Calculate total fee with safe handling of None values
-                total_fee = 0
-                if fee:
-                    total_fee = sum([
-                        fee.school_fee or 0,
-                        fee.books_fee or 0,
-                        fee.trans_fee or 0,
-                        fee.clothes_fee or 0,
-                    ])
-
-                # Only include students with unpaid amounts
-                if total_paid < total_fee:
-                    open_students.append(student)
-                    
-            except Exception as e:
-                # Log the error but continue processing other students
-                print(f"Error processing student {student.id}: {str(e)}")
-                continue
+        # ?min_balance=500 -> only students owing more than 500
+        try:
+            min_balance = Decimal(request.query_params.get('min_balance') or 0)
+        except (ArithmeticError, ValueError):
+            return Response({"error": "قيمة min_balance غير صالحة"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Balances are resolved in SQL from the generated fee total columns
+        open_students = list(
+            with_opening_balance(students_owing(account, active_year, min_balance), active_year)
+            .select_related('school_class', 'bus')
+            .order_by('-balance')
+        )
 
         serializer = StudentSerializer(open_students, many=True, context={'request': request})
         return Response({
@@ -391,8 +373,10 @@ def students_with_open_accounts(request):
         }, status=status.HTTP_200_OK)
 
 
-class SchoolClassListCreateView(generics.ListCreateAPIView):
+class SchoolClassListCreateView(ConditionalGetMixin, CachedListMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    cache_scopes = ['classes']
+    etag_updated_field = None
     
     def get_queryset(self):
         return SchoolClass.objects.filter(account=self.request.user.account)
@@ -433,6 +417,7 @@ class SchoolClassRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         return context
 
     def perform_update(self, serializer):
+        changes = serializer_changes(serializer)
         class_obj = serializer.save()
         
         # Log activity after successful save
@@ -441,7 +426,8 @@ class SchoolClassRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
             account=self.request.user.account,
             note=f"تم تعديل الصف {class_obj.name}",
             related_model='SchoolClass',
-            related_id=str(class_obj.id)
+            related_id=str(class_obj.id),
+            changes=changes
         )
 
     def perform_destroy(self, instance):
@@ -646,11 +632,7 @@ def delete_student_document(request, document_id):
             student__account=request.user.account
         )
         
-        # Delete from S3
-        if document.document:
-            s3_manager = S3FileManager()
-            s3_manager.delete_file(document.document.name)
-        
+        # The file is queued for deletion from S3 by the post_delete signal
         student_name = f"{document.student.first_name} {document.student.second_name}"
         doc_type = document.get_document_type_display()
         
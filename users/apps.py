@@ -2,9 +2,14 @@ from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
 
+    def ready(self):
+        from .authentication import connect_auth_cache_signals
+        connect_auth_cache_signals()
+
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
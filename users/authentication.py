@@ -0,0 +1,120 @@
+# users/authentication.py
+"""
+JWT authentication with the user (and its account) cached per token.
+
+The stock JWTAuthentication loads the user on every request and the account
+on first access to request.user.account. Here both come from one joined query,
+and the result is cached under the token's jti. Every user has a generation
+number stored next to it; saving or deleting the user or its account bumps
+the generation, which orphans all cached entries for that user.
+
+The cache is only used when it is shared between worker processes: with a
+per-process cache a bump made by one worker would never reach the others,
+which would keep a deactivated user (or an old password) authenticated there.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+AUTH_CACHE_TIMEOUT = getattr(settings, 'AUTH_CACHE_TIMEOUT', 5 * 60)
+
+
+def _generation_key(user_id):
+    return f'auth-generation:{user_id}'
+
+
+def _entry_key(user_id, jti):
+    return f'auth-user:{user_id}:{jti}'
+
+
+def auth_cache_enabled():
+    """False for per-process (or dummy) caches, whose entries other workers can't invalidate"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def bump_user_generation(*user_ids):
+    """Drop every cached authentication entry of the given users"""
+    if user_ids:
+        cache.set_many({_generation_key(user_id): time.time_ns() for user_id in user_ids}, None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves user + account once per token and TTL"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if not jti or not auth_cache_enabled():
+            return self._load_user(validated_token, user_id)
+
+        entry_key, generation_key = _entry_key(user_id, jti), _generation_key(user_id)
+        cached = cache.get_many([entry_key, generation_key])
+        generation = cached.get(generation_key)
+        entry = cached.get(entry_key)
+        if entry is not None and generation is not None and entry[0] == generation:
+            return entry[1]
+
+        user = self._load_user(validated_token, user_id)
+        if generation is None:
+            cache.add(generation_key, time.time_ns(), None)
+            generation = cache.get(generation_key)
+
+        # Never keep the entry longer than the token itself is valid
+        timeout = AUTH_CACHE_TIMEOUT
+        expires_at = validated_token.get('exp')
+        if expires_at:
+            timeout = min(timeout, max(int(expires_at - time.time()), 1))
+        cache.set(entry_key, (generation, user), timeout)
+        return user
+
+    def _load_user(self, validated_token, user_id):
+        try:
+            user = self.user_model.objects.select_related('account').get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+def _user_changed(sender, instance, **kwargs):
+    bump_user_generation(instance.pk)
+    # A request in flight may have cached the pre-commit user
+    transaction.on_commit(lambda: bump_user_generation(instance.pk))
+
+
+def _account_changed(sender, instance, **kwargs):
+    user_ids = list(instance.users.values_list('pk', flat=True)) if instance.pk else []
+    bump_user_generation(*user_ids)
+    transaction.on_commit(lambda: bump_user_generation(*user_ids))
+
+
+def connect_auth_cache_signals():
+    """Invalidate cached authentication on user/account save or delete (password changes, deactivation, ...)"""
+    from .models import Account, CustomUser
+
+    post_save.connect(_user_changed, sender=CustomUser, dispatch_uid='auth-cache-user-save')
+    post_delete.connect(_user_changed, sender=CustomUser, dispatch_uid='auth-cache-user-delete')
+    post_save.connect(_account_changed, sender=Account, dispatch_uid='auth-cache-account-save')
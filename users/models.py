@@ -2,7 +2,7 @@ import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from utils.file_handlers import general_documents_path
-from utils.storage_backends import MediaStorage
+from utils.storage_backends import media_storage
 from utils.file_handlers import logo_path
 
 
@@ -16,7 +16,7 @@ class Account(models.Model):
     # ✅ Updated to use S3 storage
     logo = models.ImageField(
         upload_to=logo_path,
-        storage=MediaStorage(),
+        storage=media_storage,
         null=True, 
         blank=True,
         help_text="School/Account logo"
@@ -8,19 +8,21 @@ from rest_framework import serializers
 from .models import CustomUser, Account
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_decode
+from utils.images import thumbnail_url
 
 logger = logging.getLogger(__name__)
 
 
 class AccountUpdateSerializer(serializers.ModelSerializer):
     logo_url = serializers.SerializerMethodField()
+    logo_thumbnail_url = serializers.SerializerMethodField()
     ui_preferences = serializers.SerializerMethodField()
     
     class Meta:
         model = Account
         fields = [
             'school_name', 'phone_number', 'email',
-            'address', 'logo', 'logo_url', 'start_school_date', 'end_school_date',
+            'address', 'logo', 'logo_url', 'logo_thumbnail_url', 'start_school_date', 'end_school_date',
             'ui_preferences'  # Only include ui_preferences, not the individual fields
         ]
     
@@ -47,6 +49,9 @@ class AccountUpdateSerializer(serializers.ModelSerializer):
                 logger.error(f"Manual URL generation failed for account {obj.id}: {manual_error}")
                 return None
     
+    def get_logo_thumbnail_url(self, obj):
+        return thumbnail_url(obj.logo)
+    
     def get_ui_preferences(self, obj):
         """Get organized UI preferences"""
         return obj.get_enabled_menu_items()
@@ -98,6 +103,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             'email': account.email or '',
             'phone_number': account.phone_number or '',
             'logo': self._get_logo_url(account),
+            'logo_thumbnail': thumbnail_url(account.logo),
         }
         # Include UI preferences from database
         data['ui_preferences'] = account.get_enabled_menu_items()
@@ -15,7 +15,9 @@ from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import get_user_model
 from .models import Account
 from logs.utils import log_activity
-from utils.s3_utils import S3FileManager
+from utils.s3_outbox import queue_file_deletion
+from utils.cache import cached_response
+from utils.stored_files import storage_usage
 import logging
 
 logger = logging.getLogger(__name__)
@@ -85,9 +87,10 @@ class AccountUpdateView(APIView):
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
 
     def get(self, request):
-        account = request.user.account
-        serializer = AccountUpdateSerializer(account, context={'request': request})
-        return Response(serializer.data)
+        def build():
+            serializer = AccountUpdateSerializer(request.user.account, context={'request': request})
+            return Response(serializer.data)
+        return cached_response(request, ['account'], build)
 
     def put(self, request):
         account = request.user.account
@@ -144,8 +147,10 @@ class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = MeSerializer(request.user, context={'request': request})
-        return Response(serializer.data)
+        def build():
+            serializer = MeSerializer(request.user, context={'request': request})
+            return Response(serializer.data)
+        return cached_response(request, ['account'], build, per_user=True)
 
 
 class AuthenticatedPasswordResetView(APIView):
@@ -180,9 +185,8 @@ def delete_account_logo(request):
                 'message': 'لا يوجد شعار للحذف'
             }, status=status.HTTP_200_OK)
         
-        s3_manager = S3FileManager()
         if account.logo:
-            s3_manager.delete_file(account.logo.name)
+            queue_file_deletion(account.logo)
             account.logo = None
             account.save(update_fields=['logo'])
         
@@ -227,12 +231,13 @@ def upload_account_logo(request):
                 'error': 'حجم الملف كبير جداً. الحد الأقصى 5 ميجابايت'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        if account.logo:
-            s3_manager = S3FileManager()
-            s3_manager.delete_file(account.logo.name)
+        old_logo = account.logo
         
         account.logo = logo_file
         account.save(update_fields=['logo'])
+        # Same upload path means the new logo overwrote the old one in place
+        if old_logo and old_logo.name != account.logo.name:
+            queue_file_deletion(old_logo)
         
         log_activity(
             user=request.user,
@@ -289,7 +294,8 @@ def account_stats(request):
             'has_contact_info': bool(account.phone_number or account.email),
             'has_address': bool(account.address),
             'school_dates_set': bool(account.start_school_date and account.end_school_date),
-            'ui_preferences': account.get_enabled_menu_items()
+            'ui_preferences': account.get_enabled_menu_items(),
+            'storage_usage': storage_usage(account),
         }
         
         return Response(stats, status=status.HTTP_200_OK)
@@ -0,0 +1,123 @@
+# utils/account_context.py
+"""
+Account-scoped lookups that are needed many times per request (the active
+SchoolYear, small reference tables) resolved once.
+
+Values live in two layers:
+- a per-request memo, reset by AccountContextMiddleware
+- the Django cache, shared across requests until a signal invalidates it
+"""
+import contextvars
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+CONTEXT_CACHE_TIMEOUT = 60 * 60
+
+# Reference sets: name -> model label
+REFERENCE_SETS = {
+    'employee_types': 'settings_data.EmployeeType',
+    'authorized_payers': 'settings_data.AuthorizedPayer',
+    'payment_types': 'payments.PaymentType',
+}
+
+_MISSING = object()
+_NO_ACTIVE_YEAR = 'none'
+
+_request_memo = contextvars.ContextVar('account_context_memo', default=None)
+
+
+def _cache_key(account_id, name):
+    return f'account-context:{account_id}:{name}'
+
+
+def _memoized(account_id, name, load):
+    memo = _request_memo.get()
+    key = (str(account_id), name)
+    if memo is not None and key in memo:
+        return memo[key]
+
+    value = cache.get(_cache_key(account_id, name), _MISSING)
+    if value is _MISSING:
+        value = load()
+        cache.set(_cache_key(account_id, name), value, CONTEXT_CACHE_TIMEOUT)
+
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def get_active_school_year(account):
+    """The account's active SchoolYear (or None), shared by everything in the request"""
+    account_id = getattr(account, 'pk', account)
+    if not account_id:
+        return None
+    SchoolYear = apps.get_model('settings_data', 'SchoolYear')
+
+    def load():
+        # Cache a marker for "no active year" so that miss is cached too
+        year = SchoolYear.objects.filter(account_id=account_id, is_active=True).first()
+        return year if year is not None else _NO_ACTIVE_YEAR
+
+    year = _memoized(account_id, 'active_year', load)
+    return None if year == _NO_ACTIVE_YEAR else year
+
+
+def get_reference_data(account, name, queryset=None):
+    """
+    List of the account's rows for one of REFERENCE_SETS, loaded from queryset
+    (default: every row of the account) when not cached yet
+    """
+    account_id = getattr(account, 'pk', account)
+    if queryset is None:
+        queryset = apps.get_model(REFERENCE_SETS[name]).objects.filter(account_id=account_id)
+    return _memoized(account_id, name, lambda: list(queryset))
+
+
+def invalidate_account_context(account_id, name=None):
+    """Drop cached context for the account; every name when name is None"""
+    if not account_id:
+        return
+    names = [name] if name else ['active_year', *REFERENCE_SETS]
+    keys = [_cache_key(account_id, n) for n in names]
+    cache.delete_many(keys)
+    # Again after commit, in case another request re-cached the pre-commit value
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    memo = _request_memo.get()
+    if memo is not None:
+        for n in names:
+            memo.pop((str(account_id), n), None)
+
+
+class ReferenceListMixin:
+    """
+    Serves list() of a per-account reference table from the account context.
+    Set reference_set to a REFERENCE_SETS name; the cached rows come from the
+    view's own filtered queryset, so they keep its ordering. Requests with
+    query parameters or pagination go through the regular list().
+    """
+    reference_set = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        rows = get_reference_data(
+            request.user.account, self.reference_set, self.filter_queryset(self.get_queryset())
+        )
+        return Response(self.get_serializer(rows, many=True).data)
+
+
+class AccountContextMiddleware:
+    """Gives every request a fresh memo so lookups are resolved at most once per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _request_memo.reset(token)
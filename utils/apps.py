@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+
+
+class UtilsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'utils'
+
+    def ready(self):
+        from .cache import connect_version_signals
+        from .s3_outbox import connect_file_deletion_signals
+        from .images import connect_image_processing_signals
+        from .stored_files import connect_stored_file_signals
+        from .blobs import connect_blob_signals
+        connect_version_signals()
+        connect_file_deletion_signals()
+        # Before image processing, so an upload is recorded before its re-encode replaces it
+        connect_stored_file_signals()
+        connect_blob_signals()
+        connect_image_processing_signals()
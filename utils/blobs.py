@@ -0,0 +1,96 @@
+# utils/blobs.py
+"""
+Content-addressed document storage.
+
+Files uploaded to BLOB_FIELDS are stored once per account under
+blobs/{account_id}/{sha256}{ext}, hashed while the upload is still on the
+worker (utils.stored_files). An upload whose blob already exists is not
+sent to S3 again; the row just points at the blob. StoredFile.ref_count
+counts the rows pointing at each blob, and queue_file_deletion only
+deletes a blob once the last reference is released. The outbox drain
+still skips keys a row references, so a drifted count can't lose a file.
+"""
+from django.apps import apps
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save
+
+from .file_handlers import blob_path
+from .models import S3DeletionOutbox, StoredFile
+from .stored_files import key_hash, storage_key
+
+BLOB_FIELDS = {
+    'students.StudentDocument': ['document'],
+    'employees.EmployeeDocument': ['document'],
+    'payments.PaymentDocument': ['document'],
+    'employees.Employee': ['contract_pdf', 'id_copy'],
+}
+
+
+def is_blob_field(model, field_name):
+    return field_name in BLOB_FIELDS.get(model._meta.label, ())
+
+
+def _blob_hash(storage, name):
+    return key_hash(*storage_key(storage, name))
+
+
+def blob_exists(storage, name):
+    return StoredFile.objects.filter(key_hash=_blob_hash(storage, name)).exists()
+
+
+def retain_blob(storage, name):
+    """Count one more row pointing at the blob"""
+    digest = _blob_hash(storage, name)
+    StoredFile.objects.filter(key_hash=digest).update(ref_count=F('ref_count') + 1)
+    # A release that reached zero may have queued it; it is in use again
+    S3DeletionOutbox.objects.filter(key_hash=digest).delete()
+
+
+def release_blob(storage, name):
+    """Count one row fewer; True when no references are left and the object can go"""
+    digest = _blob_hash(storage, name)
+    StoredFile.objects.filter(key_hash=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    return not StoredFile.objects.filter(key_hash=digest).values_list('ref_count', flat=True).first()
+
+
+def _store_new_blobs(sender, instance, **kwargs):
+    # Runs after stored_files measured the uploads and before the fields' pre_save uploads them
+    metadata = getattr(instance, '_new_file_metadata', None) or {}
+    changes = []
+    for field_name in BLOB_FIELDS[sender._meta.label]:
+        if field_name not in metadata:
+            continue
+        field = sender._meta.get_field(field_name)
+        upload = getattr(instance, field.attname)
+        name = blob_path(instance, upload.name, metadata[field_name][2])
+        if name is None:
+            # No account to scope the blob to: stored under upload_to like any other file
+            continue
+        if not blob_exists(field.storage, name):
+            name = field.storage.save(name, upload.file)
+        old_name = None
+        if not instance._state.adding:
+            old_name = sender._default_manager.filter(pk=instance.pk).values_list(field.attname, flat=True).first()
+        # A plain name is already committed, so the field's pre_save won't upload the file again
+        setattr(instance, field.attname, name)
+        changes.append((field, name, old_name))
+    instance._blob_changes = changes
+
+
+def _count_blob_references(sender, instance, **kwargs):
+    from .s3_outbox import queue_file_deletion
+    for field, name, old_name in getattr(instance, '_blob_changes', ()):
+        if name == old_name:
+            continue
+        retain_blob(field.storage, name)
+        if old_name:
+            queue_file_deletion(field.attr_class(instance, field, old_name))
+    instance._blob_changes = []
+
+
+def connect_blob_signals():
+    """Must be connected after utils.stored_files' receivers, which measure and record the uploads"""
+    for label in BLOB_FIELDS:
+        model = apps.get_model(label)
+        pre_save.connect(_store_new_blobs, sender=model, dispatch_uid=f'blobs-store-{label}')
+        post_save.connect(_count_blob_references, sender=model, dispatch_uid=f'blobs-count-{label}')
@@ -0,0 +1,158 @@
+# utils/cache.py
+"""
+Version-keyed caching for read-heavy, per-account data.
+
+Each account has a data version per scope ('classes', 'buses', ...). Writes to
+the models listed in CACHE_SCOPES bump the version via post_save/post_delete,
+so cached entries keyed on an old version are simply never read again.
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework.response import Response
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60)
+
+# scope -> models whose writes change what the scope's endpoints return
+CACHE_SCOPES = {
+    'classes': ['students.SchoolClass', 'students.Student', 'employees.Employee'],
+    'buses': ['students.Bus', 'students.Student', 'employees.Employee', 'payments.Payment'],
+    'school_years': ['settings_data.SchoolYear'],
+    'account': ['users.Account', 'users.CustomUser'],
+    # Rows embedded in student / payment payloads (used for ETags)
+    'student_records': [
+        'students.StudentHistory', 'students.StudentDocument', 'students.StudentPaymentHistory',
+        'students.SchoolClass', 'students.Bus', 'settings_data.SchoolYear', 'settings_data.OpeningBalance',
+    ],
+    'payment_records': [
+        'payments.PaymentDocument', 'students.Student', 'employees.Employee', 'students.Bus',
+        'settings_data.AuthorizedPayer',
+    ],
+    'inventory': ['inventory.StoreItem', 'inventory.StockMovement'],
+    'employee_records': [
+        'employees.EmployeeHistory', 'employees.EmployeeVirtualTransaction', 'employees.EmployeeDocument',
+        'students.SchoolClass', 'students.Bus',
+    ],
+}
+# Employee types, authorized payers and payment types are served from
+# utils.account_context, which is invalidated by the same kind of signals
+
+
+def _version_key(account_id, scope):
+    return f'data-version:{account_id}:{scope}'
+
+
+def _fresh_version():
+    # Time based, so a version lost to eviction never matches an old entry again
+    return time.time_ns()
+
+
+def get_data_version(account_id, scope):
+    key = _version_key(account_id, scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(account_id, scope):
+    if not account_id:
+        return
+    # A new value rather than incr(): file based caches don't increment
+    # atomically, and two workers bumping at once must still both move it on
+    cache.set(_version_key(account_id, scope), _fresh_version(), None)
+
+
+def response_cache_key(request, scopes, per_user=False):
+    account_id = request.user.account_id
+    params = hashlib.md5(
+        '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.lists())).encode()
+    ).hexdigest()
+    versions = ':'.join(str(get_data_version(account_id, scope)) for scope in scopes)
+    user_part = request.user.pk if per_user else '-'
+    return f'response:{account_id}:{user_part}:{request.path}:{params}:{versions}'
+
+
+def cached_response(request, scopes, build, per_user=False, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Serve a GET from the cache, calling build() to produce the Response on a miss.
+    Only successful responses are stored.
+    """
+    if request.method != 'GET' or not getattr(request.user, 'account_id', None):
+        return build()
+
+    key = response_cache_key(request, scopes, per_user)
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout)
+    return response
+
+
+class CachedListMixin:
+    """
+    Caches list() responses of a view per account and query string.
+    Set cache_scopes to the CACHE_SCOPES entries the list depends on.
+    """
+    cache_scopes = ()
+
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+        return cached_response(request, self.cache_scopes, lambda: parent_list(request, *args, **kwargs))
+
+
+# Parent relations used to find the account of rows without an account FK
+ACCOUNT_PARENTS = ('student', 'payment', 'recipient', 'employee')
+
+
+def _instance_account_id(instance):
+    if instance._meta.label == 'users.Account':
+        return instance.pk
+    account_id = getattr(instance, 'account_id', None)
+    if account_id:
+        return account_id
+    for parent in ACCOUNT_PARENTS:
+        if getattr(instance, f'{parent}_id', None):
+            try:
+                return getattr(instance, parent).account_id
+            except ObjectDoesNotExist:
+                return None
+    return None
+
+
+def _bump_for(scopes):
+    def receiver(sender, instance, **kwargs):
+        account_id = _instance_account_id(instance)
+        if not account_id:
+            return
+        for scope in scopes:
+            bump_data_version(account_id, scope)
+            # A concurrent read may have cached pre-commit data under the new version
+            transaction.on_commit(lambda scope=scope: bump_data_version(account_id, scope))
+    return receiver
+
+
+def connect_version_signals():
+    """Wire post_save/post_delete of every model in CACHE_SCOPES to its scopes' versions"""
+    scopes_by_model = {}
+    for scope, labels in CACHE_SCOPES.items():
+        for label in labels:
+            scopes_by_model.setdefault(label, []).append(scope)
+
+    for label, scopes in scopes_by_model.items():
+        model = apps.get_model(label)
+        receiver = _bump_for(scopes)
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f'cache-version-save-{label}')
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f'cache-version-delete-{label}')
@@ -0,0 +1,94 @@
+# utils/conditional.py
+"""
+ETag / Last-Modified support for DRF views.
+
+The ETag is a fingerprint of what the payload is built from: count and
+max(updated_at) of the view's queryset and any related querysets it embeds,
+plus utils.cache data versions. Computing it costs a few aggregate queries;
+a matching If-None-Match gets a 304 without serializing anything.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_data_version
+
+
+class ConditionalGetMixin:
+    """
+    Adds conditional GET to list() and retrieve().
+
+    Override get_etag_dependencies() to add the related rows a serializer
+    embeds; set etag_scopes for data versions (defaults to cache_scopes).
+    With etag_updated_field = None the view's own rows are left out and the
+    ETag rests on the data versions alone.
+    """
+    etag_updated_field = 'updated_at'
+    etag_scopes = None
+
+    def get_etag_dependencies(self, detail=False):
+        """(queryset, updated-at field or None) pairs the response is built from"""
+        if self.etag_updated_field is None:
+            return []
+        queryset = self.get_queryset()
+        if detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        else:
+            queryset = self.filter_queryset(queryset)
+        return [(queryset, self.etag_updated_field)]
+
+    def get_etag_extra(self):
+        """Anything else the payload depends on, e.g. the current month for monthly totals"""
+        return []
+
+    def get_etag(self, request, detail=False):
+        """Return (etag, last_modified datetime or None) for the current request"""
+        parts = [request.get_full_path(), str(getattr(request.user, 'account_id', ''))]
+        last_modified = None
+        for queryset, field in self.get_etag_dependencies(detail):
+            aggregates = {'count': Count('pk')}
+            aggregates['last'] = Max(field) if field else Max('pk')
+            values = queryset.order_by().aggregate(**aggregates)
+            parts.append(f"{values['count']}:{values['last']}")
+            if field and values['last'] and (last_modified is None or values['last'] > last_modified):
+                last_modified = values['last']
+
+        scopes = self.etag_scopes if self.etag_scopes is not None else getattr(self, 'cache_scopes', ())
+        account_id = getattr(request.user, 'account_id', None)
+        if account_id:
+            parts.extend(str(get_data_version(account_id, scope)) for scope in scopes)
+        parts.extend(str(part) for part in self.get_etag_extra())
+
+        return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest(), last_modified
+
+    def conditional_response(self, request, build, detail=False):
+        """Return 304 when the client's ETag still matches, otherwise build() with validators set"""
+        etag, last_modified = self.get_etag(request, detail)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+            # Let the browser revalidate instead of reusing a stale copy
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+        return self.conditional_response(request, lambda: parent_list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent_retrieve = super().retrieve
+        return self.conditional_response(
+            request, lambda: parent_retrieve(request, *args, **kwargs), detail=True
+        )
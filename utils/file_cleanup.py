@@ -1,119 +1,118 @@
+# utils/file_cleanup.py
+"""
+Orphaned file cleanup for the media bucket.
 
-from utils.s3_utils import S3FileManager
-from employees.models import Employee, EmployeeDocument
-from students.models import Student, StudentDocument
-from django.core.management.base import BaseCommand
+The bucket listing is paginated and consumed as a generator, referenced
+keys are streamed from every S3-backed FileField of every model with
+values_list().iterator() into a set of 16-byte digests, and orphans go
+through the S3 deletion outbox, whose drain deletes them with
+delete_objects in batches of 1000 and re-checks references first.
+"""
+import hashlib
 import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import models
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .file_handlers import is_image_name, thumbnail_name
+from .s3_client import get_s3_client
+from .s3_outbox import DELETE_BATCH_SIZE, drain_s3_deletions, queue_s3_deletion
+from .storage_backends import media_storage
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MIN_AGE = timedelta(hours=24)
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
 
 class FileCleanupManager:
     """
-    Utility class for managing file cleanup operations
+    Finds and deletes objects under the media location that no row references.
+
+    Objects younger than min_age are never touched: a direct upload exists in
+    S3 before its confirm call records it, and image processing writes the
+    new file before it updates the row.
     """
-    
-    def __init__(self):
-        self.s3_manager = S3FileManager()
-    
-    def cleanup_orphaned_employee_files(self):
-        """
-        Clean up S3 files that are no longer referenced by any employee records
-        """
-        if not self.s3_manager.is_available():
-            logger.warning("S3 manager not available for cleanup")
-            return
-        
-        try:
-            # Get all employee files from S3
-            employee_files = self.s3_manager.list_files('media/employees/')
-            
-            # Get all file references from database
-            db_files = set()
-            
-            # Employee main files
-            for employee in Employee.objects.all():
-                if employee.contract_pdf:
-                    db_files.add(employee.contract_pdf.name)
-                if employee.profile_picture:
-                    db_files.add(employee.profile_picture.name)
-                if employee.id_copy:
-                    db_files.add(employee.id_copy.name)
-            
-            # Employee document files
-            for doc in EmployeeDocument.objects.all():
-                if doc.document:
-                    db_files.add(doc.document.name)
-            
-            # Find orphaned files
-            orphaned_files = []
-            for s3_file in employee_files:
-                file_key = s3_file.get('Key', '')
-                # Remove 'media/' prefix for comparison
-                file_name = file_key.replace('media/', '', 1) if file_key.startswith('media/') else file_key
-                
-                if file_name not in db_files:
-                    orphaned_files.append(file_key)
-            
-            # Delete orphaned files
-            deleted_count = 0
-            for orphaned_file in orphaned_files:
-                if self.s3_manager.delete_file(orphaned_file):
-                    deleted_count += 1
-                    logger.info(f"Deleted orphaned file: {orphaned_file}")
-            
-            logger.info(f"Cleanup completed. Deleted {deleted_count} orphaned employee files")
-            return deleted_count
-            
-        except Exception as e:
-            logger.error(f"Error during employee file cleanup: {e}")
-            return 0
-    
-    def cleanup_orphaned_student_files(self):
+
+    def __init__(self, prefix='', min_age=DEFAULT_MIN_AGE):
+        storage = media_storage()
+        self.bucket = storage.bucket_name
+        self.location = f'{storage.location}/' if storage.location else ''
+        self.prefix = self.location + prefix.lstrip('/')
+        self.min_age = min_age
+        self.client = get_s3_client()
+
+    def iter_objects(self):
+        """Every object under the prefix, one listing page (1000 keys) at a time"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            yield from page.get('Contents', [])
+
+    def file_fields(self):
+        """(model, field) for every FileField stored in this bucket"""
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if (isinstance(field, models.FileField) and isinstance(field.storage, S3Boto3Storage)
+                        and field.storage.bucket_name == self.bucket):
+                    yield model, field
+
+    def referenced_keys(self):
+        """Digests of every key a row points at, image thumbnails included"""
+        referenced = set()
+        for model, field in self.file_fields():
+            storage = field.storage
+            names = (
+                model._default_manager.exclude(**{field.attname: ''}).exclude(**{f'{field.attname}__isnull': True})
+                .values_list(field.attname, flat=True).iterator(chunk_size=5000)
+            )
+            for name in names:
+                referenced.add(_digest(storage._normalize_name(name)))
+                if is_image_name(name):
+                    referenced.add(_digest(storage._normalize_name(thumbnail_name(name))))
+        return referenced
+
+    def find_orphans(self, referenced=None):
+        """Yield listing entries ({'Key', 'Size', 'LastModified'}) that nothing references"""
+        referenced = self.referenced_keys() if referenced is None else referenced
+        cutoff = timezone.now() - self.min_age
+        for obj in self.iter_objects():
+            if obj['LastModified'] < cutoff and _digest(obj['Key']) not in referenced:
+                yield obj
+
+    def cleanup(self, dry_run=False, sample_size=20):
         """
-        Clean up S3 files that are no longer referenced by any student records
+        Queue every orphan for deletion and drain the queue (or only count them with dry_run).
+        Returns a report dict.
         """
-        if not self.s3_manager.is_available():
-            logger.warning("S3 manager not available for cleanup")
-            return
-        
-        try:
-            # Get all student files from S3
-            student_files = self.s3_manager.list_files('media/students/')
-            
-            # Get all file references from database
-            db_files = set()
-            
-            # Student main files
-            for student in Student.objects.all():
-                if student.attachment:
-                    db_files.add(student.attachment.name)
-            
-            # Student document files
-            for doc in StudentDocument.objects.all():
-                if doc.document:
-                    db_files.add(doc.document.name)
-            
-            # Find orphaned files
-            orphaned_files = []
-            for s3_file in student_files:
-                file_key = s3_file.get('Key', '')
-                file_name = file_key.replace('media/', '', 1) if file_key.startswith('media/') else file_key
-                
-                if file_name not in db_files:
-                    orphaned_files.append(file_key)
-            
-            # Delete orphaned files
-            deleted_count = 0
-            for orphaned_file in orphaned_files:
-                if self.s3_manager.delete_file(orphaned_file):
-                    deleted_count += 1
-                    logger.info(f"Deleted orphaned file: {orphaned_file}")
-            
-            logger.info(f"Cleanup completed. Deleted {deleted_count} orphaned student files")
-            return deleted_count
-            
-        except Exception as e:
-            logger.error(f"Error during student file cleanup: {e}")
-            return 0
+        referenced = self.referenced_keys()
+        report = {
+            'prefix': self.prefix, 'referenced': len(referenced), 'orphaned': 0, 'orphaned_bytes': 0,
+            'deleted': 0, 'failed': 0, 'sample': [],
+        }
+        batch = []
+        for obj in self.find_orphans(referenced):
+            report['orphaned'] += 1
+            report['orphaned_bytes'] += obj.get('Size', 0)
+            if len(report['sample']) < sample_size:
+                report['sample'].append(obj['Key'])
+            if not dry_run:
+                batch.append(obj['Key'])
+                if len(batch) >= DELETE_BATCH_SIZE:
+                    queue_s3_deletion(batch, bucket=self.bucket, drain=False)
+                    batch = []
+        if dry_run:
+            return report
 
+        if batch:
+            queue_s3_deletion(batch, bucket=self.bucket, drain=False)
+        # Drained once here rather than in the background, so the report counts every deletion
+        report['deleted'], report['failed'] = drain_s3_deletions()
+        logger.info(f"Orphaned file cleanup under {self.prefix}: {report['orphaned']} orphans, "
+                    f"{report['deleted']} deleted, {report['failed']} failed")
+        return report
@@ -1,6 +1,11 @@
 import os
+import uuid
+from django.conf import settings
 from django.utils.deconstruct import deconstructible
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+BLOB_DIRECTORY = 'blobs'
+
 
 def clean_name(name):
     """Clean name for use in file paths"""
@@ -10,16 +15,68 @@ def clean_name(name):
     return clean.replace(' ', '_') or 'unknown'
 
 
+def is_image_name(name):
+    """Whether a stored file name looks like an image"""
+    return bool(name) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def thumbnail_name(name):
+    """
+    Thumbnail of an image: {dir}/thumbs/{filename}.{format}, next to the image.
+    The whole filename is kept so a.png and a.jpg get different thumbnails.
+    """
+    directory, filename = os.path.split(name)
+    extension = 'jpg' if getattr(settings, 'IMAGE_FORMAT', 'WEBP') == 'JPEG' else 'webp'
+    return '/'.join(part for part in (directory, 'thumbs', f"{filename}.{extension}") if part)
+
+
+def unique_name(name):
+    """name with a random suffix on its stem, so it never lands on another file's key"""
+    stem, extension = os.path.splitext(name)
+    return f"{stem}_{uuid.uuid4().hex[:8]}{extension}"
+
+
+def blob_path(instance, filename, sha256):
+    """
+    Content-addressed path: media/blobs/{account_id}/{sha256}{ext}, or None without an account.
+    Keyed by id, not name: schools whose names clean to the same string must not share blobs.
+    """
+    account = get_account(instance)
+    if account is None or account.pk is None:
+        return None
+    return f"{BLOB_DIRECTORY}/{account.pk}/{sha256}{os.path.splitext(filename)[1].lower()}"
+
+
+def is_blob_name(name):
+    return bool(name) and f'/{BLOB_DIRECTORY}/' in f'/{name}'
+
+
+def get_account(instance):
+    """The instance's account, or that of the student/employee/payment/receipt it belongs to"""
+    if instance._meta.label == 'users.Account':
+        return instance
+    account = getattr(instance, 'account', None)
+    for parent_name in ('student', 'employee', 'payment', 'recipient'):
+        if account:
+            break
+        parent = getattr(instance, parent_name, None)
+        account = getattr(parent, 'account', None)
+    return account
+
+
 def get_account_name(instance):
-    """Get account name from instance"""
-    if hasattr(instance, 'account') and instance.account:
-        return clean_name(instance.account.name or str(instance.account.id))
+    """Get account name from instance, or from the student/employee/payment/receipt it belongs to"""
+    account = get_account(instance)
+    if account:
+        return clean_name(account.name or str(account.id))
     return 'default'
 
 
 @deconstructible
 class StudentDocumentPath:
-    """Path: media/{account_name}/students/{student_id}/"""
+    """Path: media/{account_name}/students/{student_id}/{filename}_{random}"""
+    # Students often upload several files with the same name (scan.pdf)
+    unique_names = True
     
     def __call__(self, instance, filename):
         account_name = get_account_name(instance)
@@ -32,7 +89,7 @@ class StudentDocumentPath:
             student_id = clean_name(instance.student_id or instance.id)
         
         safe_filename = clean_name(os.path.splitext(filename)[0]) + os.path.splitext(filename)[1]
-        return f"{account_name}/students/{student_id}/{safe_filename}"
+        return unique_name(f"{account_name}/students/{student_id}/{safe_filename}")
 
 
 @deconstructible
@@ -0,0 +1,225 @@
+# utils/images.py
+"""
+Upload-time image processing.
+
+When a new image is saved on one of IMAGE_FIELDS, process_image() runs in
+the background pool after commit: it applies the EXIF orientation, drops
+the metadata, downscales to IMAGE_MAX_DIMENSION and re-encodes to
+IMAGE_FORMAT, then writes a thumbnail next to it (see thumbnail_name). A
+re-encoded image that gets a new extension is stored under a name with a
+content hash, replaces the original on the row, and the original is queued
+for deletion.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import models
+from django.db.models.signals import pre_save, post_save
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+from .background import run_in_background
+from .file_handlers import is_image_name, thumbnail_name
+from .s3_outbox import queue_file_deletion
+from .models import StoredFile
+from .stored_files import (
+    file_account_id, file_source, key_hash, record_stored_file, storage_key, stored_file_account_id
+)
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = {
+    'payments.ChequeDetail': ['cheque_image'],
+    'employees.Employee': ['profile_picture'],
+    'students.Student': ['attachment'],
+    'users.Account': ['logo'],
+}
+
+
+def _image_format():
+    return 'JPEG' if getattr(settings, 'IMAGE_FORMAT', 'WEBP') == 'JPEG' else 'WEBP'
+
+
+def _encode(image, max_dimension):
+    """image scaled to fit max_dimension, encoded without metadata"""
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    image_format = _image_format()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if image_format == 'JPEG' and has_alpha:
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'L') or has_alpha:
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    options = {'quality': getattr(settings, 'IMAGE_QUALITY', 80)}
+    if image_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    else:
+        options['method'] = 4
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return ContentFile(output.getvalue())
+
+
+def _save_and_record(storage, name, content, account_id, source, sha256=None):
+    if sha256 is None:
+        sha256 = hashlib.sha256(content.read()).hexdigest()
+        content.seek(0)
+    saved_name = storage.save(name, content)
+    record_stored_file(
+        storage, saved_name, content.size, mimetypes.guess_type(saved_name)[0], sha256,
+        account_id=account_id, source=source,
+    )
+    return saved_name
+
+
+def process_image(model_label, pk, field_name, name):
+    """Normalize the stored image `name` of one row and write its thumbnail"""
+    model = apps.get_model(model_label)
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None or getattr(instance, field.attname).name != name:
+        return
+    try:
+        with storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning(f"Skipping image processing for {name}: {e}")
+        return
+
+    account_id = file_account_id(instance) or stored_file_account_id(storage, name)
+    source = file_source(model, field_name)
+    animated = getattr(image, 'is_animated', False)
+    image = ImageOps.exif_transpose(image)
+    # Re-encoding an animation would keep only its first frame; it just gets a thumbnail
+    if not animated and not _replace_with_encoded(instance, field, name, image, account_id, source):
+        return
+    final_name = getattr(instance, field.attname).name if not animated else name
+    _save_and_record(
+        storage, thumbnail_name(final_name), _encode(image, getattr(settings, 'IMAGE_THUMBNAIL_SIZE', 320)),
+        account_id, source
+    )
+
+
+def _replace_with_encoded(instance, field, name, image, account_id, source):
+    """
+    Store the re-encoded image and point the row at it. Returns False when the
+    row moved on to another file meanwhile, so there is nothing left to thumbnail.
+    """
+    storage = field.storage
+    content = _encode(image, getattr(settings, 'IMAGE_MAX_DIMENSION', 1600))
+    sha256 = hashlib.sha256(content.read()).hexdigest()
+    content.seek(0)
+    stem, extension = os.path.splitext(name)
+    new_extension = '.jpg' if _image_format() == 'JPEG' else '.webp'
+    if extension.lower() != new_extension:
+        # MediaStorage overwrites: a content-derived suffix keeps a.png and a.jpg
+        # (or another row's a.webp) from landing on the same key
+        stem = f"{stem}_{sha256[:8]}"
+    new_name = _save_and_record(storage, stem + new_extension, content, account_id, source, sha256)
+    if new_name == name:
+        return True
+
+    model = type(instance)
+    instance.refresh_from_db(fields=[field.attname])
+    if getattr(instance, field.attname).name != name:
+        # Replaced while we worked: drop the re-encoded copy (unless a row now uses it)
+        queue_file_deletion(field.attr_class(instance, field, new_name), thumbnail=False)
+        return False
+    old_file = getattr(instance, field.attname)
+    setattr(instance, field.attname, new_name)
+    update_fields = [field.attname]
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        update_fields.append('updated_at')
+    instance.save(update_fields=update_fields)
+    # Also drops a thumbnail an earlier run made for the original
+    queue_file_deletion(old_file)
+    return True
+
+
+def schedule_image_processing(instance, field_name):
+    """Process the row's current image for field_name in the background once the transaction commits"""
+    label = instance._meta.label
+    if field_name not in IMAGE_FIELDS.get(label, ()) or not getattr(settings, 'IMAGE_PROCESSING', True):
+        return
+    name = getattr(instance, field_name).name
+    if is_image_name(name):
+        run_in_background(process_image, label, instance.pk, field_name, name)
+
+
+def stored_thumbnails(field_files):
+    """{thumbnail name: written yet} for the image FieldFiles, from StoredFile in one query"""
+    by_hash = {}
+    for field_file in field_files:
+        if field_file and is_image_name(field_file.name):
+            name = thumbnail_name(field_file.name)
+            by_hash[key_hash(*storage_key(field_file.storage, name))] = name
+    found = set(StoredFile.objects.filter(key_hash__in=list(by_hash)).values_list('key_hash', flat=True))
+    return {name: digest in found for digest, name in by_hash.items()}
+
+
+def thumbnail_url(field_file, known=None):
+    """
+    URL of the thumbnail of an image FieldFile; None for empty fields, non-images
+    and images whose thumbnail the pipeline hasn't written yet. known is a
+    stored_thumbnails() result to consult before querying.
+    """
+    if not field_file or not is_image_name(field_file.name):
+        return None
+    name = thumbnail_name(field_file.name)
+    if known is None or name not in known:
+        known = stored_thumbnails([field_file])
+    if not known[name]:
+        return None
+    try:
+        return field_file.storage.url(name)
+    except Exception as e:
+        logger.error(f"Error getting thumbnail URL for {field_file.name}: {e}")
+        return None
+
+
+class ThumbnailListSerializer(serializers.ListSerializer):
+    """
+    Looks up the thumbnails of a whole list in one query. The child lists its
+    image fields in Meta.thumbnail_fields and passes
+    self.context.get('stored_thumbnails') to thumbnail_url.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        field_files = [getattr(item, name) for item in items for name in self.child.Meta.thumbnail_fields]
+        self.context.setdefault('stored_thumbnails', {}).update(stored_thumbnails(field_files))
+        return super().to_representation(items)
+
+
+def _mark_new_images(sender, instance, **kwargs):
+    # Freshly assigned uploads are uncommitted until the field's pre_save stores them
+    instance._new_image_fields = [
+        field_name for field_name in IMAGE_FIELDS[sender._meta.label]
+        if getattr(instance, field_name) and not getattr(instance, field_name)._committed
+    ]
+
+
+def _process_new_images(sender, instance, **kwargs):
+    for field_name in getattr(instance, '_new_image_fields', ()):
+        schedule_image_processing(instance, field_name)
+    instance._new_image_fields = []
+
+
+def connect_image_processing_signals():
+    for label in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        pre_save.connect(_mark_new_images, sender=model, dispatch_uid=f'image-processing-mark-{label}')
+        post_save.connect(_process_new_images, sender=model, dispatch_uid=f'image-processing-run-{label}')
@@ -0,0 +1,90 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from utils.models import StoredFile
+from utils.s3_client import get_s3_client
+from utils.s3_outbox import FILE_MODELS
+from utils.stored_files import ACCOUNT_LOOKUPS, file_source, key_hash
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Record size, content type and checksum of files uploaded before StoredFile existed (HEAD requests in parallel)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent HEAD requests")
+
+    def handle(self, *args, **options):
+        client = get_s3_client()
+        created = missing = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for model, field in self.file_fields():
+                rows = (
+                    model._default_manager.exclude(**{field.attname: ''}).exclude(**{f'{field.attname}__isnull': True})
+                    .annotate(file_account=ACCOUNT_LOOKUPS[model._meta.label])
+                    .values_list(field.attname, 'file_account')
+                )
+                batch = []
+                for row in rows.iterator(chunk_size=BATCH_SIZE):
+                    batch.append(row)
+                    if len(batch) == BATCH_SIZE:
+                        counts = self.backfill(pool, client, model, field, batch)
+                        created, missing = created + counts[0], missing + counts[1]
+                        batch = []
+                if batch:
+                    counts = self.backfill(pool, client, model, field, batch)
+                    created, missing = created + counts[0], missing + counts[1]
+        self.stdout.write(f"Recorded {created} files, {missing} referenced files are missing from S3")
+
+    def file_fields(self):
+        for label in FILE_MODELS:
+            model = apps.get_model(label)
+            for field in model._meta.concrete_fields:
+                if isinstance(field, models.FileField) and isinstance(field.storage, S3Boto3Storage):
+                    yield model, field
+
+    def backfill(self, pool, client, model, field, rows):
+        """HEAD the files of rows that have no StoredFile yet; returns (created, missing)"""
+        storage = field.storage
+        bucket = storage.bucket_name
+        wanted = {}
+        for name, account_id in rows:
+            key = storage._normalize_name(name)
+            wanted.setdefault(key_hash(bucket, key), (key, account_id))
+        known = set(StoredFile.objects.filter(key_hash__in=list(wanted)).values_list('key_hash', flat=True))
+        todo = [(digest, key, account_id) for digest, (key, account_id) in wanted.items() if digest not in known]
+
+        def head(item):
+            try:
+                return item, client.head_object(Bucket=bucket, Key=item[1], ChecksumMode='ENABLED')
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    return item, None
+                raise
+
+        records, missing = [], 0
+        for (digest, key, account_id), response in pool.map(head, todo):
+            if response is None:
+                missing += 1
+                continue
+            checksum = response.get('ChecksumSHA256')
+            records.append(StoredFile(
+                account_id=account_id,
+                bucket=bucket,
+                key=key,
+                key_hash=digest,
+                source=file_source(model, field.name),
+                size=response['ContentLength'],
+                content_type=response.get('ContentType') or '',
+                # Only objects uploaded with a SHA-256 checksum report one
+                sha256=base64.b64decode(checksum).hex() if checksum and '-' not in checksum else '',
+            ))
+        StoredFile.objects.bulk_create(records, ignore_conflicts=True)
+        return len(records), missing
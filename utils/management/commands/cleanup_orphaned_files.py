@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from utils.file_cleanup import FileCleanupManager
+
+
+class Command(BaseCommand):
+    help = "Delete media files in S3 that no row references, for all accounts and file types"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+        parser.add_argument('--prefix', default='', help="Limit to keys under media/<prefix>, e.g. an account name")
+        parser.add_argument(
+            '--min-age-hours', type=float, default=24,
+            help="Leave objects younger than this alone (uploads awaiting confirmation)"
+        )
+
+    def handle(self, *args, **options):
+        manager = FileCleanupManager(prefix=options['prefix'], min_age=timedelta(hours=options['min_age_hours']))
+        report = manager.cleanup(dry_run=options['dry_run'])
+
+        self.stdout.write(
+            f"{report['orphaned']} orphaned files ({report['orphaned_bytes'] / (1024 * 1024):.1f} MB) under "
+            f"{report['prefix']}, {report['referenced']} keys referenced"
+        )
+        for key in report['sample']:
+            self.stdout.write(f"  {key}")
+        if report['orphaned'] > len(report['sample']):
+            self.stdout.write(f"  ... and {report['orphaned'] - len(report['sample'])} more")
+        if not options['dry_run']:
+            self.stdout.write(f"Deleted {report['deleted']}, {report['failed']} failed and will be retried")
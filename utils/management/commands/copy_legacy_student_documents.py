@@ -0,0 +1,68 @@
+import hashlib
+import mimetypes
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from students.models import StudentDocument
+from utils.stored_files import file_source, record_stored_file
+
+# StudentDocument.document was saved to the server's disk under this prefix before it moved to S3
+LEGACY_PREFIX = 'student_documents/'
+
+
+class Command(BaseCommand):
+    help = ("Copy student documents saved on the server's disk before they moved to S3 into S3 "
+            "under their current names, so existing rows resolve again")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.MEDIA_ROOT or str(settings.BASE_DIR),
+                            help="Directory the legacy student_documents/ folder lives in")
+        parser.add_argument('--delete-local', action='store_true',
+                            help="Remove the disk copy once the document is in S3")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be copied")
+
+    def handle(self, *args, **options):
+        source = FileSystemStorage(location=options['source'])
+        storage = StudentDocument._meta.get_field('document').storage
+        documents = StudentDocument.objects.filter(
+            document__startswith=LEGACY_PREFIX
+        ).select_related('student').order_by('uploaded_at')
+
+        copied = present = missing = 0
+        for document in documents.iterator():
+            name = document.document.name
+            if storage.exists(name):
+                present += 1
+                self.delete_local(source, name, options)
+                continue
+            if not source.exists(name):
+                missing += 1
+                self.stderr.write(f"Missing on disk: {name} (document {document.pk})")
+                continue
+            copied += 1
+            if options['dry_run']:
+                continue
+
+            with source.open(name, 'rb') as f:
+                content = f.read()
+            # MediaStorage overwrites, so the key is the name the row already holds
+            storage.save(name, ContentFile(content))
+            record_stored_file(
+                storage, name, len(content), mimetypes.guess_type(name)[0],
+                hashlib.sha256(content).hexdigest(),
+                account_id=document.student.account_id,
+                source=file_source(StudentDocument, 'document'),
+            )
+            self.delete_local(source, name, options)
+
+        verb = "would be" if options['dry_run'] else "were"
+        self.stdout.write(
+            f"{copied} documents {verb} copied to S3, {present} already there, {missing} missing on disk"
+        )
+
+    def delete_local(self, source, name, options):
+        if options['delete_local'] and not options['dry_run'] and source.exists(name):
+            source.delete(name)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from utils.models import S3DeletionOutbox
+from utils.s3_outbox import drain_s3_deletions
+
+
+class Command(BaseCommand):
+    help = "Delete S3 objects queued in the deletion outbox (run periodically as a backstop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches of 1000 keys")
+
+    def handle(self, *args, **options):
+        deleted, failed = drain_s3_deletions(max_batches=options['max_batches'])
+        waiting = S3DeletionOutbox.objects.count()
+        self.stdout.write(f"Deleted {deleted} objects, {failed} failed and will be retried, {waiting} still queued")
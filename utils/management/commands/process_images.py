@@ -0,0 +1,31 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from utils.file_handlers import is_image_name, thumbnail_name
+from utils.images import IMAGE_FIELDS, process_image
+
+
+class Command(BaseCommand):
+    help = "Re-encode and thumbnail images uploaded before the image pipeline (skips images that have a thumbnail)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Process images that already have a thumbnail too")
+
+    def handle(self, *args, **options):
+        processed = 0
+        for label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                storage = model._meta.get_field(field_name).storage
+                rows = (
+                    model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                    .values_list('pk', field_name)
+                )
+                for pk, name in rows.iterator():
+                    if not is_image_name(name):
+                        continue
+                    if not options['force'] and storage.exists(thumbnail_name(name)):
+                        continue
+                    process_image(label, pk, field_name, name)
+                    processed += 1
+        self.stdout.write(f"Processed {processed} images")
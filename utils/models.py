@@ -5,4 +5,54 @@ class Counter(models.Model):
     value = models.PositiveIntegerField(default=0)
 
     def __str__(self):
-        return f"{self.key} = {self.value}"
\ No newline at end of file
+        return f"{self.key} = {self.value}"
+
+class S3DeletionOutbox(models.Model):
+    """
+    S3 objects waiting to be deleted. Rows are added when a record owning a
+    file is deleted (or its file is removed) and drained in batches by
+    utils.s3_outbox.drain_s3_deletions.
+    """
+    bucket = models.CharField(max_length=255)
+    key = models.CharField(max_length=1024)
+    # sha256 of bucket/key: keys are too long for a unique index on MySQL
+    key_hash = models.CharField(max_length=64, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.bucket}/{self.key}"
+
+
+class StoredFile(models.Model):
+    """
+    Size, content type and checksum of an uploaded object, recorded when it is
+    written (utils.stored_files), so storage usage is a SUM over this table
+    instead of a HEAD per object or a bucket listing.
+    """
+    account = models.ForeignKey(
+        'users.Account', on_delete=models.CASCADE, null=True, blank=True, related_name='stored_files'
+    )
+    bucket = models.CharField(max_length=255, blank=True, default='')
+    key = models.CharField(max_length=1024)
+    # Same sha256 of bucket/key as S3DeletionOutbox.key_hash
+    key_hash = models.CharField(max_length=64, unique=True)
+    # "<app>.<Model>.<field>" the file belongs to
+    source = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    # Rows pointing at a content-addressed blob (utils.blobs); unused for other files
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'source'], name='storedfile_acct_source'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.size} bytes)"
@@ -0,0 +1,24 @@
+# utils/pagination.py
+from rest_framework.pagination import PageNumberPagination
+
+
+class OptInPaginationMixin:
+    """
+    Only paginate when the client asks for it (one of opt_in_query_params or
+    page_size_query_param is present), so existing callers keep getting a plain list.
+    """
+    opt_in_query_params = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not any(param in params for param in (*self.opt_in_query_params, self.page_size_query_param)):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class OptInPageNumberPagination(OptInPaginationMixin, PageNumberPagination):
+    """Page number pagination that only kicks in with ?page or ?page_size"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    opt_in_query_params = ('page',)
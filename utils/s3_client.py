@@ -0,0 +1,234 @@
+# utils/s3_client.py
+"""
+Process-wide S3 client.
+
+boto3 clients are thread-safe, so one client (one credential resolution,
+one HTTP connection pool) is created lazily and shared by every
+S3FileManager. Resources are not thread-safe; get_s3_resource() gives each
+thread one resource built from the shared session, which MediaStorage uses
+instead of a resource per storage instance per thread.
+
+Set S3_LOCAL_ROOT to a directory to swap in LocalS3Client, a filesystem
+stand-in for tests and offline development.
+"""
+import base64
+import hashlib
+import mimetypes
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+_lock = threading.Lock()
+_session = None
+_client = None
+_resources = threading.local()
+
+
+def s3_client_config():
+    """Connection pooling, timeouts and retries shared by the client and the storage resources"""
+    return Config(
+        region_name=settings.AWS_S3_REGION_NAME,
+        signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4'),
+        s3={'addressing_style': getattr(settings, 'AWS_S3_ADDRESSING_STYLE', 'virtual')},
+        max_pool_connections=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 20),
+        connect_timeout=getattr(settings, 'AWS_S3_CONNECT_TIMEOUT', 5),
+        read_timeout=getattr(settings, 'AWS_S3_READ_TIMEOUT', 30),
+        retries={'max_attempts': getattr(settings, 'AWS_S3_MAX_ATTEMPTS', 5), 'mode': 'standard'},
+    )
+
+
+def _get_session():
+    # Called with _lock held: sessions are not safe to share while creating clients
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_S3_REGION_NAME,
+        )
+    return _session
+
+
+def get_s3_client():
+    """The shared S3 client (or LocalS3Client when S3_LOCAL_ROOT is set)"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                local_root = getattr(settings, 'S3_LOCAL_ROOT', None)
+                if local_root:
+                    _client = LocalS3Client(local_root)
+                else:
+                    _client = _get_session().client(
+                        's3',
+                        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                        config=s3_client_config(),
+                    )
+    return _client
+
+
+def get_s3_resource():
+    """This thread's S3 resource, shared by all storage instances"""
+    resource = getattr(_resources, 'resource', None)
+    if resource is None:
+        with _lock:
+            resource = _get_session().resource(
+                's3',
+                endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                use_ssl=getattr(settings, 'AWS_S3_USE_SSL', True),
+                verify=getattr(settings, 'AWS_S3_VERIFY', None),
+                config=s3_client_config(),
+            )
+        _resources.resource = resource
+    return resource
+
+
+def reset_s3_client():
+    """Drop the shared client and session, e.g. after changing settings in tests"""
+    global _client, _session
+    with _lock:
+        _client = None
+        _session = None
+    _resources.__dict__.clear()
+
+
+def _client_error(code, operation, message='', status=None):
+    return ClientError(
+        {'Error': {'Code': code, 'Message': message or code},
+         'ResponseMetadata': {'HTTPStatusCode': status or (404 if code in ('404', 'NoSuchKey') else 400)}},
+        operation,
+    )
+
+
+class LocalS3Client:
+    """
+    Filesystem stand-in for the subset of the S3 client API this project uses.
+    Buckets are directories under root; errors are raised as ClientError with
+    the same codes S3 returns.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        path = os.path.abspath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.abspath(os.path.join(self.root, bucket))):
+            raise _client_error('InvalidKey', 'LocalS3')
+        return path
+
+    def _head(self, path):
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            etag = hashlib.md5(f.read()).hexdigest()
+        return {
+            'ContentLength': stat.st_size,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+            'ContentType': mimetypes.guess_type(path)[0] or 'binary/octet-stream',
+            'ETag': f'"{etag}"',
+        }
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = Body.read() if hasattr(Body, 'read') else Body
+        if isinstance(data, str):
+            data = data.encode()
+        with open(path, 'wb') as f:
+            f.write(data)
+        return {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _client_error('NoSuchKey', 'GetObject')
+        return {**self._head(path), 'Body': open(path, 'rb')}
+
+    def head_object(self, Bucket, Key, ChecksumMode=None, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _client_error('404', 'HeadObject', 'Not Found')
+        head = self._head(path)
+        if ChecksumMode == 'ENABLED':
+            with open(path, 'rb') as f:
+                head['ChecksumSHA256'] = base64.b64encode(hashlib.sha256(f.read()).digest()).decode()
+        return head
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        source = self.get_object(Bucket=CopySource['Bucket'], Key=CopySource['Key'])
+        with source['Body'] as body:
+            return {'CopyObjectResult': self.put_object(Bucket=Bucket, Key=Key, Body=body)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        for obj in Delete['Objects']:
+            self.delete_object(Bucket=Bucket, Key=obj['Key'])
+            deleted.append({'Key': obj['Key']})
+        return {'Deleted': deleted, 'Errors': []}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        bucket_root = os.path.join(self.root, Bucket)
+        keys = []
+        for directory, _, files in os.walk(bucket_root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [key for key in keys if key > after]
+        page = keys[:MaxKeys]
+        contents = []
+        for key in page:
+            head = self._head(self._path(Bucket, key))
+            contents.append({'Key': key, 'Size': head['ContentLength'], 'LastModified': head['LastModified']})
+        response = {
+            'Contents': contents,
+            'KeyCount': len(page),
+            'IsTruncated': len(keys) > MaxKeys,
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        if not page:
+            del response['Contents']
+        return response
+
+    def get_paginator(self, operation_name):
+        return _LocalPaginator(getattr(self, operation_name))
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600, **kwargs):
+        return {'url': f"file://{os.path.join(os.path.abspath(self.root), Bucket)}", 'fields': {**(Fields or {}), 'key': Key}}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"file://{self._path(params.get('Bucket', ''), params.get('Key', ''))}"
+
+
+class _LocalPaginator:
+    """Follows NextContinuationToken like a boto3 paginator; single-page operations yield once"""
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self.method(**kwargs, **({'ContinuationToken': token} if token else {}))
+            yield page
+            token = page.get('NextContinuationToken') if page.get('IsTruncated') else None
+            if not token:
+                return
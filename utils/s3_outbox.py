@@ -0,0 +1,215 @@
+# utils/s3_outbox.py
+"""
+Deferred S3 deletions.
+
+queue_file_deletion() records the object in S3DeletionOutbox once the
+surrounding transaction commits, so the request never waits on S3 and a
+rolled back delete never loses a file. drain_s3_deletions() removes queued
+objects with delete_objects, up to 1000 keys per call; failures are retried
+with exponential backoff. Deleting an object that is already gone counts as
+success, so draining twice is harmless.
+
+post_delete signals on every model with a FileField queue that row's files,
+which also covers cascading deletes of students, employees and payments.
+Image thumbnails are queued along with their image. Upload paths are derived
+from file names, so a key can be shared or reused; keys still referenced by a
+row when the batch runs are dropped, not deleted.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .background import run_in_background
+from .blobs import release_blob
+from .file_handlers import is_blob_name, is_image_name, thumbnail_name
+from .models import S3DeletionOutbox
+from .s3_client import get_s3_client
+from .stored_files import forget_stored_files, key_hash
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000  # S3 delete_objects limit
+MAX_BACKOFF = timedelta(hours=6)
+
+_drain_lock = threading.Lock()
+
+# Models whose files are cleaned up when a row is deleted
+FILE_MODELS = [
+    'users.Account',
+    'employees.Employee',
+    'employees.EmployeeDocument',
+    'students.Student',
+    'students.StudentDocument',
+    'payments.ChequeDetail',
+    'payments.PaymentDocument',
+]
+
+
+def queue_s3_deletion(keys, bucket=None, drain=True):
+    """
+    Queue S3 object keys for deletion after the current transaction commits.
+    drain=False skips the background drain, for callers that drain themselves.
+    """
+    bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+
+    def enqueue():
+        now = timezone.now()
+        S3DeletionOutbox.objects.bulk_create(
+            [S3DeletionOutbox(bucket=bucket, key=key, key_hash=key_hash(bucket, key), next_attempt_at=now)
+             for key in keys],
+            ignore_conflicts=True,
+        )
+        if drain and getattr(settings, 'S3_DELETION_DRAIN_ON_COMMIT', True):
+            run_in_background(_drain_if_idle)
+
+    transaction.on_commit(enqueue)
+
+
+def queue_file_deletion(field_file, thumbnail=True):
+    """
+    Queue the file behind a FieldFile, and its thumbnail if it is an image;
+    files on non-S3 storages are deleted directly after commit. A shared
+    blob (utils.blobs) is only queued once its last reference is released.
+    """
+    if not field_file or not field_file.name:
+        return
+    storage = field_file.storage
+    names = [field_file.name]
+    if thumbnail and is_image_name(field_file.name):
+        names.append(thumbnail_name(field_file.name))
+
+    def queue():
+        if isinstance(storage, S3Boto3Storage):
+            queue_s3_deletion([storage._normalize_name(name) for name in names], bucket=storage.bucket_name)
+        else:
+            def delete():
+                for name in names:
+                    storage.delete(name)
+                forget_stored_files('', names)
+
+            transaction.on_commit(delete)
+
+    if is_blob_name(names[0]):
+        transaction.on_commit(lambda: release_blob(storage, names[0]) and queue())
+    else:
+        queue()
+
+
+def _fail(rows, errors, now):
+    """Schedule a retry; errors is one error for all rows or a {key: error} dict"""
+    for row in rows:
+        row.attempts += 1
+        row.last_error = str(errors.get(row.key) if isinstance(errors, dict) else errors)[:2000]
+        row.next_attempt_at = now + min(timedelta(seconds=30 * 2 ** row.attempts), MAX_BACKOFF)
+    S3DeletionOutbox.objects.bulk_update(rows, ['attempts', 'last_error', 'next_attempt_at'])
+
+
+def _file_fields():
+    """(model, field) for every S3-backed file field of FILE_MODELS"""
+    for label in FILE_MODELS:
+        model = apps.get_model(label)
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and isinstance(field.storage, S3Boto3Storage):
+                yield model, field
+
+
+def referenced_keys(bucket, keys):
+    """The subset of keys that some row still points at (one query per file field)"""
+    referenced = set()
+    for model, field in _file_fields():
+        storage = field.storage
+        if storage.bucket_name != bucket:
+            continue
+        prefix = f'{storage.location}/' if storage.location else ''
+        names = {key[len(prefix):]: key for key in keys if key.startswith(prefix)}
+        if not names:
+            continue
+        found = model._default_manager.filter(**{f'{field.name}__in': list(names)}).values_list(field.name, flat=True)
+        referenced.update(names[name] for name in found)
+    return referenced
+
+
+def drain_s3_deletions(max_batches=None):
+    """Delete due outbox entries in batches; returns (deleted, failed) counts"""
+    client = get_s3_client()
+    deleted = failed = batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        rows = list(
+            S3DeletionOutbox.objects.filter(next_attempt_at__lte=now, id__gt=last_id)
+            .order_by('id')[:DELETE_BATCH_SIZE]
+        )
+        if not rows:
+            break
+        batches += 1
+        last_id = rows[-1].id
+
+        by_bucket = {}
+        for row in rows:
+            by_bucket.setdefault(row.bucket, []).append(row)
+
+        for bucket, bucket_rows in by_bucket.items():
+            in_use = referenced_keys(bucket, [row.key for row in bucket_rows])
+            if in_use:
+                S3DeletionOutbox.objects.filter(id__in=[row.id for row in bucket_rows if row.key in in_use]).delete()
+                bucket_rows = [row for row in bucket_rows if row.key not in in_use]
+                if not bucket_rows:
+                    continue
+            try:
+                response = client.delete_objects(
+                    Bucket=bucket,
+                    Delete={'Objects': [{'Key': row.key} for row in bucket_rows], 'Quiet': True},
+                )
+            except Exception as e:
+                logger.warning(f"S3 batch delete failed for {len(bucket_rows)} keys: {e}")
+                _fail(bucket_rows, e, now)
+                failed += len(bucket_rows)
+                continue
+
+            errors = {
+                error['Key']: f"{error.get('Code')}: {error.get('Message')}"
+                for error in response.get('Errors', [])
+                if error.get('Code') != 'NoSuchKey'
+            }
+            failed_rows = [row for row in bucket_rows if row.key in errors]
+            if failed_rows:
+                _fail(failed_rows, errors, now)
+            done_ids = [row.id for row in bucket_rows if row.key not in errors]
+            S3DeletionOutbox.objects.filter(id__in=done_ids).delete()
+            forget_stored_files(bucket, [row.key for row in bucket_rows if row.key not in errors])
+            deleted += len(done_ids)
+            failed += len(failed_rows)
+    return deleted, failed
+
+
+def _drain_if_idle():
+    # One drain per process at a time; the drain_s3_deletions command picks up anything left
+    if _drain_lock.acquire(blocking=False):
+        try:
+            drain_s3_deletions()
+        finally:
+            _drain_lock.release()
+
+
+def _delete_instance_files(sender, instance, **kwargs):
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, models.FileField):
+            queue_file_deletion(getattr(instance, field.attname))
+
+
+def connect_file_deletion_signals():
+    for label in FILE_MODELS:
+        post_delete.connect(
+            _delete_instance_files, sender=apps.get_model(label), dispatch_uid=f's3-outbox-delete-{label}'
+        )
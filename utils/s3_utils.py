@@ -1,34 +1,28 @@
-import boto3
 from django.conf import settings
 from botocore.exceptions import ClientError, NoCredentialsError
 import logging
 
+from .s3_client import get_s3_client
+
 logger = logging.getLogger(__name__)
 
 
 class S3FileManager:
     def __init__(self, skip_connection_test=True):
         """
-        Initialize S3 client with optional connection testing
+        Initialize S3 client with optional connection testing.
+        The client itself is the process-wide one from utils.s3_client, so this is cheap.
         
         Args:
             skip_connection_test (bool): Skip the initial connection test to avoid permission errors
         """
         try:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-                endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None)
-            )
+            self.s3_client = get_s3_client()
             self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
             
             # Only test connection if explicitly requested
             if not skip_connection_test:
                 self._test_connection()
-            else:
-                logger.info("S3FileManager initialized (connection test skipped)")
                 
         except NoCredentialsError:
             logger.error("AWS credentials not found")
@@ -1,8 +1,14 @@
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.utils.module_loading import import_string
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
 from botocore.exceptions import ClientError
 import logging
 
+from .s3_client import LocalS3Client, get_s3_client, get_s3_resource, s3_client_config
+
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +26,13 @@ class MediaStorage(S3Boto3Storage):
         kwargs['bucket_name'] = settings.AWS_STORAGE_BUCKET_NAME
         kwargs['region_name'] = settings.AWS_S3_REGION_NAME
         kwargs['endpoint_url'] = settings.AWS_S3_ENDPOINT_URL
+        kwargs.setdefault('client_config', s3_client_config())
         super().__init__(*args, **kwargs)
+
+    @property
+    def connection(self):
+        # One resource per thread for all storages instead of one per storage per thread
+        return get_s3_resource()
     
     def exists(self, name):
         """Handle permission errors gracefully"""
@@ -75,6 +87,61 @@ class MediaStorage(S3Boto3Storage):
             # Fallback URL
             return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{self.location}/{name}"
 
+class LocalMediaStorage(MediaStorage):
+    """
+    MediaStorage on top of LocalS3Client, used when S3_LOCAL_ROOT is set.
+    Bucket, location and key handling are MediaStorage's, so code built on
+    them works unchanged; only the file I/O and URLs stay on the local disk.
+    """
+
+    @property
+    def local_client(self):
+        client = get_s3_client()
+        if not isinstance(client, LocalS3Client):
+            raise ImproperlyConfigured("LocalMediaStorage needs S3_LOCAL_ROOT to be set")
+        return client
+
+    def _key(self, name):
+        return self._normalize_name(clean_name(name))
+
+    def _open(self, name, mode='rb'):
+        try:
+            response = self.local_client.get_object(Bucket=self.bucket_name, Key=self._key(name))
+        except ClientError:
+            raise FileNotFoundError(f"File does not exist: {self._key(name)}")
+        return File(response['Body'], name)
+
+    def _save(self, name, content):
+        name = clean_name(name)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.local_client.put_object(Bucket=self.bucket_name, Key=self._key(name), Body=content)
+        return name
+
+    def delete(self, name):
+        self.local_client.delete_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def exists(self, name):
+        try:
+            self.local_client.head_object(Bucket=self.bucket_name, Key=self._key(name))
+            return True
+        except ClientError:
+            return False
+
+    def size(self, name):
+        return self.local_client.head_object(Bucket=self.bucket_name, Key=self._key(name))['ContentLength']
+
+    def get_modified_time(self, name):
+        return self.local_client.head_object(Bucket=self.bucket_name, Key=self._key(name))['LastModified']
+
+    def url(self, name):
+        return f"file://{self.local_client._path(self.bucket_name, self._key(name))}"
+
+
+def media_storage():
+    """The storage class named by settings.MEDIA_STORAGE, for FileField(storage=media_storage)"""
+    return import_string(settings.MEDIA_STORAGE)()
+
 class StaticStorage(S3Boto3Storage):
     """
     Static files storage backend
@@ -88,4 +155,9 @@ class StaticStorage(S3Boto3Storage):
         kwargs['bucket_name'] = settings.AWS_STORAGE_BUCKET_NAME
         kwargs['region_name'] = settings.AWS_S3_REGION_NAME
         kwargs['endpoint_url'] = settings.AWS_S3_ENDPOINT_URL
-        super().__init__(*args, **kwargs)
\ No newline at end of file
+        kwargs.setdefault('client_config', s3_client_config())
+        super().__init__(*args, **kwargs)
+
+    @property
+    def connection(self):
+        return get_s3_resource()
\ No newline at end of file
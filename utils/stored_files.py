@@ -0,0 +1,142 @@
+# utils/stored_files.py
+"""
+File metadata recorded at upload time.
+
+Multipart uploads are measured in pre_save, while the bytes are still on
+the worker (size, content type, SHA-256), and recorded in post_save under
+the final key. Direct uploads are recorded from the confirm step's HEAD and
+the checksum S3 verified, and re-encoded images by the image pipeline.
+Rows are removed when the outbox deletes the object.
+
+A row that can't reach its account yet (a cheque image saved before the
+cheque is attached to a payment) can carry the account in a
+`file_account_id` attribute.
+"""
+import hashlib
+import mimetypes
+
+from django.apps import apps
+from django.db import models
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save
+
+from .models import StoredFile
+
+# How each file-owning model reaches its account, for queries over many rows
+ACCOUNT_LOOKUPS = {
+    'users.Account': F('pk'),
+    'employees.Employee': F('account_id'),
+    'students.Student': F('account_id'),
+    'employees.EmployeeDocument': F('employee__account_id'),
+    'students.StudentDocument': F('student__account_id'),
+    'payments.PaymentDocument': Coalesce('payment__account_id', 'recipient__account_id'),
+    'payments.ChequeDetail': Coalesce(Min('payments__account_id'), Min('recipients__account_id')),
+}
+
+
+def key_hash(bucket, key):
+    return hashlib.sha256(f'{bucket}/{key}'.encode()).hexdigest()
+
+
+def storage_key(storage, name):
+    """(bucket, key) of a stored name; non-S3 storages have no bucket"""
+    if hasattr(storage, 'bucket_name'):
+        return storage.bucket_name, storage._normalize_name(name)
+    return '', name
+
+
+def file_source(model, field_name):
+    return f'{model._meta.label}.{field_name}'
+
+
+def file_account_id(instance):
+    hint = getattr(instance, 'file_account_id', None)
+    if hint:
+        return hint
+    label = instance._meta.label
+    if label == 'users.Account':
+        return instance.pk
+    if getattr(instance, 'account_id', None):
+        return instance.account_id
+    lookup = ACCOUNT_LOOKUPS.get(label)
+    if lookup is None or instance.pk is None:
+        return None
+    return (
+        type(instance)._default_manager.filter(pk=instance.pk)
+        .annotate(file_account=lookup).values_list('file_account', flat=True).first()
+    )
+
+
+def stored_file_account_id(storage, name):
+    """Account recorded for a stored file, if any"""
+    bucket, key = storage_key(storage, name)
+    return StoredFile.objects.filter(key_hash=key_hash(bucket, key)).values_list('account_id', flat=True).first()
+
+
+def record_stored_file(storage, name, size, content_type, sha256='', account_id=None, source=''):
+    """Create or update the metadata row of one stored file"""
+    bucket, key = storage_key(storage, name)
+    StoredFile.objects.update_or_create(
+        key_hash=key_hash(bucket, key),
+        defaults={
+            'account_id': account_id,
+            'bucket': bucket,
+            'key': key,
+            'source': source,
+            'size': size,
+            'content_type': content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'sha256': sha256 or '',
+        },
+    )
+
+
+def forget_stored_files(bucket, keys):
+    """Drop the rows of objects that were deleted"""
+    StoredFile.objects.filter(key_hash__in=[key_hash(bucket, key) for key in keys]).delete()
+
+
+def storage_usage(account):
+    """{'files', 'bytes'} stored by the account, in one SUM query"""
+    totals = StoredFile.objects.filter(account=account).aggregate(files=Count('id'), bytes=Sum('size'))
+    return {'files': totals['files'], 'bytes': totals['bytes'] or 0}
+
+
+def _measure(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return upload.size, getattr(upload, 'content_type', None), digest.hexdigest()
+
+
+def _measure_new_files(sender, instance, **kwargs):
+    # Uploads are uncommitted until the field's pre_save stores them
+    instance._new_file_metadata = {
+        field.name: _measure(getattr(instance, field.attname).file)
+        for field in sender._meta.concrete_fields
+        if isinstance(field, models.FileField)
+        and getattr(instance, field.attname) and not getattr(instance, field.attname)._committed
+    }
+
+
+def _record_new_files(sender, instance, **kwargs):
+    metadata = getattr(instance, '_new_file_metadata', None)
+    if not metadata:
+        return
+    account_id = file_account_id(instance)
+    for field_name, (size, content_type, sha256) in metadata.items():
+        field_file = getattr(instance, field_name)
+        record_stored_file(
+            field_file.storage, field_file.name, size, content_type, sha256,
+            account_id=account_id, source=file_source(sender, field_name),
+        )
+    instance._new_file_metadata = {}
+
+
+def connect_stored_file_signals():
+    from .s3_outbox import FILE_MODELS
+    for label in FILE_MODELS:
+        model = apps.get_model(label)
+        pre_save.connect(_measure_new_files, sender=model, dispatch_uid=f'stored-files-measure-{label}')
+        post_save.connect(_record_new_files, sender=model, dispatch_uid=f'stored-files-record-{label}')
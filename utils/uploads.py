@@ -0,0 +1,352 @@
+# utils/uploads.py
+"""
+Direct-to-S3 uploads.
+
+presign_upload() resolves what the file is for, works out its key with the
+field's own upload_to path and returns a presigned POST policy that only
+accepts that key, one declared content type and a bounded size, plus a
+signed token describing the upload. The browser posts the file straight to
+S3; confirm_upload() then checks the token, HEADs the object and records it
+on the row and in StoredFile. The file bytes never pass through Django.
+"""
+import base64
+import os
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from employees.models import Employee, EmployeeDocument
+from employees.serializers import EmployeeDocumentSerializer
+from logs.utils import log_activity
+from payments.models import ChequeDetail, Payment, PaymentDocument, Recipient
+from payments.serializers import ChequeDetailSerializer, PaymentDocumentSerializer
+from students.models import Student, StudentDocument
+from students.serializers import StudentDocumentSerializer
+from users.models import Account
+from users.serializers import AccountUpdateSerializer
+
+from .blobs import blob_exists, is_blob_field, retain_blob
+from .file_handlers import blob_path, is_blob_name, unique_name
+from .images import schedule_image_processing
+from .s3_client import get_s3_client
+from .s3_outbox import queue_file_deletion
+from .stored_files import file_source, record_stored_file
+
+TOKEN_SALT = 'utils.uploads'
+
+IMAGE_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+DOCUMENT_CONTENT_TYPES = IMAGE_CONTENT_TYPES + (
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+)
+
+
+class UploadError(Exception):
+    """Rejected upload; message is shown to the user, status is the HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadTarget:
+    """Where an upload ends up: one FileField of one model, reached from the request parameters"""
+    model = None
+    field_name = 'document'
+    content_types = DOCUMENT_CONTENT_TYPES
+    max_size_setting = 'UPLOAD_MAX_DOCUMENT_SIZE'
+    default_max_size = 10 * 1024 * 1024
+    serializer_class = None
+
+    @property
+    def field(self):
+        return self.model._meta.get_field(self.field_name)
+
+    @property
+    def max_size(self):
+        return getattr(settings, self.max_size_setting, self.default_max_size)
+
+    def get_instance(self, request, params):
+        """The row the file belongs to; unsaved if the confirm step creates it"""
+        raise NotImplementedError
+
+    def save(self, instance):
+        instance.save()
+
+    def log_note(self, instance):
+        raise NotImplementedError
+
+    def serialize(self, instance, request):
+        return self.serializer_class(instance, context={'request': request}).data
+
+
+class _TypedDocumentTarget(UploadTarget):
+    """Documents unique per (parent, document_type): uploading again replaces the file"""
+    parent_model = None
+    parent_name = None  # FK to the parent; its id comes in as <parent_name>_id
+    not_found = ''
+
+    def get_instance(self, request, params):
+        document_type = params.get('document_type')
+        if document_type not in dict(self.model.DOCUMENT_TYPES):
+            raise UploadError('نوع الوثيقة غير صالح')
+        try:
+            parent = self.parent_model.objects.get(
+                id=params.get(f'{self.parent_name}_id'), account=request.user.account
+            )
+        except (self.parent_model.DoesNotExist, ValueError, ValidationError):
+            raise UploadError(self.not_found, status=404)
+        lookup = {self.parent_name: parent, 'document_type': document_type}
+        document = self.model.objects.filter(**lookup).first() or self.model(**lookup)
+        document.description = params.get('description', '')
+        document.uploaded_by = request.user
+        return document
+
+
+class StudentDocumentTarget(_TypedDocumentTarget):
+    model = StudentDocument
+    parent_model = Student
+    parent_name = 'student'
+    not_found = 'الطالب غير موجود'
+    serializer_class = StudentDocumentSerializer
+
+    def log_note(self, instance):
+        student = instance.student
+        return f"تم رفع وثيقة {instance.get_document_type_display()} للطالب {student.first_name} {student.second_name}"
+
+
+class EmployeeDocumentTarget(_TypedDocumentTarget):
+    model = EmployeeDocument
+    parent_model = Employee
+    parent_name = 'employee'
+    not_found = 'الموظف غير موجود'
+    serializer_class = EmployeeDocumentSerializer
+
+    def log_note(self, instance):
+        employee = instance.employee
+        return f"تم رفع وثيقة {instance.get_document_type_display()} للموظف {employee.first_name} {employee.last_name}"
+
+
+class PaymentDocumentTarget(UploadTarget):
+    """A new PaymentDocument for a payment (payment_id) or a recipient (recipient_id)"""
+    model = PaymentDocument
+    serializer_class = PaymentDocumentSerializer
+
+    def get_instance(self, request, params):
+        document_type = params.get('document_type')
+        if document_type not in dict(PaymentDocument.DOCUMENT_TYPES):
+            raise UploadError('نوع الوثيقة غير صالح')
+        document = PaymentDocument(
+            document_type=document_type,
+            description=params.get('description', ''),
+            uploaded_by=request.user,
+        )
+        if not params.get('payment_id') and not params.get('recipient_id'):
+            raise UploadError('يجب تحديد الدفعة أو الإيصال')
+        try:
+            if params.get('payment_id'):
+                document.payment = Payment.objects.get(id=params['payment_id'], account=request.user.account)
+            else:
+                document.recipient = Recipient.objects.get(id=params['recipient_id'], account=request.user.account)
+        except (Payment.DoesNotExist, Recipient.DoesNotExist, ValueError, ValidationError):
+            raise UploadError('الدفعة غير موجودة', status=404)
+        return document
+
+    def log_note(self, instance):
+        if instance.payment:
+            return f"تم رفع وثيقة {instance.get_document_type_display()} للدفعة {instance.payment.number}"
+        return f"تم رفع وثيقة {instance.get_document_type_display()} للإيصال {instance.recipient.number}"
+
+
+class ChequeImageTarget(UploadTarget):
+    """The image of a cheque already attached to one of the account's payments or receipts"""
+    model = ChequeDetail
+    field_name = 'cheque_image'
+    content_types = IMAGE_CONTENT_TYPES
+    max_size_setting = 'UPLOAD_MAX_IMAGE_SIZE'
+    default_max_size = 5 * 1024 * 1024
+    serializer_class = ChequeDetailSerializer
+
+    def get_instance(self, request, params):
+        account = request.user.account
+        try:
+            return ChequeDetail.objects.filter(
+                Q(payments__account=account) | Q(recipients__account=account), id=params.get('cheque_id')
+            ).distinct().get()
+        except (ChequeDetail.DoesNotExist, ValueError, ValidationError):
+            raise UploadError('الشيك غير موجود', status=404)
+
+    def log_note(self, instance):
+        return f"تم رفع صورة الشيك {instance.cheque_number or ''}".strip()
+
+
+class AccountLogoTarget(UploadTarget):
+    """The logo of the user's own account"""
+    model = Account
+    field_name = 'logo'
+    content_types = ('image/jpeg', 'image/png', 'image/gif')
+    max_size_setting = 'UPLOAD_MAX_IMAGE_SIZE'
+    default_max_size = 5 * 1024 * 1024
+    serializer_class = AccountUpdateSerializer
+
+    def get_instance(self, request, params):
+        # request.user.account may come from the auth cache; never save a stale copy over the row
+        return Account.objects.get(pk=request.user.account_id)
+
+    def save(self, instance):
+        instance.save(update_fields=['logo'])
+
+    def log_note(self, instance):
+        return "تم رفع شعار جديد للحساب"
+
+
+UPLOAD_TARGETS = {
+    'student_document': StudentDocumentTarget(),
+    'employee_document': EmployeeDocumentTarget(),
+    'payment_document': PaymentDocumentTarget(),
+    'cheque_image': ChequeImageTarget(),
+    'account_logo': AccountLogoTarget(),
+}
+
+
+def _get_target(name):
+    target = UPLOAD_TARGETS.get(name)
+    if target is None:
+        raise UploadError('نوع الرفع غير معروف')
+    return target
+
+
+def _storage_key(field, name):
+    """The S3 key a FileField stores under the given name (storage location included)"""
+    storage = field.storage
+    if not hasattr(storage, 'bucket_name'):
+        raise UploadError('الرفع المباشر غير متاح لهذا الملف')
+    return storage.bucket_name, storage._normalize_name(name)
+
+
+def presign_upload(request, target_name, filename, content_type, size, params, sha256=''):
+    """
+    Presigned POST for one file. Returns {'exists', 'url', 'fields', 'token', 'key', 'max_size', 'expires_in'};
+    the client posts `fields` plus the file to `url`, then sends `token` to the confirm endpoint.
+    With the file's hex sha256, S3 rejects an upload whose content doesn't match it, and
+    documents go to their content-addressed blob: when that blob is already stored the
+    answer is {'exists': True, 'token', ...} and the client confirms without uploading.
+    """
+    target = _get_target(target_name)
+    if not filename or not os.path.splitext(filename)[1]:
+        raise UploadError('اسم الملف غير صالح')
+    if content_type not in target.content_types:
+        raise UploadError('نوع الملف غير مدعوم')
+    if size is not None and not 0 < size <= target.max_size:
+        raise UploadError(f'حجم الملف كبير جداً. الحد الأقصى {target.max_size // (1024 * 1024)} ميجابايت')
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('قيمة التحقق من الملف غير صالحة')
+
+    instance = target.get_instance(request, params)
+    storage = target.field.storage
+    expires_in = getattr(settings, 'UPLOAD_URL_EXPIRY', 600)
+    name = None
+    if sha256 and is_blob_field(target.model, target.field_name):
+        name = blob_path(instance, filename, sha256)
+    if name is None:
+        name = target.field.generate_filename(instance, filename)
+        # MediaStorage overwrites, and a browser upload must not replace another row's file
+        if not getattr(target.field.upload_to, 'unique_names', False):
+            name = unique_name(name)
+    bucket, key = _storage_key(target.field, name)
+    token = signing.dumps({
+        'target': target_name,
+        'account': request.user.account_id,
+        'params': params,
+        'name': name,
+        'content_type': content_type,
+        'sha256': sha256,
+    }, salt=TOKEN_SALT, compress=True)
+
+    if is_blob_name(name) and blob_exists(storage, name):
+        # Same content is already stored: nothing to upload, confirm straight away
+        return {'exists': True, 'token': token, 'key': key, 'max_size': target.max_size, 'expires_in': expires_in}
+
+    fields = {'Content-Type': content_type}
+    conditions = [{'Content-Type': content_type}, ['content-length-range', 1, target.max_size]]
+    if storage.default_acl:
+        fields['acl'] = storage.default_acl
+        conditions.append({'acl': storage.default_acl})
+    cache_control = storage.object_parameters.get('CacheControl')
+    if cache_control:
+        fields['Cache-Control'] = cache_control
+        conditions.append({'Cache-Control': cache_control})
+    if sha256:
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        fields.update({'x-amz-checksum-algorithm': 'SHA256', 'x-amz-checksum-sha256': checksum})
+        conditions += [{'x-amz-checksum-algorithm': 'SHA256'}, {'x-amz-checksum-sha256': checksum}]
+
+    post = get_s3_client().generate_presigned_post(
+        Bucket=bucket, Key=key, Fields=fields, Conditions=conditions, ExpiresIn=expires_in
+    )
+    return {
+        'exists': False,
+        'url': post['url'],
+        'fields': post['fields'],
+        'token': token,
+        'key': key,
+        'max_size': target.max_size,
+        'expires_in': expires_in,
+    }
+
+
+def confirm_upload(request, token):
+    """Record an uploaded file on its row after checking it is in S3; returns (target, instance)"""
+    max_age = getattr(settings, 'UPLOAD_URL_EXPIRY', 600) + getattr(settings, 'UPLOAD_CONFIRM_GRACE', 3600)
+    try:
+        data = signing.loads(token or '', salt=TOKEN_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise UploadError('انتهت صلاحية الرفع، يرجى المحاولة مرة أخرى')
+    except signing.BadSignature:
+        raise UploadError('رمز الرفع غير صالح')
+    if data['account'] != request.user.account_id:
+        raise UploadError('رمز الرفع غير صالح', status=403)
+
+    target = _get_target(data['target'])
+    bucket, key = _storage_key(target.field, data['name'])
+    try:
+        head = get_s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise UploadError('لم يتم العثور على الملف المرفوع')
+        raise
+    if not 0 < head['ContentLength'] <= target.max_size or head.get('ContentType') != data['content_type']:
+        raise UploadError('الملف المرفوع لا يطابق الطلب')
+
+    instance = target.get_instance(request, data['params'])
+    old_file = getattr(instance, target.field.attname)
+    old_name = old_file.name if old_file else None
+    setattr(instance, target.field.attname, data['name'])
+    target.save(instance)
+    record_stored_file(
+        target.field.storage, data['name'], head['ContentLength'], head.get('ContentType'), data.get('sha256'),
+        account_id=request.user.account_id, source=file_source(target.model, target.field_name),
+    )
+    if is_blob_name(data['name']) and data['name'] != old_name:
+        retain_blob(target.field.storage, data['name'])
+    schedule_image_processing(instance, target.field_name)
+    # Same key means the new file overwrote the old one in place
+    if old_name and old_name != data['name']:
+        queue_file_deletion(old_file)
+
+    log_activity(
+        user=request.user,
+        account=request.user.account,
+        note=target.log_note(instance),
+        related_model=target.model.__name__,
+        related_id=str(instance.pk),
+        action='upload',
+    )
+    return target, instance
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import presign_upload_view, confirm_upload_view
+
+urlpatterns = [
+    path('presign/', presign_upload_view, name='presign_upload'),
+    path('confirm/', confirm_upload_view, name='confirm_upload'),
+]
@@ -0,0 +1,57 @@
+# utils/views.py
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .uploads import UploadError, presign_upload, confirm_upload
+
+# Request fields passed through to the upload target
+UPLOAD_PARAMS = (
+    'student_id', 'employee_id', 'payment_id', 'recipient_id', 'cheque_id', 'document_type', 'description'
+)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def presign_upload_view(request):
+    """
+    Step 1 of a direct upload.
+    Body: {"target": "student_document|employee_document|payment_document|cheque_image|account_logo",
+           "filename": "id.pdf", "content_type": "application/pdf", "size": 12345, "sha256": "<hex, optional>",
+           ...target fields}
+    The client POSTs `fields` and then the file (as the last field, "file") to `url`,
+    and sends `token` to the confirm endpoint. When `exists` is true (a document with
+    this sha256 is already stored) there is nothing to upload: confirm right away.
+    """
+    try:
+        size = request.data.get('size')
+        size = int(size) if size not in (None, '') else None
+    except (TypeError, ValueError):
+        return Response({'error': 'حجم الملف غير صالح'}, status=status.HTTP_400_BAD_REQUEST)
+
+    params = {name: str(request.data[name]) for name in UPLOAD_PARAMS if request.data.get(name) not in (None, '')}
+    try:
+        upload = presign_upload(
+            request,
+            request.data.get('target'),
+            request.data.get('filename'),
+            request.data.get('content_type'),
+            size,
+            params,
+            sha256=request.data.get('sha256', ''),
+        )
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    return Response(upload, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def confirm_upload_view(request):
+    """Step 2 of a direct upload: {"token": "..."} -> the updated document/cheque/account"""
+    try:
+        target, instance = confirm_upload(request, request.data.get('token'))
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    return Response(target.serialize(instance, request), status=status.HTTP_201_CREATED)